@@ -0,0 +1,350 @@
+"""
+Threshold alert rules evaluated incrementally on live telemetry.
+
+Rules live in the ``alert_rules`` table and are compiled into per-device
+rule lists whenever they change (``AlertEngine.load``); samples never cause
+database reads. Each ingest path (ESP32, RS485, Modbus) feeds its samples
+to ``observe``, which only touches the rules of that device:
+
+- Threshold rules (``gt``, ``ge``, ``lt``, ``le``, ``eq``, ``ne``) fire once
+  the condition has held for ``duration_s`` and resolve when the value
+  crosses back past ``clear_threshold`` (defaults to ``threshold``), so a
+  value hovering at the limit does not flap.
+- ``no_data`` rules fire when a device that has reported since startup stays
+  silent for ``duration_s`` (checked by ``check_silence``) and resolve on its
+  next sample.
+
+Like anomaly.py, the engine returns events and callers persist them
+(``record_alerts``) and push them to clients (``alert_message``).
+"""
+import math
+import operator
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from database import SessionLocal
+from log_setup import get_logger
+from models import Alert as AlertModel, AlertRule as AlertRuleModel
+
+_log = get_logger("alerts")
+
+SILENCE_OP = "no_data"
+THRESHOLD_OPS: Dict[str, Callable[[float, float], bool]] = {
+    "gt": operator.gt,
+    "ge": operator.ge,
+    "lt": operator.lt,
+    "le": operator.le,
+    "eq": operator.eq,
+    "ne": operator.ne,
+}
+# Condition that resolves a firing rule, tested against clear_threshold.
+CLEAR_OPS: Dict[str, Callable[[float, float], bool]] = {
+    "gt": operator.le,
+    "ge": operator.lt,
+    "lt": operator.ge,
+    "le": operator.gt,
+    "eq": operator.ne,
+    "ne": operator.eq,
+}
+RULE_OPS = tuple(THRESHOLD_OPS) + (SILENCE_OP,)
+
+
+def _number(value: Any) -> Optional[float]:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def numeric_fields(document: Any) -> Dict[str, float]:
+    """Top-level numbers of a custom_data document (``{"value": x}`` entries included)."""
+    fields: Dict[str, float] = {}
+    if isinstance(document, dict):
+        for key, value in document.items():
+            if isinstance(value, dict):
+                value = value.get("value")
+            number = _number(value)
+            if number is not None:
+                fields[key] = number
+    return fields
+
+
+def validate_rule(rule: Dict[str, Any]) -> None:
+    """Raise ValueError when a rule cannot be compiled."""
+    op = rule.get("op")
+    if op not in RULE_OPS:
+        raise ValueError(f"Unsupported op {op!r}; use one of: {', '.join(RULE_OPS)}")
+    duration_s = rule.get("duration_s") or 0
+    if duration_s < 0:
+        raise ValueError("duration_s must not be negative")
+    if op == SILENCE_OP:
+        if duration_s <= 0:
+            raise ValueError("no_data rules need a positive duration_s")
+        return
+    if not rule.get("field"):
+        raise ValueError(f"{op} rules need a field")
+    threshold = rule.get("threshold")
+    if threshold is None:
+        raise ValueError(f"{op} rules need a threshold")
+    clear_threshold = rule.get("clear_threshold")
+    if clear_threshold is None or op in ("eq", "ne"):
+        return
+    # The clear point must lie on the safe side of the threshold.
+    if op in ("gt", "ge") and clear_threshold > threshold:
+        raise ValueError("clear_threshold must not be above threshold for gt/ge rules")
+    if op in ("lt", "le") and clear_threshold < threshold:
+        raise ValueError("clear_threshold must not be below threshold for lt/le rules")
+
+
+class _CompiledRule:
+    __slots__ = ("rule_id", "name", "field", "op", "threshold", "clear_threshold", "duration_s", "severity", "fires", "clears")
+
+    def __init__(self, rule: Dict[str, Any]) -> None:
+        self.rule_id = rule["id"]
+        self.name = rule["name"]
+        self.field = rule.get("field")
+        self.op = rule["op"]
+        self.threshold = rule.get("threshold")
+        clear_threshold = rule.get("clear_threshold")
+        self.clear_threshold = self.threshold if clear_threshold is None or self.op in ("eq", "ne") else clear_threshold
+        self.duration_s = float(rule.get("duration_s") or 0.0)
+        self.severity = rule.get("severity") or "warning"
+        if self.op != SILENCE_OP:
+            test, threshold = THRESHOLD_OPS[self.op], self.threshold
+            clear, clear_threshold = CLEAR_OPS[self.op], self.clear_threshold
+            self.fires = lambda value: test(value, threshold)
+            self.clears = lambda value: clear(value, clear_threshold)
+
+
+class _RuleState:
+    __slots__ = ("pending_since", "firing")
+
+    def __init__(self, firing: bool = False) -> None:
+        self.pending_since: Optional[float] = None
+        self.firing = firing
+
+
+class AlertEngine:
+    """
+    Compiled alert rules and their per-device state. Thread-safe: the event
+    loop and poller threads feed the same instance.
+
+    ``notifier`` (set by the API process) receives every event that a poller
+    thread publishes, e.g. to push it to WebSocket clients.
+    """
+
+    def __init__(self) -> None:
+        self.notifier: Optional[Callable[[Dict], None]] = None
+        self._lock = threading.Lock()
+        # Per-device lists already include the rules that apply to every device.
+        self._threshold_rules: Dict[int, List[_CompiledRule]] = {}
+        self._global_threshold_rules: List[_CompiledRule] = []
+        self._silence_rules: Dict[int, List[_CompiledRule]] = {}
+        self._global_silence_rules: List[_CompiledRule] = []
+        self._states: Dict[Tuple[int, int], _RuleState] = {}
+        self._last_seen: Dict[int, float] = {}
+        self.rule_count = 0
+        self.samples = 0
+        self.events = 0
+
+    def load(self, rules: Iterable[Dict[str, Any]], firing: Iterable[Tuple[int, int]] = ()) -> None:
+        """
+        Replace the rule set with the enabled ``rules`` (dicts of alert_rules columns).
+
+        State of rules that still exist is kept. ``firing`` lists
+        ``(rule_id, device_id)`` pairs with an open alert, e.g. from before a
+        restart, so they resolve instead of firing a second time.
+        """
+        per_device: Dict[Optional[int], List[_CompiledRule]] = {}
+        for rule in rules:
+            if rule.get("enabled", True) and rule.get("op") in RULE_OPS:
+                per_device.setdefault(rule.get("device_id"), []).append(_CompiledRule(rule))
+        global_rules = per_device.pop(None, [])
+        threshold_rules = {
+            device_id: [rule for rule in device_rules + global_rules if rule.op != SILENCE_OP]
+            for device_id, device_rules in per_device.items()
+        }
+        silence_rules = {
+            device_id: [rule for rule in device_rules + global_rules if rule.op == SILENCE_OP]
+            for device_id, device_rules in per_device.items()
+        }
+        rule_ids = {rule.rule_id for device_rules in per_device.values() for rule in device_rules}
+        rule_ids.update(rule.rule_id for rule in global_rules)
+
+        with self._lock:
+            self._threshold_rules = threshold_rules
+            self._global_threshold_rules = [rule for rule in global_rules if rule.op != SILENCE_OP]
+            self._silence_rules = silence_rules
+            self._global_silence_rules = [rule for rule in global_rules if rule.op == SILENCE_OP]
+            self._states = {key: state for key, state in self._states.items() if key[0] in rule_ids}
+            for key in firing:
+                if key[0] in rule_ids:
+                    self._states.setdefault(key, _RuleState()).firing = True
+            self.rule_count = len(rule_ids)
+
+    def observe(self, device_id: int, sample: Dict[str, Any], now: Optional[float] = None) -> List[Dict]:
+        """Feed one telemetry sample; returns the fired/resolved events (possibly none)."""
+        now = time.time() if now is None else now
+        events: List[Dict] = []
+        with self._lock:
+            self.samples += 1
+            # Replayed (older) samples must not make a device look silent.
+            self._last_seen[device_id] = max(now, self._last_seen.get(device_id, now))
+            for rule in self._silence_rules.get(device_id, self._global_silence_rules):
+                state = self._states.get((rule.rule_id, device_id))
+                if state is not None and state.firing:
+                    state.firing = False
+                    self._emit(events, rule, device_id, "resolved", None, now)
+
+            for rule in self._threshold_rules.get(device_id, self._global_threshold_rules):
+                value = _number(sample.get(rule.field))
+                if value is None:
+                    continue
+                key = (rule.rule_id, device_id)
+                state = self._states.get(key)
+                if state is None:
+                    state = self._states[key] = _RuleState()
+                if state.firing:
+                    if rule.clears(value):
+                        state.firing = False
+                        state.pending_since = None
+                        self._emit(events, rule, device_id, "resolved", value, now)
+                elif rule.fires(value):
+                    if state.pending_since is None:
+                        state.pending_since = now
+                    if now - state.pending_since >= rule.duration_s:
+                        state.firing = True
+                        self._emit(events, rule, device_id, "firing", value, now)
+                else:
+                    state.pending_since = None
+        return events
+
+    def check_silence(self, now: Optional[float] = None) -> List[Dict]:
+        """Fire ``no_data`` rules of devices silent for longer than the rule allows."""
+        now = time.time() if now is None else now
+        events: List[Dict] = []
+        with self._lock:
+            for device_id, last_seen in self._last_seen.items():
+                for rule in self._silence_rules.get(device_id, self._global_silence_rules):
+                    if now - last_seen < rule.duration_s:
+                        continue
+                    key = (rule.rule_id, device_id)
+                    state = self._states.get(key)
+                    if state is None:
+                        state = self._states[key] = _RuleState()
+                    if not state.firing:
+                        state.firing = True
+                        self._emit(events, rule, device_id, "firing", None, now)
+        return events
+
+    def _emit(self, events: List[Dict], rule: _CompiledRule, device_id: int, state: str, value: Optional[float], now: float) -> None:
+        self.events += 1
+        events.append({
+            "rule_id": rule.rule_id,
+            "rule_name": rule.name,
+            "device_id": device_id,
+            "field": rule.field,
+            "op": rule.op,
+            "threshold": rule.threshold,
+            "severity": rule.severity,
+            "state": state,
+            "value": value,
+            "timestamp": datetime.fromtimestamp(now, tz=timezone.utc),
+        })
+
+    def forget(self, device_id: int) -> None:
+        with self._lock:
+            self._last_seen.pop(device_id, None)
+            for key in [key for key in self._states if key[1] == device_id]:
+                del self._states[key]
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "rules": self.rule_count,
+                "devices_seen": len(self._last_seen),
+                "firing": sum(1 for state in self._states.values() if state.firing),
+                "samples": self.samples,
+                "events": self.events,
+            }
+
+
+def rule_dict(rule: AlertRuleModel) -> Dict[str, Any]:
+    """Plain (picklable) form of a rule row, as taken by ``AlertEngine.load``."""
+    return {
+        "id": rule.id,
+        "name": rule.name,
+        "device_id": rule.device_id,
+        "field": rule.field,
+        "op": rule.op,
+        "threshold": rule.threshold,
+        "clear_threshold": rule.clear_threshold,
+        "duration_s": rule.duration_s,
+        "severity": rule.severity,
+        "enabled": rule.enabled,
+    }
+
+
+def load_alert_rules(db) -> Tuple[List[Dict[str, Any]], List[Tuple[int, int]]]:
+    """Enabled rules and the ``(rule_id, device_id)`` pairs of still-open alerts."""
+    rules = [rule_dict(rule) for rule in db.query(AlertRuleModel).filter(AlertRuleModel.enabled.is_(True)).all()]
+    firing = db.query(AlertModel.rule_id, AlertModel.device_id).filter(AlertModel.resolved_at.is_(None)).distinct().all()
+    return rules, [(rule_id, device_id) for rule_id, device_id in firing]
+
+
+def record_alerts(db, events: List[Dict]) -> None:
+    """Open/close alert rows in the caller's session (caller commits)."""
+    for event in events:
+        if event["state"] == "firing":
+            db.add(AlertModel(
+                rule_id=event["rule_id"],
+                device_id=event["device_id"],
+                severity=event["severity"],
+                value=event["value"],
+                fired_at=event["timestamp"],
+            ))
+        else:
+            db.query(AlertModel).filter(
+                AlertModel.rule_id == event["rule_id"],
+                AlertModel.device_id == event["device_id"],
+                AlertModel.resolved_at.is_(None),
+            ).update({"resolved_at": event["timestamp"], "resolved_value": event["value"]}, synchronize_session=False)
+
+
+def alert_message(event: Dict) -> Dict:
+    """WebSocket payload for ``/ws/device/{id}`` clients."""
+    return {
+        "type": "alert",
+        "device_id": event["device_id"],
+        "data": {**event, "timestamp": event["timestamp"].isoformat()},
+    }
+
+
+def publish_alerts(events: List[Dict]) -> None:
+    """Persist events in their own transaction and pass them to the notifier (poller threads, silence checks)."""
+    if not events:
+        return
+    db = SessionLocal()
+    try:
+        record_alerts(db, events)
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        _log.error("write_failed", "⚠️ Alert write failed", events=len(events), error=str(exc))
+    finally:
+        db.close()
+    notifier = alert_engine.notifier
+    if notifier is not None:
+        for event in events:
+            try:
+                notifier(event)
+            except Exception as exc:
+                _log.warning("notify_failed", "⚠️ Alert notification failed", error=str(exc))
+
+
+alert_engine = AlertEngine()
@@ -0,0 +1,234 @@
+"""
+Vectorized VFD analytics: energy, run hours, starts, load and faults.
+
+A device's readings in the requested range are loaded once from every tier
+(hot rows, compressed buckets, cold segments) into NumPy arrays, and all
+figures are computed with array operations. Readings are treated as
+sample-and-hold: each row's state lasts until the next row, but never longer
+than ``max_gap_s`` (longer holes count as unknown rather than as running).
+"""
+import heapq
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from cold_archive import ColdArchive
+from custom_data import custom_data_number
+from models import VFDReading as VFDReadingModel
+from vfd_archive import iter_archived_rows, to_micros
+
+STATUS_RUN = 1
+STATUS_FAULT = 2
+# Without a status register, a drive whose output frequency exceeds this is running.
+RUN_FREQUENCY_HZ = 0.5
+ENERGY_REGISTER = "Energy"
+
+# Column order of the loaded series.
+SERIES_COLUMNS = ("ts", "id", "status", "fault_code", "frequency", "power", "current", "energy")
+
+
+def _number(value: Any) -> float:
+    if value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _energy(custom_data: Any) -> float:
+    if isinstance(custom_data, dict):
+        register = custom_data.get(ENERGY_REGISTER)
+        if isinstance(register, dict):
+            return _number(register.get("value"))
+    return np.nan
+
+
+def _row_tuple(row: Dict[str, Any]) -> Tuple:
+    return (
+        to_micros(row["timestamp"]) / 1e6,
+        row["id"],
+        _number(row["status"]),
+        _number(row["fault_code"]),
+        _number(row["frequency"]),
+        _number(row["power"]),
+        _number(row["current"]),
+        _energy(row["custom_data"]),
+    )
+
+
+def _hot_tuples(db: Session, device_id: int, start: datetime, end: datetime) -> Iterator[Tuple]:
+    # Only the needed columns; the energy counter is extracted in PostgreSQL.
+    query = (
+        db.query(
+            VFDReadingModel.timestamp,
+            VFDReadingModel.id,
+            VFDReadingModel.status,
+            VFDReadingModel.fault_code,
+            VFDReadingModel.frequency,
+            VFDReadingModel.power,
+            VFDReadingModel.current,
+            custom_data_number(VFDReadingModel.custom_data, f"{ENERGY_REGISTER}.value"),
+        )
+        .filter(
+            VFDReadingModel.device_id == device_id,
+            VFDReadingModel.timestamp >= start,
+            VFDReadingModel.timestamp < end,
+        )
+        .order_by(VFDReadingModel.timestamp.asc(), VFDReadingModel.id.asc())
+    )
+    for ts, reading_id, *values in query.yield_per(5000):
+        yield (to_micros(ts) / 1e6, reading_id, *(_number(value) for value in values))
+
+
+def load_series(
+    db: Session,
+    cold_archive: ColdArchive,
+    device_id: int,
+    start: datetime,
+    end: datetime,
+) -> Dict[str, np.ndarray]:
+    """Readings of all tiers in ``[start, end)`` as one float64 array per SERIES_COLUMNS entry."""
+    merged: Iterable[Tuple] = heapq.merge(
+        (_row_tuple(row) for row in cold_archive.iter_rows(device_id, start, end)),
+        (_row_tuple(row) for row in iter_archived_rows(db, device_id, start, end)),
+        _hot_tuples(db, device_id, start, end),
+        key=lambda row: (row[0], row[1]),
+    )
+    table = np.array(list(merged), dtype=np.float64).reshape(-1, len(SERIES_COLUMNS))
+    if len(table) > 1:
+        # Rows caught in two tiers while being moved.
+        keep = np.concatenate(([True], table[1:, 1] != table[:-1, 1]))
+        table = table[keep]
+    return {name: table[:, index] for index, name in enumerate(SERIES_COLUMNS)}
+
+
+def _bucket_sums(index: np.ndarray, values: np.ndarray, count: int) -> np.ndarray:
+    return np.bincount(index, weights=values, minlength=count)[:count]
+
+
+def energy_deltas(energy: np.ndarray) -> np.ndarray:
+    """
+    kWh consumed between consecutive readings of a cumulative counter.
+
+    A decrease means the counter was reset or rolled over; the reading after
+    it is then the energy counted since the reset. Missing readings are
+    bridged from the last known value.
+    """
+    known = ~np.isnan(energy)
+    deltas = np.zeros(len(energy))
+    if known.sum() < 2:
+        return deltas
+    positions = np.flatnonzero(known)
+    values = energy[positions]
+    steps = np.diff(values)
+    steps = np.where(steps < 0, values[1:], steps)
+    deltas[positions[1:]] = steps
+    return deltas
+
+
+def compute_analytics(
+    series: Dict[str, np.ndarray],
+    start: datetime,
+    end: datetime,
+    bucket_seconds: int,
+    max_gap_s: float,
+) -> Dict[str, Any]:
+    ts = series["ts"]
+    start_s = to_micros(start) / 1e6
+    end_s = to_micros(end) / 1e6
+    # Buckets are aligned to multiples of bucket_seconds since the epoch.
+    first_bucket = np.floor(start_s / bucket_seconds) * bucket_seconds
+    bucket_count = int(np.ceil((end_s - first_bucket) / bucket_seconds))
+    bucket_index = ((ts - first_bucket) // bucket_seconds).astype(np.int64)
+
+    status = series["status"]
+    frequency = series["frequency"]
+    has_status = ~np.isnan(status)
+    running = np.where(has_status, status == STATUS_RUN, np.nan_to_num(frequency) > RUN_FREQUENCY_HZ)
+    faulted = (status == STATUS_FAULT) | (np.nan_to_num(series["fault_code"]) > 0)
+
+    # Interval i lasts from row i to row i + 1 (or to ``end``), capped at max_gap_s.
+    durations = np.minimum(np.diff(ts, append=end_s), max_gap_s)
+    run_seconds = durations * running
+
+    was_running = np.zeros_like(running)
+    was_running[1:] = running[:-1]
+    starts = running & ~was_running
+    starts[:1] = False  # Already running when the range begins: not a start we observed.
+    was_faulted = np.zeros_like(faulted)
+    was_faulted[1:] = faulted[:-1]
+    fault_events = faulted & ~was_faulted
+
+    energy = series["energy"]
+    if (~np.isnan(energy)).sum() >= 2:
+        energy_source = "counter"
+        kwh = energy_deltas(energy)
+    else:
+        energy_source = "power_integral"
+        kwh = np.nan_to_num(series["power"]) * durations / 3600.0
+
+    power = series["power"]
+    current = series["current"]
+    power_weight = run_seconds * ~np.isnan(power)
+    current_weight = run_seconds * ~np.isnan(current)
+
+    sums = {
+        "samples": np.bincount(bucket_index, minlength=bucket_count)[:bucket_count],
+        "kwh": _bucket_sums(bucket_index, kwh, bucket_count),
+        "run_seconds": _bucket_sums(bucket_index, run_seconds, bucket_count),
+        "starts": _bucket_sums(bucket_index, starts.astype(np.float64), bucket_count),
+        "faults": _bucket_sums(bucket_index, fault_events.astype(np.float64), bucket_count),
+        "power_weighted": _bucket_sums(bucket_index, np.nan_to_num(power) * power_weight, bucket_count),
+        "power_weight": _bucket_sums(bucket_index, power_weight, bucket_count),
+        "current_weighted": _bucket_sums(bucket_index, np.nan_to_num(current) * current_weight, bucket_count),
+        "current_weight": _bucket_sums(bucket_index, current_weight, bucket_count),
+    }
+
+    def summary(select) -> Dict[str, Any]:
+        power_weight_total = float(sums["power_weight"][select].sum())
+        current_weight_total = float(sums["current_weight"][select].sum())
+        return {
+            "samples": int(sums["samples"][select].sum()),
+            "kwh": round(float(sums["kwh"][select].sum()), 3),
+            "run_hours": round(float(sums["run_seconds"][select].sum()) / 3600.0, 3),
+            "starts": int(sums["starts"][select].sum()),
+            "faults": int(sums["faults"][select].sum()),
+            "mean_power_kw": round(float(sums["power_weighted"][select].sum()) / power_weight_total, 3)
+            if power_weight_total else None,
+            "mean_current_a": round(float(sums["current_weighted"][select].sum()) / current_weight_total, 3)
+            if current_weight_total else None,
+        }
+
+    buckets = []
+    for index in range(bucket_count):
+        bucket = summary(slice(index, index + 1))
+        bucket["start"] = datetime.fromtimestamp(first_bucket + index * bucket_seconds, tz=timezone.utc)
+        buckets.append(bucket)
+
+    totals = summary(slice(None))
+    days = (end_s - start_s) / 86400.0
+    totals["starts_per_day"] = round(totals["starts"] / days, 3) if days > 0 else None
+    return {
+        "start": start,
+        "end": end,
+        "bucket_seconds": bucket_seconds,
+        "energy_source": energy_source,
+        "totals": totals,
+        "buckets": buckets,
+    }
+
+
+def device_analytics(
+    db: Session,
+    cold_archive: ColdArchive,
+    device_id: int,
+    start: datetime,
+    end: datetime,
+    bucket_seconds: int,
+    max_gap_s: float,
+) -> Dict[str, Any]:
+    series = load_series(db, cold_archive, device_id, start, end)
+    return compute_analytics(series, start, end, bucket_seconds, max_gap_s)
@@ -0,0 +1,260 @@
+"""
+Streaming anomaly detection on VFD telemetry, run inside the ingest paths.
+
+Per device and field (current, frequency, power) two online detectors keep
+O(1) state:
+
+- EWMA z-score: an exponentially weighted mean as baseline and an EWMA of
+  squared sample-to-sample steps as noise (Var(Δx) = 2σ² for white noise).
+  Unlike the spread around the mean, the step noise does not grow while a
+  value drifts, so a motor drifting away from its operating point is
+  flagged once it lags the slow baseline (``alpha``) by ``z_threshold``
+  noise deviations. Stopped and running drives have separate baselines, so
+  starts and stops are not anomalies.
+- Rate of change: ``|Δvalue / Δt|`` above the field's ``max_rate``, checked
+  only between samples in the same run state.
+
+Events are throttled per device/field/kind by ``cooldown_s``. Detection
+itself never touches the database; callers persist events (``record_anomalies``)
+and push them to clients (``anomaly_message``).
+"""
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from database import SessionLocal
+from log_setup import get_logger
+from models import AnomalyEvent as AnomalyEventModel
+
+_log = get_logger("anomaly")
+
+DETECTED_FIELDS = ("current", "frequency", "power")
+# ``min_std`` floors the deviation of very steady signals; ``max_rate`` is per second.
+DEFAULT_FIELD_RULES: Dict[str, Dict[str, float]] = {
+    "current": {"min_std": 0.05, "max_rate": 5.0},
+    "frequency": {"min_std": 0.1, "max_rate": 10.0},
+    "power": {"min_std": 0.05, "max_rate": 5.0},
+}
+STATUS_RUN = 1
+RUN_FREQUENCY_HZ = 0.5
+# Samples further apart than this are not compared for rate of change.
+RATE_MAX_GAP_S = 30.0
+
+
+def _number(value: Any) -> Optional[float]:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+class _Baseline:
+    __slots__ = ("mean", "count", "step_var", "steps")
+
+    def __init__(self) -> None:
+        self.mean = 0.0
+        self.count = 0
+        self.step_var = 0.0
+        self.steps = 0
+
+    def std(self, alpha: float) -> float:
+        """Noise standard deviation; the bias of the zero-initialized EWMA is corrected."""
+        if not self.steps:
+            return 0.0
+        return math.sqrt(self.step_var / (1.0 - (1.0 - alpha) ** self.steps) / 2.0)
+
+    def update(self, value: float, alpha: float, step: Optional[float]) -> None:
+        self.mean = value if self.count == 0 else self.mean + alpha * (value - self.mean)
+        self.count += 1
+        if step is not None:
+            self.step_var += alpha * (step * step - self.step_var)
+            self.steps += 1
+
+
+class _FieldState:
+    __slots__ = ("baselines", "last_value", "last_ts", "last_running")
+
+    def __init__(self) -> None:
+        self.baselines = {True: _Baseline(), False: _Baseline()}
+        self.last_value: Optional[float] = None
+        self.last_ts = 0.0
+        self.last_running: Optional[bool] = None
+
+
+class AnomalyMonitor:
+    """
+    Online detectors for all devices. Thread-safe: the event loop and poller
+    threads feed the same instance.
+
+    ``notifier`` (set by the API process) receives every event that a poller
+    thread publishes, e.g. to push it to WebSocket clients.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        alpha: float = 0.01,
+        z_threshold: float = 4.0,
+        warmup: int = 30,
+        cooldown_s: float = 60.0,
+        rules: Optional[Dict[str, Dict[str, float]]] = None,
+    ) -> None:
+        self.enabled = enabled
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.cooldown_s = cooldown_s
+        self.rules = rules or DEFAULT_FIELD_RULES
+        self.notifier: Optional[Callable[[Dict], None]] = None
+        self._lock = threading.Lock()
+        self._states: Dict[Tuple[int, str], _FieldState] = {}
+        self._cooldowns: Dict[Tuple[int, str, str], float] = {}
+        self.samples = 0
+        self.events = 0
+
+    def observe(self, device_id: int, sample: Dict[str, Any], now: Optional[float] = None) -> List[Dict]:
+        """Feed one telemetry sample; returns the anomaly events it triggers (possibly none)."""
+        if not self.enabled:
+            return []
+        now = time.time() if now is None else now
+        status = _number(sample.get("status"))
+        frequency = _number(sample.get("frequency"))
+        running = status == STATUS_RUN if status is not None else (frequency or 0.0) > RUN_FREQUENCY_HZ
+        events: List[Dict] = []
+        with self._lock:
+            self.samples += 1
+            for field in DETECTED_FIELDS:
+                value = _number(sample.get(field))
+                if value is None:
+                    continue
+                rule = self.rules.get(field, {})
+                state = self._states.get((device_id, field))
+                if state is None:
+                    state = self._states[(device_id, field)] = _FieldState()
+                baseline = state.baselines[running]
+
+                if baseline.count >= self.warmup:
+                    std = max(baseline.std(self.alpha), rule.get("min_std", 0.0))
+                    score = abs(value - baseline.mean) / std if std > 0 else 0.0
+                    if score > self.z_threshold:
+                        self._emit(events, device_id, field, "zscore", value, baseline.mean, score, self.z_threshold, now)
+
+                contiguous = (
+                    state.last_value is not None
+                    and state.last_running == running
+                    and 0.0 < now - state.last_ts <= RATE_MAX_GAP_S
+                )
+                max_rate = rule.get("max_rate")
+                if contiguous and max_rate:
+                    rate = abs(value - state.last_value) / (now - state.last_ts)
+                    if rate > max_rate:
+                        self._emit(events, device_id, field, "rate", value, state.last_value, rate, max_rate, now)
+
+                baseline.update(value, self.alpha, value - state.last_value if contiguous else None)
+                state.last_value = value
+                state.last_ts = now
+                state.last_running = running
+        return events
+
+    def _emit(
+        self,
+        events: List[Dict],
+        device_id: int,
+        field: str,
+        kind: str,
+        value: float,
+        expected: float,
+        score: float,
+        threshold: float,
+        now: float,
+    ) -> None:
+        key = (device_id, field, kind)
+        if now < self._cooldowns.get(key, 0.0):
+            return
+        self._cooldowns[key] = now + self.cooldown_s
+        self.events += 1
+        events.append({
+            "device_id": device_id,
+            "field": field,
+            "kind": kind,
+            "value": value,
+            "expected": round(expected, 4),
+            "score": round(score, 3),
+            "threshold": threshold,
+            "timestamp": datetime.fromtimestamp(now, tz=timezone.utc),
+        })
+
+    def forget(self, device_id: int) -> None:
+        with self._lock:
+            for key in [key for key in self._states if key[0] == device_id]:
+                del self._states[key]
+            for key in [key for key in self._cooldowns if key[0] == device_id]:
+                del self._cooldowns[key]
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "alpha": self.alpha,
+                "z_threshold": self.z_threshold,
+                "warmup": self.warmup,
+                "cooldown_s": self.cooldown_s,
+                "tracked_series": len(self._states),
+                "samples": self.samples,
+                "events": self.events,
+            }
+
+
+def record_anomalies(db, events: List[Dict]) -> None:
+    """Add event rows to the caller's session (caller commits)."""
+    for event in events:
+        db.add(AnomalyEventModel(**event))
+
+
+def anomaly_message(event: Dict) -> Dict:
+    """WebSocket payload for ``/ws/device/{id}`` clients."""
+    return {
+        "type": "anomaly",
+        "device_id": event["device_id"],
+        "data": {**event, "timestamp": event["timestamp"].isoformat()},
+    }
+
+
+def publish_anomalies(events: List[Dict]) -> None:
+    """Persist events in their own transaction and pass them to the notifier (poller threads)."""
+    if not events:
+        return
+    db = SessionLocal()
+    try:
+        record_anomalies(db, events)
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        _log.error("write_failed", "⚠️ Anomaly event write failed", events=len(events), error=str(exc))
+    finally:
+        db.close()
+    notifier = anomaly_monitor.notifier
+    if notifier is not None:
+        for event in events:
+            try:
+                notifier(event)
+            except Exception as exc:
+                _log.warning("notify_failed", "⚠️ Anomaly notification failed", error=str(exc))
+
+
+# Read here rather than in main.py so the poller child process is configured the same way.
+ANOMALY_DETECTION_ENABLED = os.getenv("ANOMALY_DETECTION", "1").lower() in {"1", "true", "yes", "on"}
+
+anomaly_monitor = AnomalyMonitor(
+    enabled=ANOMALY_DETECTION_ENABLED,
+    alpha=float(os.getenv("ANOMALY_ALPHA", "0.01")),
+    z_threshold=float(os.getenv("ANOMALY_Z_THRESHOLD", "4.0")),
+    warmup=int(os.getenv("ANOMALY_WARMUP_SAMPLES", "30")),
+    cooldown_s=float(os.getenv("ANOMALY_COOLDOWN_SECONDS", "60")),
+)
@@ -0,0 +1,434 @@
+"""
+Simulated ESP32 fleet load generator for /ws/esp32/connect.
+
+Opens N concurrent WebSocket sessions that speak the same protocol as
+ESP32/master/src/main.cpp (registration handshake, ``heartbeat`` and
+``sensor_data`` frames), measures ack latency percentiles and throughput,
+optionally samples server CPU from /proc, and writes a JSON report that can
+be compared against a previous run.
+
+Usage (from backend/):
+    python -m benchmarks.esp32_load --sessions 50 --sensor-hz 2 --duration 60 \
+        --username user --password user123 \
+        --server-pid $(pgrep -f "uvicorn main:app") --report run.json
+    python -m benchmarks.esp32_load ... --compare baseline.json
+
+Every session is its own device. The server keeps one device per unique
+ip_address and syncs it to the client address on connect, so each session
+connects from its own source address (``--source-network``, by default
+127.64.0.0/16, all of which is loopback on Linux). The devices are created
+up front through ``POST /devices/`` with those addresses (existing ones are
+reused on later runs), and sessions authenticate with their
+device_id/device_key.
+
+Sessions follow the server's ``config`` downlink like the firmware does: once
+one arrives, they sample every ``report_interval_ms`` and send batched
+``sensor_data`` frames of ``batch_size`` samples instead of ``--sensor-hz``
+single frames (``--ignore-config`` keeps the fixed rate).
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import os
+import random
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from typing import Deque, Dict, List, Optional
+from urllib.parse import urlencode, urlsplit
+
+import websockets
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(latencies_ms: List[float]) -> Dict[str, Optional[float]]:
+    values = [round(value, 3) for value in sorted(latencies_ms)]
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 3) if values else None,
+        "p50_ms": percentile(values, 0.50),
+        "p90_ms": percentile(values, 0.90),
+        "p95_ms": percentile(values, 0.95),
+        "p99_ms": percentile(values, 0.99),
+        "max_ms": values[-1] if values else None,
+    }
+
+
+class ProcCpuSampler:
+    """Samples utime+stime of a process from /proc/<pid>/stat (Linux only)."""
+
+    def __init__(self, pid: Optional[int]) -> None:
+        self.pid = pid
+        self.ticks_per_second = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self._start_ticks: Optional[int] = None
+        self._start_time = 0.0
+
+    def _read_ticks(self) -> Optional[int]:
+        if self.pid is None:
+            return None
+        try:
+            with open(f"/proc/{self.pid}/stat", "r", encoding="utf-8") as handle:
+                fields = handle.read().rsplit(")", 1)[1].split()
+            # Fields after the command name start at index 3 (state), so utime/stime are 11/12.
+            return int(fields[11]) + int(fields[12])
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def start(self) -> None:
+        self._start_ticks = self._read_ticks()
+        self._start_time = time.monotonic()
+
+    def stop(self) -> Optional[Dict[str, float]]:
+        end_ticks = self._read_ticks()
+        if self._start_ticks is None or end_ticks is None:
+            return None
+        elapsed = time.monotonic() - self._start_time
+        cpu_seconds = (end_ticks - self._start_ticks) / self.ticks_per_second
+        return {
+            "cpu_seconds": round(cpu_seconds, 3),
+            "cpu_percent": round(100.0 * cpu_seconds / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.connect_ms: List[float] = []
+        self.ack_ms: Dict[str, List[float]] = {"heartbeat": [], "sensor_data": []}
+        self.sent: Dict[str, int] = {"heartbeat": 0, "sensor_data": 0}
+        self.errors: Dict[str, int] = {}
+        self.samples_sent = 0
+        self.config_messages = 0
+        self.max_level = 0
+        self.failed_sessions = 0
+        self.device_ids: set = set()
+
+    def error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+def fake_mac(index: int) -> str:
+    return "02:B3:" + ":".join(f"{(index >> shift) & 0xFF:02X}" for shift in (24, 16, 8, 0))
+
+
+def api_base(ws_url: str) -> str:
+    parts = urlsplit(ws_url)
+    scheme = "https" if parts.scheme == "wss" else "http"
+    return f"{scheme}://{parts.netloc}"
+
+
+def api_request(base: str, method: str, path: str, body: Optional[Dict] = None, token: Optional[str] = None):
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(base + path, data=data, headers=headers, method=method)
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def source_addresses(args: argparse.Namespace) -> List[str]:
+    hosts = ipaddress.ip_network(args.source_network).hosts()
+    addresses = []
+    for address in hosts:
+        if len(addresses) == args.sessions:
+            break
+        addresses.append(str(address))
+    if len(addresses) < args.sessions:
+        raise SystemExit(f"--source-network {args.source_network} has fewer than {args.sessions} addresses")
+    return addresses
+
+
+def provision_devices(args: argparse.Namespace, addresses: List[str]) -> List[Dict]:
+    """One ESP32_Master device per source address: existing rows are reused, missing ones created."""
+    base = api_base(args.url)
+    token = api_request(base, "POST", "/auth/login", {"username": args.username, "password": args.password})["access_token"]
+    existing = {
+        device["ip_address"]: device
+        for device in api_request(base, "GET", "/devices/?limit=1000000", token=token)
+        if device.get("device_key")
+    }
+    devices = []
+    for index, address in enumerate(addresses):
+        device = existing.get(address)
+        if device is None:
+            device = api_request(base, "POST", "/devices/", {
+                "device_name": f"loadgen-{index:05d}",
+                "ip_address": address,
+                "type": "ESP32_Master",
+            }, token=token)
+        devices.append({"device_id": device["id"], "device_key": device["device_key"], "source": address})
+    return devices
+
+
+def vfd_sample(rng: random.Random, running: bool) -> Dict:
+    if not running:
+        return {
+            "frequency": 0.0, "speed": 0.0, "current": 0.0, "voltage": round(rng.uniform(395, 405), 1),
+            "power": 0.0, "torque": 0.0, "status": 0, "faultCode": 0,
+        }
+    frequency = round(rng.uniform(45.0, 50.0), 1)
+    return {
+        "frequency": frequency,
+        "speed": round(frequency * 29.7, 1),
+        "current": round(rng.uniform(5.5, 7.0), 1),
+        "voltage": round(rng.uniform(395, 405), 1),
+        "power": round(rng.uniform(3.0, 3.8), 1),
+        "torque": round(rng.uniform(20.0, 24.0), 1),
+        "status": 1,
+        "faultCode": 0,
+    }
+
+
+async def run_session(index: int, args: argparse.Namespace, stats: Stats, deadline: float, device: Dict) -> None:
+    rng = random.Random(args.seed + index)
+    query = {"mac_address": fake_mac(index), "device_id": device["device_id"], "device_key": device["device_key"]}
+    url = f"{args.url}?{urlencode(query)}"
+
+    connect_start = time.perf_counter()
+    try:
+        ws = await websockets.connect(
+            url, open_timeout=args.timeout, max_queue=None, local_addr=(device["source"], 0)
+        )
+    except Exception:
+        stats.failed_sessions += 1
+        stats.error("connect")
+        return
+
+    try:
+        registration = json.loads(await asyncio.wait_for(ws.recv(), timeout=args.timeout))
+        if registration.get("type") != "registration" or registration.get("status") != "success":
+            stats.failed_sessions += 1
+            stats.error("registration")
+            return
+        stats.connect_ms.append((time.perf_counter() - connect_start) * 1000.0)
+        device_id = registration["device_id"]
+        device_key = registration["device_key"]
+        stats.device_ids.add(device_id)
+
+        # The server answers frames strictly in order on a session, so acks are
+        # matched to sends FIFO.
+        in_flight: Deque = deque()
+        boot = time.monotonic()
+        # Latest config downlink; empty until the server sends one (flow control disabled).
+        config: Dict = {}
+        pending_samples: List[Dict] = []
+        seq = 0
+
+        async def receiver() -> None:
+            async for raw in ws:
+                try:
+                    reply = json.loads(raw)
+                except ValueError:
+                    stats.error("bad_ack")
+                    continue
+                if reply.get("type") == "config":
+                    # Downlinks are not acks; keep them out of the FIFO matching.
+                    stats.config_messages += 1
+                    stats.max_level = max(stats.max_level, reply.get("level") or 0)
+                    if not args.ignore_config:
+                        config.update(reply)
+                    continue
+                if not in_flight:
+                    stats.error("unexpected_ack")
+                    continue
+                kind, sent_at = in_flight.popleft()
+                if reply.get("status") == "ok":
+                    stats.ack_ms[kind].append((time.perf_counter() - sent_at) * 1000.0)
+                else:
+                    stats.error(f"{kind}_nack")
+
+        def sample_period() -> Optional[float]:
+            if sensor_period is None:
+                return None
+            if config.get("report_interval_ms"):
+                return config["report_interval_ms"] / 1000.0
+            return sensor_period
+
+        async def send(kind: str, payload: Dict) -> None:
+            in_flight.append((kind, time.perf_counter()))
+            stats.sent[kind] += 1
+            await ws.send(json.dumps(payload))
+
+        def envelope(kind: str) -> Dict:
+            uptime = int((time.monotonic() - boot) * 1000)
+            return {
+                "type": kind,
+                "device_id": device_id,
+                "device_key": device_key,
+                "timestamp": str(uptime),
+                "rssi": rng.randint(-85, -45),
+                "uptime": uptime,
+            }
+
+        receive_task = asyncio.create_task(receiver())
+        sensor_period = 1.0 / args.sensor_hz if args.sensor_hz > 0 else None
+        next_sensor = time.monotonic() + rng.uniform(0, sensor_period or 0)
+        next_heartbeat = time.monotonic() + rng.uniform(0, args.heartbeat_interval)
+        running = rng.random() >= args.idle_fraction
+
+        while time.monotonic() < deadline and not receive_task.done():
+            now = time.monotonic()
+            if now >= next_heartbeat:
+                await send("heartbeat", envelope("heartbeat"))
+                next_heartbeat += args.heartbeat_interval
+            if sensor_period is not None and now >= next_sensor:
+                stats.samples_sent += 1
+                if config:
+                    seq += 1
+                    pending_samples.append({"seq": seq, "ts": round(time.time(), 3), "data": vfd_sample(rng, running)})
+                    if len(pending_samples) >= config.get("batch_size", 1):
+                        frame = envelope("sensor_data")
+                        frame["samples"] = pending_samples
+                        # Devices are reused across runs; restart their server-side seq cursor.
+                        if seq == len(pending_samples):
+                            frame["reset"] = True
+                        pending_samples = []
+                        await send("sensor_data", frame)
+                else:
+                    frame = envelope("sensor_data")
+                    frame["data"] = vfd_sample(rng, running)
+                    await send("sensor_data", frame)
+                next_sensor += sample_period()
+            wake_at = min(next_heartbeat, next_sensor if sensor_period is not None else next_heartbeat)
+            await asyncio.sleep(max(0.0, min(wake_at, deadline) - time.monotonic()))
+
+        # Give outstanding acks a moment to arrive before closing.
+        drain_until = time.monotonic() + args.timeout
+        while in_flight and time.monotonic() < drain_until and not receive_task.done():
+            await asyncio.sleep(0.01)
+        for _ in range(len(in_flight)):
+            stats.error("ack_timeout")
+        receive_task.cancel()
+    except Exception:
+        stats.error("session")
+    finally:
+        await ws.close()
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    devices = await asyncio.to_thread(provision_devices, args, source_addresses(args))
+    stats = Stats()
+    sampler = ProcCpuSampler(args.server_pid)
+    sampler.start()
+    started = time.monotonic()
+    deadline = started + args.ramp + args.duration
+
+    async def staggered(index: int) -> None:
+        if args.ramp > 0:
+            await asyncio.sleep(args.ramp * index / max(1, args.sessions))
+        await run_session(index, args, stats, deadline, devices[index])
+
+    await asyncio.gather(*(staggered(i) for i in range(args.sessions)))
+    wall_seconds = time.monotonic() - started
+    cpu = sampler.stop()
+
+    active_seconds = args.ramp + args.duration
+    acked = {kind: len(values) for kind, values in stats.ack_ms.items()}
+    return {
+        "config": {
+            "url": args.url,
+            "sessions": args.sessions,
+            "sensor_hz": args.sensor_hz,
+            "heartbeat_interval": args.heartbeat_interval,
+            "duration": args.duration,
+            "ramp": args.ramp,
+            "idle_fraction": args.idle_fraction,
+            "source_network": args.source_network,
+            "ignore_config": args.ignore_config,
+        },
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "wall_seconds": round(wall_seconds, 3),
+        "sessions_ok": args.sessions - stats.failed_sessions,
+        "distinct_devices": len(stats.device_ids),
+        "sent": stats.sent,
+        "samples_sent": stats.samples_sent,
+        "config_messages": stats.config_messages,
+        "max_flow_level": stats.max_level,
+        "acked": acked,
+        "errors": stats.errors,
+        "throughput_acks_per_s": round(sum(acked.values()) / active_seconds, 2) if active_seconds else None,
+        "connect_latency": summarize(stats.connect_ms),
+        "ack_latency": {kind: summarize(values) for kind, values in stats.ack_ms.items()},
+        "server_cpu": cpu,
+    }
+
+
+def print_report(report: Dict, baseline: Optional[Dict]) -> None:
+    def delta(path: List[str]) -> str:
+        if baseline is None:
+            return ""
+        old, new = baseline, report
+        for key in path:
+            old = old.get(key) if isinstance(old, dict) else None
+            new = new.get(key) if isinstance(new, dict) else None
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)) or old == 0:
+            return ""
+        return f"  ({(new - old) / old * 100.0:+.1f}% vs baseline)"
+
+    print(f"Sessions: {report['sessions_ok']}/{report['config']['sessions']} ok, "
+          f"{report['distinct_devices']} distinct device id(s)")
+    print(f"Throughput: {report['throughput_acks_per_s']} acks/s"
+          f"{delta(['throughput_acks_per_s'])}")
+    for kind, summary in report["ack_latency"].items():
+        print(f"{kind:12s} n={summary['count']:<7d} "
+              f"p50={summary['p50_ms']} p95={summary['p95_ms']} p99={summary['p99_ms']} max={summary['max_ms']} ms"
+              f"{delta(['ack_latency', kind, 'p95_ms'])}")
+    if report["config_messages"]:
+        print(f"Config downlinks: {report['config_messages']} (max flow level {report['max_flow_level']}), "
+              f"{report['samples_sent']} samples sent")
+    if report["server_cpu"]:
+        print(f"Server CPU: {report['server_cpu']['cpu_percent']}%"
+              f"{delta(['server_cpu', 'cpu_percent'])}")
+    if report["errors"]:
+        print(f"Errors: {report['errors']}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Simulated ESP32 fleet load generator")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/ws/esp32/connect")
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent simulated devices")
+    parser.add_argument("--sensor-hz", type=float, default=1.0, help="sensor_data frames per second per session")
+    parser.add_argument("--heartbeat-interval", type=float, default=30.0, help="Seconds between heartbeats")
+    parser.add_argument("--duration", type=float, default=30.0, help="Steady-state seconds after ramp-up")
+    parser.add_argument("--ramp", type=float, default=5.0, help="Seconds over which sessions are opened")
+    parser.add_argument("--idle-fraction", type=float, default=0.0,
+                        help="Fraction of sessions that report a stopped drive (all zeros)")
+    parser.add_argument("--username", default="user", help="Account used to create the simulated devices")
+    parser.add_argument("--password", default="user123")
+    parser.add_argument("--source-network", default="127.64.0.0/16",
+                        help="Network whose addresses the sessions connect from, one per device "
+                             "(loopback by default; for a remote server, addresses assigned to this host)")
+    parser.add_argument("--ignore-config", action="store_true",
+                        help="Keep --sensor-hz single frames instead of following the config downlink")
+    parser.add_argument("--timeout", type=float, default=5.0, help="Connect/registration/drain timeout")
+    parser.add_argument("--server-pid", type=int, default=None, help="Server PID for CPU sampling (Linux)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--report", default=None, help="Write JSON report to this path")
+    parser.add_argument("--compare", default=None, help="Baseline JSON report to diff against")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as handle:
+            baseline = json.load(handle)
+    print_report(report, baseline)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
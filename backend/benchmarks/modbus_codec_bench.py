@@ -0,0 +1,118 @@
+"""
+Micro-benchmarks for the Modbus RTU codec.
+
+Compares modbus_codec against the original bit-loop implementations that
+modbus_polling.py used before the codec existed (kept here verbatim as the
+baseline). Every case is checked for identical results before it is timed.
+
+Usage (from backend/):
+    python -m benchmarks.modbus_codec_bench [--repeat 5] [--number 20000]
+"""
+import argparse
+import struct
+import timeit
+from typing import Callable, List, Optional, Tuple
+
+from modbus_codec import crc16, decode_read_response, decode_registers, read_request
+
+
+# ---- Baseline: original modbus_polling.py helpers -------------------------
+
+def legacy_calculate_crc(data: bytes) -> int:
+    crc = 0xFFFF
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+    return crc
+
+
+def legacy_build_read_request(slave_id: int, address: int, quantity: int = 1) -> bytes:
+    payload = bytearray(6)
+    payload[0] = slave_id
+    payload[1] = 0x03
+    payload[2] = (address >> 8) & 0xFF
+    payload[3] = address & 0xFF
+    payload[4] = (quantity >> 8) & 0xFF
+    payload[5] = quantity & 0xFF
+    crc = legacy_calculate_crc(payload)
+    payload.extend([crc & 0xFF, (crc >> 8) & 0xFF])
+    return bytes(payload)
+
+
+def legacy_parse_registers(response: bytes, slave_id: int) -> Optional[List[int]]:
+    """Original single-register parser, generalized with a Python loop over the payload."""
+    if len(response) < 5 or response[0] != slave_id or response[1] != 0x03:
+        return None
+    byte_count = response[2]
+    expected_len = 3 + byte_count + 2
+    if len(response) < expected_len:
+        return None
+    received_crc = response[expected_len - 2] | (response[expected_len - 1] << 8)
+    if received_crc != legacy_calculate_crc(response[: expected_len - 2]):
+        return None
+    return [(response[i] << 8) + response[i + 1] for i in range(3, 3 + byte_count, 2)]
+
+
+def legacy_decode_u32_word_swapped(payload: bytes) -> List[int]:
+    values = []
+    for i in range(0, len(payload), 4):
+        low = (payload[i] << 8) + payload[i + 1]
+        high = (payload[i + 2] << 8) + payload[i + 3]
+        values.append((high << 16) | low)
+    return values
+
+
+# ---- Fixtures --------------------------------------------------------------
+
+def make_response(slave_id: int, values: List[int]) -> bytes:
+    body = bytes((slave_id, 0x03, len(values) * 2)) + struct.pack(f">{len(values)}H", *values)
+    crc = crc16(body)
+    return body + bytes((crc & 0xFF, crc >> 8))
+
+
+def cases() -> List[Tuple[str, Callable, Callable]]:
+    request = bytes((1, 0x03, 0x30, 0x00, 0x00, 0x04))
+    response_1 = make_response(1, [500])
+    response_5 = make_response(1, [1000, 1001, 1002, 1003, 1004])
+    response_125 = make_response(1, list(range(125)))
+    payload_u32 = struct.pack(">64H", *range(64))
+    return [
+        ("crc16 8-byte request", lambda: legacy_calculate_crc(request), lambda: crc16(request)),
+        ("crc16 255-byte frame", lambda: legacy_calculate_crc(response_125), lambda: crc16(response_125)),
+        ("build read request", lambda: legacy_build_read_request(1, 12288, 4), lambda: read_request(1, 12288, 4)),
+        ("parse 1-register response", lambda: legacy_parse_registers(response_1, 1),
+         lambda: list(decode_read_response(response_1, 1, 1))),
+        ("parse 5-register response", lambda: legacy_parse_registers(response_5, 1),
+         lambda: list(decode_read_response(response_5, 1, 5))),
+        ("parse 125-register response", lambda: legacy_parse_registers(response_125, 1),
+         lambda: list(decode_read_response(response_125, 1, 125))),
+        ("decode 32x u32 word-swapped", lambda: legacy_decode_u32_word_swapped(payload_u32),
+         lambda: list(decode_registers(payload_u32, "u32_ws"))),
+    ]
+
+
+def best_ns_per_call(func: Callable, number: int, repeat: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e9
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Modbus codec micro-benchmarks")
+    parser.add_argument("--number", type=int, default=20000, help="Calls per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs per case (best is kept)")
+    args = parser.parse_args(argv)
+
+    print(f"{'case':32s} {'legacy ns':>12s} {'codec ns':>12s} {'speedup':>9s}")
+    for name, legacy, codec in cases():
+        if legacy() != codec():
+            raise SystemExit(f"Mismatch in '{name}': {legacy()!r} != {codec()!r}")
+        legacy_ns = best_ns_per_call(legacy, args.number, args.repeat)
+        codec_ns = best_ns_per_call(codec, args.number, args.repeat)
+        print(f"{name:32s} {legacy_ns:12.0f} {codec_ns:12.0f} {legacy_ns / codec_ns:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Bulk ingestion of readings over HTTP with PostgreSQL ``COPY``.
+
+Gateways and backfills upload many rows for one device in a single request,
+either as NDJSON (one JSON object per line) or as columnar JSON
+(``{"timestamp": [...], "frequency": [...], ...}``). Rows are validated and
+converted to CSV while the body is still arriving, and a worker thread feeds
+that CSV to ``COPY ... FROM STDIN`` through a bounded pipe, so the body is
+never held in memory and there is no per-row INSERT.
+
+Bulk rows bypass the live-ingest side effects (storage deadband, anomaly
+detection, alert rules, metric_samples): they are historical data.
+"""
+import asyncio
+import csv
+import io
+import json
+import math
+import queue
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from database import engine
+
+# CSV buffered before it is handed to the COPY thread.
+CHUNK_BYTES = 256 * 1024
+# Chunks in flight between the request and the COPY thread.
+PIPE_CHUNKS = 16
+# Row errors reported back (and, with skip_invalid, the most rows skipped).
+MAX_REPORTED_ERRORS = 100
+
+_decoder = json.JSONDecoder()
+
+
+class BulkTable:
+    """Target table of a bulk upload: columns besides device_id and timestamp."""
+
+    def __init__(
+        self,
+        name: str,
+        text_fields: Tuple[str, ...],
+        int_fields: Tuple[str, ...],
+        aliases: Dict[str, str],
+        numeric: bool = False,
+    ) -> None:
+        self.name = name
+        # Text columns must hold numbers (or numeric strings).
+        self.numeric = numeric
+        self.text_fields = text_fields
+        self.int_fields = int_fields
+        self.aliases = aliases
+        self.fields = text_fields + int_fields
+        columns = ", ".join(("device_id", "timestamp") + self.fields + ("custom_data",))
+        self.copy_sql = f"COPY {name} ({columns}) FROM STDIN WITH (FORMAT csv)"
+
+
+VFD_TABLE = BulkTable(
+    "vfd_readings",
+    ("frequency", "speed", "current", "voltage", "power", "torque"),
+    ("status", "fault_code"),
+    {"faultCode": "fault_code"},
+    numeric=True,
+)
+SENSOR_TABLE = BulkTable(
+    "sensor_readings",
+    ("temperature", "humidity", "pressure", "light", "motion", "distance"),
+    (),
+    {},
+)
+
+
+class BulkIngestError(ValueError):
+    """The upload was rejected; ``errors`` lists the offending rows."""
+
+    def __init__(self, message: str, errors: Optional[List[Dict[str, Any]]] = None) -> None:
+        super().__init__(message)
+        self.errors = errors or []
+
+
+def parse_timestamp(value: Any, received_at: datetime) -> datetime:
+    """Epoch seconds/milliseconds or ISO 8601 (naive = UTC); missing means ``received_at``."""
+    if value is None:
+        return received_at
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if not math.isfinite(value):
+            raise ValueError("timestamp is not finite")
+        try:
+            return datetime.fromtimestamp(value / 1000.0 if value > 1e11 else value, tz=timezone.utc)
+        except (OverflowError, OSError):
+            raise ValueError("timestamp out of range")
+    if isinstance(value, str):
+        ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts
+    raise ValueError("timestamp must be a number or an ISO 8601 string")
+
+
+def _text(value: Any) -> Optional[str]:
+    kind = type(value)
+    if kind is str:
+        return value
+    if kind is bool:
+        return "true" if value else "false"
+    if kind is int or kind is float:
+        return str(value)
+    if value is None:
+        return None
+    raise ValueError("expected a number or string")
+
+
+def _number_text(value: Any) -> Optional[str]:
+    kind = type(value)
+    if kind is int:
+        return str(value)
+    if kind is float or kind is str:
+        # inf - inf and nan - nan are nan, which is the only value unequal to itself.
+        number = float(value)
+        if number - number != 0.0:
+            raise ValueError("expected a finite number")
+        return str(value)
+    if value is None:
+        return None
+    raise ValueError("expected a finite number")
+
+
+def _integer(value: Any) -> Optional[int]:
+    kind = type(value)
+    if kind is int:
+        return value
+    if kind is float and value == int(value):
+        return int(value)
+    if value is None:
+        return None
+    raise ValueError("expected an integer")
+
+
+def row_values(table: BulkTable, device_id: int, record: Any, received_at: datetime) -> List[Any]:
+    """CSV row for one record (ValueError when it does not fit the table)."""
+    if type(record) is not dict:
+        raise ValueError("row must be a JSON object")
+    for alias, field in table.aliases.items():
+        if alias in record and field not in record:
+            record[field] = record[alias]
+    get = record.get
+    values: List[Any] = [device_id, parse_timestamp(get("timestamp"), received_at).isoformat()]
+    text = _number_text if table.numeric else _text
+    field = ""
+    try:
+        for field in table.text_fields:
+            values.append(text(get(field)))
+        for field in table.int_fields:
+            values.append(_integer(get(field)))
+    except (ValueError, OverflowError) as e:
+        raise ValueError(f"{field}: {e}")
+    custom_data = get("custom_data")
+    if type(custom_data) is str:
+        custom_data = json.loads(custom_data)
+    values.append(json.dumps(custom_data, separators=(",", ":")) if custom_data is not None else None)
+    return values
+
+
+def columnar_records(document: Any) -> Iterator[Dict[str, Any]]:
+    """Rows of a columnar JSON document (every value an array of the same length)."""
+    if not isinstance(document, dict) or not document:
+        raise BulkIngestError("Columnar body must be a JSON object of equal-length arrays")
+    lengths = {len(column) if isinstance(column, list) else -1 for column in document.values()}
+    if len(lengths) != 1 or -1 in lengths:
+        raise BulkIngestError("Columnar body must be a JSON object of equal-length arrays")
+    names = list(document)
+    for values in zip(*document.values()):
+        yield dict(zip(names, values))
+
+
+class CopyPipe:
+    """File-like object that ``copy_expert`` reads from while the producer is still writing."""
+
+    def __init__(self, maxsize: int = PIPE_CHUNKS) -> None:
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize)
+        self._buffer = b""
+        self._offset = 0
+        self._eof = False
+        self.failed = False
+
+    def put(self, data: Any) -> None:
+        """Blocking put; gives up once the COPY thread has failed (nobody reads any more)."""
+        while not self.failed:
+            try:
+                self._queue.put(data, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def read(self, size: int = -1) -> bytes:
+        if self._offset >= len(self._buffer) and not self._eof:
+            item = self._queue.get()
+            if item is None:
+                self._eof = True
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                self._buffer, self._offset = item, 0
+        if self._offset >= len(self._buffer):
+            return b""
+        end = len(self._buffer) if size < 0 else self._offset + size
+        data = self._buffer[self._offset:end]
+        self._offset += len(data)
+        return data
+
+
+def _copy(table: BulkTable, pipe: CopyPipe) -> None:
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.copy_expert(table.copy_sql, pipe)
+        connection.commit()
+    except BaseException:
+        pipe.failed = True
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+def encode_rows(
+    table: BulkTable,
+    device_id: int,
+    records: List[Tuple[int, Any]],
+    received_at: datetime,
+    errors: List[Dict[str, Any]],
+    skip_invalid: bool,
+) -> Tuple[bytes, int]:
+    """
+    CSV for a batch of (row number, record or raw NDJSON line); invalid rows
+    are appended to ``errors`` and skipped, or raise BulkIngestError.
+    """
+    buffer = io.StringIO()
+    writerow = csv.writer(buffer).writerow
+    decode = _decoder.decode
+    rows = 0
+    for row_number, record in records:
+        try:
+            if type(record) is bytes:
+                record = decode(record.decode("utf-8"))
+            writerow(row_values(table, device_id, record, received_at))
+        except (ValueError, OverflowError) as e:
+            errors.append({"row": row_number, "error": str(e)})
+            if not skip_invalid or len(errors) > MAX_REPORTED_ERRORS:
+                raise BulkIngestError("Invalid rows; nothing was stored", errors[:MAX_REPORTED_ERRORS])
+            continue
+        rows += 1
+    return buffer.getvalue().encode("utf-8"), rows
+
+
+async def _ndjson_batches(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[Tuple[int, Any]]]:
+    """Numbered non-blank lines, in batches of roughly CHUNK_BYTES of input."""
+    pending = b""
+    line_number = 0
+    async for chunk in chunks:
+        pending += chunk
+        if len(pending) < CHUNK_BYTES:
+            continue
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        batch = [(line_number + i, line) for i, line in enumerate(lines, start=1) if line.strip()]
+        line_number += len(lines)
+        if batch:
+            yield batch
+    lines = pending.split(b"\n")
+    batch = [(line_number + i, line) for i, line in enumerate(lines, start=1) if line.strip()]
+    if batch:
+        yield batch
+
+
+async def _columnar_batches(chunks: AsyncIterator[bytes], max_json_bytes: int) -> AsyncIterator[List[Tuple[int, Any]]]:
+    body = bytearray()
+    async for chunk in chunks:
+        body += chunk
+        if len(body) > max_json_bytes:
+            raise BulkIngestError(f"Columnar body larger than {max_json_bytes} bytes; use NDJSON")
+    try:
+        document = json.loads(body)
+    except ValueError as e:
+        raise BulkIngestError(f"Invalid JSON: {e}")
+    batch: List[Tuple[int, Any]] = []
+    for row_number, record in enumerate(columnar_records(document), start=1):
+        batch.append((row_number, record))
+        if len(batch) >= 10000:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def bulk_copy(
+    table: BulkTable,
+    device_id: int,
+    chunks: AsyncIterator[bytes],
+    columnar: bool = False,
+    skip_invalid: bool = False,
+    max_json_bytes: int = 64 * 1024 * 1024,
+) -> Dict[str, Any]:
+    """
+    COPY the uploaded rows into ``table`` in one transaction.
+
+    An invalid row aborts the upload (BulkIngestError, nothing stored) unless
+    ``skip_invalid``, in which case it is skipped and reported, up to
+    MAX_REPORTED_ERRORS rows. Batches are encoded in a worker thread, so the
+    event loop only moves bytes.
+    """
+    received_at = datetime.now(timezone.utc)
+    pipe = CopyPipe()
+    copy_task = asyncio.create_task(asyncio.to_thread(_copy, table, pipe))
+    rows = 0
+    errors: List[Dict[str, Any]] = []
+
+    def encode_and_send(batch: List[Tuple[int, Any]]) -> int:
+        data, count = encode_rows(table, device_id, batch, received_at, errors, skip_invalid)
+        if data:
+            pipe.put(data)
+        return count
+
+    batches = _columnar_batches(chunks, max_json_bytes) if columnar else _ndjson_batches(chunks)
+    try:
+        async for batch in batches:
+            rows += await asyncio.to_thread(encode_and_send, batch)
+            if copy_task.done():
+                break
+        pipe.put(None)
+    except BaseException as e:
+        # Abort the COPY (rolls back) and let it finish before reporting.
+        pipe.put(e if isinstance(e, Exception) else BulkIngestError("Upload aborted"))
+        try:
+            await copy_task
+        except BaseException:
+            pass
+        raise
+    await copy_task
+    return {
+        "table": table.name,
+        "device_id": device_id,
+        "rows": rows,
+        "skipped": len(errors),
+        "errors": errors,
+        "seconds": round((datetime.now(timezone.utc) - received_at).total_seconds(), 3),
+    }
@@ -0,0 +1,438 @@
+"""
+Cold tier for aged VFD readings: memory-mapped columnar segment files.
+
+Readings older than the cold age leave PostgreSQL (both vfd_readings and the
+compressed vfd_reading_buckets) and are written to one segment file per
+device per UTC day, ``<root>/<device_id>/<YYYY-MM-DD>.seg``. Reads mmap the
+file, binary-search the timestamp column and copy only the requested slice,
+so old history costs disk space and page cache instead of database buffers.
+
+Segment layout (little-endian)::
+
+    b"VFDSEG01"  header_length:u32  reserved:u32
+    header JSON (padded to 8 bytes): count, first/last timestamp, column
+        directory {name, dtype, offset}, custom_data block directory and
+        per-row overrides for values that are not plain numbers
+    data area: 8-byte aligned columns
+
+Columns are plain arrays (``ts``/``id`` int64, VFD fields float64 with NaN
+for NULL, status/fault_code int32 with INT32_MIN for NULL), so a segment
+can be opened with ``numpy.frombuffer(mm, dtype, count, data_start + offset)``.
+``custom_data`` is stored as zlib-compressed JSON blocks of CUSTOM_DATA_BLOCK_ROWS
+rows, addressed through an int64 offsets column.
+"""
+import bisect
+import json
+import math
+import mmap
+import os
+import shutil
+import struct
+import sys
+import zlib
+from array import array
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import VFDReading as VFDReadingModel, VFDReadingBucket as VFDReadingBucketModel
+from vfd_archive import INT_FIELDS, TEXT_FIELDS, decode_bucket, from_micros, reading_row, to_micros
+
+MAGIC = b"VFDSEG01"
+_PREFIX = struct.Struct("<8sII")
+INT32_NULL = -(1 << 31)
+CUSTOM_DATA_BLOCK_ROWS = 512
+
+# (name, dtype) of the fixed-width columns, in file order.
+COLUMNS = (
+    ("ts", "<i8"),
+    ("id", "<i8"),
+    *((name, "<f8") for name in TEXT_FIELDS),
+    *((name, "<i4") for name in INT_FIELDS),
+)
+_ARRAY_CODES = {"<i8": "q", "<f8": "d", "<i4": "i"}
+_ITEM_SIZES = {"<i8": 8, "<f8": 8, "<i4": 4}
+
+
+def _align(value: int) -> int:
+    return (value + 7) & ~7
+
+
+def _day_of(ts: datetime) -> date:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc).date()
+
+
+def _day_bounds(day: date) -> Tuple[datetime, datetime]:
+    start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    return start, start + timedelta(days=1)
+
+
+def encode_segment(device_id: int, day: date, rows: List[Dict[str, Any]]) -> bytes:
+    """Serialize rows (vfd_archive row dicts) of one device and day."""
+    rows = sorted(rows, key=lambda row: (row["timestamp"], row["id"]))
+    overrides: Dict[str, Dict[str, Any]] = {}
+    arrays: Dict[str, array] = {}
+    arrays["ts"] = array("q", (to_micros(row["timestamp"]) for row in rows))
+    arrays["id"] = array("q", (row["id"] for row in rows))
+    for name in TEXT_FIELDS:
+        column = array("d")
+        for index, row in enumerate(rows):
+            value = row.get(name)
+            number = math.nan
+            if value is not None:
+                try:
+                    number = float(value)
+                except (TypeError, ValueError):
+                    pass
+                if math.isnan(number) or str(number) != value:
+                    # Keep the exact text; the column holds NULL.
+                    overrides.setdefault(str(index), {})[name] = value
+                    number = math.nan
+            column.append(number)
+        arrays[name] = column
+    for name in INT_FIELDS:
+        column = array("i")
+        for index, row in enumerate(rows):
+            value = row.get(name)
+            if value is None:
+                column.append(INT32_NULL)
+            elif isinstance(value, int) and INT32_NULL < value < (1 << 31):
+                column.append(value)
+            else:
+                overrides.setdefault(str(index), {})[name] = value
+                column.append(INT32_NULL)
+        arrays[name] = column
+
+    data = bytearray()
+    directory = []
+    for name, dtype in COLUMNS:
+        column = arrays[name]
+        if sys.byteorder != "little":
+            column.byteswap()
+        data += b"\0" * (_align(len(data)) - len(data))
+        directory.append({"name": name, "dtype": dtype, "offset": len(data)})
+        data += column.tobytes()
+
+    blocks = []
+    for start in range(0, len(rows), CUSTOM_DATA_BLOCK_ROWS):
+        documents = [row.get("custom_data") for row in rows[start:start + CUSTOM_DATA_BLOCK_ROWS]]
+        blocks.append(zlib.compress(json.dumps(documents, separators=(",", ":")).encode("utf-8")))
+    block_offsets = array("q", [0])
+    for block in blocks:
+        block_offsets.append(block_offsets[-1] + len(block))
+    if sys.byteorder != "little":
+        block_offsets.byteswap()
+    data += b"\0" * (_align(len(data)) - len(data))
+    offsets_at = len(data)
+    data += block_offsets.tobytes()
+    heap_at = len(data)
+    for block in blocks:
+        data += block
+
+    header = json.dumps({
+        "version": 1,
+        "device_id": device_id,
+        "day": day.isoformat(),
+        "count": len(rows),
+        "first_ts": arrays["ts"][0] if rows else None,
+        "last_ts": arrays["ts"][-1] if rows else None,
+        "columns": directory,
+        "custom_data": {
+            "block_rows": CUSTOM_DATA_BLOCK_ROWS,
+            "blocks": len(blocks),
+            "offsets": offsets_at,
+            "heap": heap_at,
+        },
+        "overrides": overrides,
+    }, separators=(",", ":")).encode("utf-8")
+    header += b" " * (_align(_PREFIX.size + len(header)) - _PREFIX.size - len(header))
+    return _PREFIX.pack(MAGIC, len(header), 0) + header + bytes(data)
+
+
+class _Segment:
+    """An open, memory-mapped segment file; use as a context manager."""
+
+    def __init__(self, path: str) -> None:
+        self._handle = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._handle.close()
+            raise
+        self._views: List[memoryview] = []
+        magic, header_length, _ = _PREFIX.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a VFD segment file")
+        self.header = json.loads(self._map[_PREFIX.size:_PREFIX.size + header_length])
+        self.data_start = _PREFIX.size + header_length
+        self.count = self.header["count"]
+        self._directory = {column["name"]: column for column in self.header["columns"]}
+
+    def column(self, name: str):
+        """Zero-copy view of a column (an array copy on big-endian hosts)."""
+        entry = self._directory[name]
+        start = self.data_start + entry["offset"]
+        raw = memoryview(self._map)[start:start + self.count * _ITEM_SIZES[entry["dtype"]]]
+        if sys.byteorder != "little":
+            values = array(_ARRAY_CODES[entry["dtype"]], raw.tobytes())
+            raw.release()
+            values.byteswap()
+            return values
+        view = raw.cast(_ARRAY_CODES[entry["dtype"]])
+        self._views += [view, raw]
+        return view
+
+    def custom_data(self, lo: int, hi: int) -> List[Any]:
+        meta = self.header["custom_data"]
+        block_rows = meta["block_rows"]
+        start = self.data_start + meta["offsets"]
+        offsets = array("q", self._map[start:start + (meta["blocks"] + 1) * 8])
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        heap = self.data_start + meta["heap"]
+        first_block, last_block = lo // block_rows, (hi - 1) // block_rows
+        documents: List[Any] = []
+        for block in range(first_block, last_block + 1):
+            documents.extend(json.loads(zlib.decompress(self._map[heap + offsets[block]:heap + offsets[block + 1]])))
+        skip = lo - first_block * block_rows
+        return documents[skip:skip + hi - lo]
+
+    def rows(self, start_us: Optional[int] = None, end_us: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Rows with ``start_us <= ts < end_us``, oldest first."""
+        timestamps = self.column("ts")
+        lo = 0 if start_us is None else bisect.bisect_left(timestamps, start_us)
+        hi = self.count if end_us is None else bisect.bisect_left(timestamps, end_us)
+        if hi <= lo:
+            return []
+        columns = {"ts": timestamps[lo:hi].tolist()}
+        for name, _ in COLUMNS[1:]:
+            columns[name] = self.column(name)[lo:hi].tolist()
+        documents = self.custom_data(lo, hi)
+        rows = []
+        for offset in range(hi - lo):
+            row = {"id": columns["id"][offset], "timestamp": from_micros(columns["ts"][offset])}
+            for name in TEXT_FIELDS:
+                value = columns[name][offset]
+                row[name] = None if math.isnan(value) else str(value)
+            for name in INT_FIELDS:
+                value = columns[name][offset]
+                row[name] = None if value == INT32_NULL else value
+            row["custom_data"] = documents[offset]
+            override = self.header["overrides"].get(str(lo + offset))
+            if override:
+                row.update(override)
+            rows.append(row)
+        return rows
+
+    def close(self) -> None:
+        # Views into the map must be released before it can be closed.
+        for view in self._views:
+            view.release()
+        self._views.clear()
+        self._map.close()
+        self._handle.close()
+
+    def __enter__(self) -> "_Segment":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class ColdArchive:
+    """Segment files under ``root``: one directory per device, one file per UTC day."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def _device_dir(self, device_id: int) -> str:
+        return os.path.join(self.root, str(device_id))
+
+    def segment_path(self, device_id: int, day: date) -> str:
+        return os.path.join(self._device_dir(device_id), f"{day.isoformat()}.seg")
+
+    def days(self, device_id: int) -> List[date]:
+        try:
+            names = os.listdir(self._device_dir(device_id))
+        except FileNotFoundError:
+            return []
+        days = []
+        for name in names:
+            if name.endswith(".seg"):
+                try:
+                    days.append(date.fromisoformat(name[:-4]))
+                except ValueError:
+                    continue
+        return sorted(days)
+
+    def read_day(self, device_id: int, day: date, start: Optional[datetime] = None, end: Optional[datetime] = None):
+        path = self.segment_path(device_id, day)
+        if not os.path.exists(path):
+            return []
+        with _Segment(path) as segment:
+            return segment.rows(
+                None if start is None else to_micros(start),
+                None if end is None else to_micros(end),
+            )
+
+    def write_rows(self, device_id: int, rows: List[Dict[str, Any]]) -> int:
+        """Merge rows into their day segments (rows already there are replaced by id). Returns bytes written."""
+        by_day: Dict[date, List[Dict[str, Any]]] = {}
+        for row in rows:
+            by_day.setdefault(_day_of(row["timestamp"]), []).append(row)
+        os.makedirs(self._device_dir(device_id), exist_ok=True)
+        written = 0
+        for day, day_rows in by_day.items():
+            merged = {row["id"]: row for row in self.read_day(device_id, day)}
+            merged.update((row["id"], row) for row in day_rows)
+            payload = encode_segment(device_id, day, list(merged.values()))
+            path = self.segment_path(device_id, day)
+            temporary = path + ".tmp"
+            with open(temporary, "wb") as handle:
+                handle.write(payload)
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(temporary, path)
+            written += len(payload)
+        return written
+
+    def iter_rows(
+        self,
+        device_id: int,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Rows in ``[start, end)``, oldest first, one segment at a time."""
+        for day in self.days(device_id):
+            day_start, day_end = _day_bounds(day)
+            if (end is not None and day_start >= end) or (start is not None and day_end <= start):
+                continue
+            yield from self.read_day(device_id, day, start, end)
+
+    def readings(
+        self,
+        device_id: int,
+        limit: int,
+        newer_than: Optional[datetime] = None,
+        matches: Optional[Callable[[Any], bool]] = None,
+    ) -> List[VFDReadingModel]:
+        """Newest ``limit`` rows (after ``newer_than``) as detached VFDReading objects."""
+        readings: List[VFDReadingModel] = []
+        for day in reversed(self.days(device_id)):
+            if newer_than is not None and _day_bounds(day)[1] <= newer_than:
+                break
+            rows = self.read_day(device_id, day, newer_than + timedelta(microseconds=1) if newer_than else None)
+            for row in reversed(rows):
+                if matches is not None and not matches(row["custom_data"]):
+                    continue
+                readings.append(VFDReadingModel(device_id=device_id, **row))
+                if len(readings) >= limit:
+                    return readings
+        return readings
+
+    def delete_device(self, device_id: int) -> None:
+        shutil.rmtree(self._device_dir(device_id), ignore_errors=True)
+
+    def summary(self) -> Dict[str, Any]:
+        files = total_bytes = 0
+        devices = 0
+        if os.path.isdir(self.root):
+            for entry in os.scandir(self.root):
+                if not entry.is_dir():
+                    continue
+                devices += 1
+                for segment in os.scandir(entry.path):
+                    if segment.name.endswith(".seg"):
+                        files += 1
+                        total_bytes += segment.stat().st_size
+        return {"root": os.path.abspath(self.root), "devices": devices, "segments": files, "bytes": total_bytes}
+
+
+def move_to_cold_archive(db: Session, archive: ColdArchive, cutoff: datetime, max_days: int = 50) -> Dict[str, int]:
+    """
+    Move readings older than ``cutoff`` (hot rows and compressed buckets) into segment files.
+
+    Works one device-day at a time: the segment is written and fsynced
+    before the database rows are deleted, so a crash in between only leaves
+    duplicates that the next run merges away. Buckets are moved on the day of
+    their first row once they end before ``cutoff``.
+    """
+    result = {"rows": 0, "segments": 0, "bytes": 0}
+    for _ in range(max_days):
+        oldest_row = (
+            db.query(VFDReadingModel.device_id, VFDReadingModel.timestamp)
+            .filter(VFDReadingModel.timestamp < cutoff)
+            .order_by(VFDReadingModel.timestamp.asc())
+            .first()
+        )
+        oldest_bucket = (
+            db.query(VFDReadingBucketModel.device_id, VFDReadingBucketModel.first_ts)
+            .filter(VFDReadingBucketModel.last_ts < cutoff)
+            .order_by(VFDReadingBucketModel.first_ts.asc())
+            .first()
+        )
+        candidates = [candidate for candidate in (oldest_row, oldest_bucket) if candidate is not None]
+        if not candidates:
+            break
+        device_id, oldest = min(candidates, key=lambda candidate: candidate[1])
+        day_start, day_end = _day_bounds(_day_of(oldest))
+
+        readings = (
+            db.query(VFDReadingModel)
+            .filter(
+                VFDReadingModel.device_id == device_id,
+                VFDReadingModel.timestamp >= day_start,
+                VFDReadingModel.timestamp < min(day_end, cutoff),
+            )
+            .all()
+        )
+        buckets = (
+            db.query(VFDReadingBucketModel)
+            .filter(
+                VFDReadingBucketModel.device_id == device_id,
+                VFDReadingBucketModel.first_ts >= day_start,
+                VFDReadingBucketModel.first_ts < day_end,
+                VFDReadingBucketModel.last_ts < cutoff,
+            )
+            .all()
+        )
+        rows = [reading_row(reading) for reading in readings]
+        for bucket in buckets:
+            rows.extend(decode_bucket(bucket.payload))
+        result["bytes"] += archive.write_rows(device_id, rows)
+        result["rows"] += len(rows)
+        result["segments"] += 1
+
+        if readings:
+            db.query(VFDReadingModel).filter(
+                VFDReadingModel.id.in_([reading.id for reading in readings])
+            ).delete(synchronize_session=False)
+        if buckets:
+            db.query(VFDReadingBucketModel).filter(
+                VFDReadingBucketModel.id.in_([bucket.id for bucket in buckets])
+            ).delete(synchronize_session=False)
+        db.commit()
+    return result
+
+
+def with_cold_readings(
+    archive: ColdArchive,
+    device_id: int,
+    readings: List[VFDReadingModel],
+    limit: int,
+    matches: Optional[Callable[[Any], bool]] = None,
+) -> List[VFDReadingModel]:
+    """Merge the newest ``limit`` database readings with cold ones, newest first (deduplicated by id)."""
+    if limit <= 0:
+        return readings
+    newer_than = readings[-1].timestamp if len(readings) >= limit else None
+    cold = archive.readings(device_id, limit, newer_than, matches)
+    if not cold:
+        return readings
+    merged = {reading.id: reading for reading in cold}
+    merged.update((reading.id, reading) for reading in readings)
+    return sorted(merged.values(), key=lambda reading: (reading.timestamp, reading.id), reverse=True)[:limit]
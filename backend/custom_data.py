@@ -0,0 +1,249 @@
+"""
+JSONB ``custom_data`` helpers: value coercion, query filters, migration and indexes.
+
+``custom_data`` on vfd_readings and sensor_readings is JSONB. The API keeps
+exposing it as a JSON string (``to_text``) so existing clients are unchanged,
+while writers store documents (``to_document``) that PostgreSQL can filter
+and index. Keys may be dotted paths into nested objects, e.g.
+``Current.value`` for the poller's per-register payload.
+"""
+import json
+from typing import Any, Iterable, List, Optional, Union
+
+from sqlalchemy import Float, Index, case, cast, func, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.elements import Grouping
+
+FILTER_OPERATORS = ("eq", "ne", "lt", "le", "gt", "ge", "exists")
+
+
+def to_document(value: Any) -> Optional[Union[dict, list]]:
+    """Coerce an incoming custom_data value (dict or JSON text) to a JSON document."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (dict, list)):
+        return value
+    if isinstance(value, (bytes, str)):
+        try:
+            parsed = json.loads(value)
+        except ValueError:
+            return {"raw": value if isinstance(value, str) else value.decode("utf-8", "replace")}
+        return parsed if isinstance(parsed, (dict, list)) else {"value": parsed}
+    return {"value": value}
+
+
+def to_text(value: Any) -> Optional[str]:
+    """JSON text of a stored custom_data document, as returned by the API."""
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def _path(key: str) -> List[str]:
+    parts = [part for part in key.split(".") if part]
+    if not parts:
+        raise ValueError("custom_data key must not be empty")
+    return parts
+
+
+def custom_data_element(column, key: str):
+    """``column -> key`` (or ``#>`` for a dotted path) as a JSONB expression."""
+    parts = _path(key)
+    return column[parts[0]] if len(parts) == 1 else column[tuple(parts)]
+
+
+def custom_data_number(column, key: str):
+    """
+    Numeric value at ``key`` or NULL when it is missing or not a JSON number.
+
+    The same expression is used for expression indexes, so the planner can
+    match ``custom_data_number(col, "rssi") < -80`` against the index.
+    """
+    element = custom_data_element(column, key)
+    return case((func.jsonb_typeof(element) == "number", cast(element.astext, Float)), else_=None)
+
+
+def custom_data_filter(column, key: str, op: str, value: Optional[str] = None):
+    """
+    SQL condition on one custom_data key.
+
+    ``lt/le/gt/ge`` compare numerically; ``eq/ne`` use JSONB containment (served
+    by the GIN index) with ``value`` parsed as JSON when possible, so ``5`` and
+    ``"5"`` are distinct; ``exists`` checks that the key is present.
+    """
+    if op not in FILTER_OPERATORS:
+        raise ValueError(f"Unsupported custom_data operator '{op}' (use one of {', '.join(FILTER_OPERATORS)})")
+    parts = _path(key)
+    if op == "exists":
+        if len(parts) == 1:
+            return column.has_key(parts[0])
+        return custom_data_element(column, key).isnot(None)
+    if value is None:
+        raise ValueError(f"custom_data operator '{op}' needs a value")
+    if op in ("eq", "ne"):
+        try:
+            parsed: Any = json.loads(value)
+        except ValueError:
+            parsed = value
+        document: Any = parsed
+        for part in reversed(parts):
+            document = {part: document}
+        condition = column.contains(document)
+        return condition if op == "eq" else ~condition
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"custom_data operator '{op}' needs a numeric value")
+    expression = custom_data_number(column, key)
+    return {
+        "lt": expression < number,
+        "le": expression <= number,
+        "gt": expression > number,
+        "ge": expression >= number,
+    }[op]
+
+
+def _jsonb_contains(document: Any, fragment: Any) -> bool:
+    """Python equivalent of the JSONB ``@>`` operator."""
+    if isinstance(fragment, dict):
+        return isinstance(document, dict) and all(
+            key in document and _jsonb_contains(document[key], value) for key, value in fragment.items()
+        )
+    if isinstance(fragment, list):
+        return isinstance(document, list) and all(
+            any(_jsonb_contains(item, value) for item in document) for value in fragment
+        )
+    # JSON true is not the number 1.
+    if isinstance(document, bool) or isinstance(fragment, bool):
+        return document is fragment
+    return not isinstance(document, (dict, list)) and document == fragment
+
+
+def custom_data_matches(document: Any, key: str, op: str, value: Optional[str] = None) -> bool:
+    """
+    Evaluate ``custom_data_filter`` on an already loaded document.
+
+    Used for rows decoded outside PostgreSQL (the compressed archive), with
+    the same semantics as the SQL condition; a NULL document never matches.
+    """
+    if op not in FILTER_OPERATORS:
+        raise ValueError(f"Unsupported custom_data operator '{op}' (use one of {', '.join(FILTER_OPERATORS)})")
+    parts = _path(key)
+    document = to_document(document)
+    if document is None:
+        return False
+    element: Any = document
+    for part in parts:
+        if isinstance(element, list) and part.lstrip("-").isdigit():
+            index = int(part)
+            found = -len(element) <= index < len(element)
+            element = element[index] if found else None
+        elif isinstance(element, dict) and part in element:
+            element = element[part]
+            found = True
+        else:
+            found = False
+        if not found:
+            break
+    if op == "exists":
+        return found
+    if value is None:
+        raise ValueError(f"custom_data operator '{op}' needs a value")
+    if op in ("eq", "ne"):
+        try:
+            parsed: Any = json.loads(value)
+        except ValueError:
+            parsed = value
+        fragment: Any = parsed
+        for part in reversed(parts):
+            fragment = {part: fragment}
+        contained = _jsonb_contains(document, fragment)
+        return contained if op == "eq" else not contained
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"custom_data operator '{op}' needs a numeric value")
+    if not found or isinstance(element, bool) or not isinstance(element, (int, float)):
+        return False
+    return {
+        "lt": element < number,
+        "le": element <= number,
+        "gt": element > number,
+        "ge": element >= number,
+    }[op]
+
+
+# Text-to-JSONB conversion that keeps rows whose text is not valid JSON.
+_TRY_JSONB_FUNCTION = """
+CREATE OR REPLACE FUNCTION pg_temp.custom_data_try_jsonb(value text) RETURNS jsonb AS $$
+BEGIN
+    IF value IS NULL OR value = '' THEN
+        RETURN NULL;
+    END IF;
+    RETURN value::jsonb;
+EXCEPTION WHEN others THEN
+    RETURN jsonb_build_object('raw', value);
+END;
+$$ LANGUAGE plpgsql IMMUTABLE
+"""
+
+
+def migrate_custom_data_columns(engine: Engine, tables: Iterable[str]) -> List[str]:
+    """
+    Convert text ``custom_data`` columns of existing tables to JSONB in place.
+
+    ``create_all`` never alters existing columns, so databases created before
+    the switch still have VARCHAR here. Idempotent; returns the converted
+    tables. Each conversion rewrites the table under an exclusive lock.
+    """
+    converted: List[str] = []
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        pending = []
+        for table in tables:
+            if not inspector.has_table(table):
+                continue
+            columns = {column["name"]: column for column in inspector.get_columns(table)}
+            column = columns.get("custom_data")
+            if column is not None and column["type"].__class__.__name__ in ("VARCHAR", "TEXT"):
+                pending.append(table)
+        if not pending:
+            return converted
+        connection.execute(text(_TRY_JSONB_FUNCTION))
+        for table in pending:
+            connection.execute(text(
+                f"ALTER TABLE {table} ALTER COLUMN custom_data TYPE JSONB "
+                f"USING pg_temp.custom_data_try_jsonb(custom_data)"
+            ))
+            converted.append(table)
+    return converted
+
+
+def ensure_custom_data_indexes(engine: Engine, model, gin: bool, numeric_keys: Iterable[str]) -> List[str]:
+    """
+    Create the optional custom_data indexes of ``model`` if they do not exist.
+
+    ``gin`` adds a GIN index for containment/key-existence filters; each of
+    ``numeric_keys`` gets a ``(device_id, <number at key>)`` expression index
+    for range filters such as ``rssi < -80``.
+    """
+    table = model.__table__
+    indexes = []
+    if gin:
+        indexes.append(Index(f"ix_{table.name}_custom_data_gin", table.c.custom_data, postgresql_using="gin"))
+    for key in numeric_keys:
+        suffix = "".join(ch if ch.isalnum() else "_" for ch in key.lower())
+        indexes.append(Index(
+            f"ix_{table.name}_cd_{suffix}",
+            table.c.device_id,
+            # CREATE INDEX needs parentheses around non-function expressions.
+            Grouping(custom_data_number(table.c.custom_data, key)),
+        ))
+    created = []
+    existing = {index["name"] for index in inspect(engine).get_indexes(table.name)}
+    for index in indexes:
+        if index.name in existing:
+            continue
+        index.create(bind=engine)
+        created.append(index.name)
+    return created
@@ -0,0 +1,150 @@
+"""
+Server-driven reporting rate for ESP32 devices.
+
+Connected devices receive a ``config`` downlink with their report interval
+and batch size (samples per batched ``sensor_data`` frame). A controller
+tick compares the ingest pressure with its targets:
+
+- mean handling time of ESP32 data frames since the last tick vs. ``target_ms``,
+- database connection pool utilisation,
+- rows waiting in the poller process's batch writer vs. ``max_backlog``.
+
+Pressure above 1 raises the level by one step (interval and batch size
+double); the level only falls again after ``calm_ticks`` ticks below
+``low_watermark``. Under overload devices send fewer, larger frames and
+sample less often, instead of queueing behind slow acks.
+"""
+from typing import Any, Dict, Optional
+
+from fastapi import WebSocket
+
+from log_setup import get_logger
+
+_log = get_logger("flow")
+
+
+class ReportRateController:
+    def __init__(
+        self,
+        enabled: bool = True,
+        base_interval_ms: int = 1000,
+        max_interval_ms: int = 30000,
+        base_batch_size: int = 1,
+        max_batch_size: int = 60,
+        target_ms: float = 200.0,
+        max_backlog: int = 5000,
+        low_watermark: float = 0.5,
+        calm_ticks: int = 3,
+    ) -> None:
+        self.enabled = enabled
+        self.base_interval_ms = base_interval_ms
+        self.max_interval_ms = max(max_interval_ms, base_interval_ms)
+        self.base_batch_size = max(1, base_batch_size)
+        self.max_batch_size = max(max_batch_size, self.base_batch_size)
+        self.target_ms = target_ms
+        self.max_backlog = max_backlog
+        self.low_watermark = low_watermark
+        self.calm_ticks = calm_ticks
+        self.level = 0
+        # Set by an admin to pin the level; None = automatic.
+        self.pinned_level: Optional[int] = None
+        self.pressure = 0.0
+        self.signals: Dict[str, Optional[float]] = {}
+        self.level_changes = 0
+        self._calm = 0
+        self._window_ms = 0.0
+        self._window_frames = 0
+        self._sockets: Dict[WebSocket, int] = {}
+
+    @property
+    def max_level(self) -> int:
+        level = 0
+        while (
+            self.base_interval_ms << level < self.max_interval_ms
+            or self.base_batch_size << level < self.max_batch_size
+        ):
+            level += 1
+        return level
+
+    def config(self) -> Dict[str, Any]:
+        """The ``config`` downlink for the current level."""
+        return {
+            "type": "config",
+            "report_interval_ms": min(self.base_interval_ms << self.level, self.max_interval_ms),
+            "batch_size": min(self.base_batch_size << self.level, self.max_batch_size),
+            "level": self.level,
+        }
+
+    def observe_frame(self, elapsed_ms: float) -> None:
+        """Record the handling time (receive to ack) of one ESP32 data frame."""
+        self._window_ms += elapsed_ms
+        self._window_frames += 1
+
+    def update(self, pool_usage: Optional[float] = None, backlog: Optional[int] = None) -> bool:
+        """Controller tick; returns True when the level changed."""
+        mean_ms = self._window_ms / self._window_frames if self._window_frames else None
+        self._window_ms = 0.0
+        self._window_frames = 0
+        self.signals = {
+            "frame_ms": round(mean_ms, 3) if mean_ms is not None else None,
+            "pool_usage": round(pool_usage, 3) if pool_usage is not None else None,
+            "writer_backlog": backlog,
+        }
+        self.pressure = max(
+            (mean_ms or 0.0) / self.target_ms if self.target_ms > 0 else 0.0,
+            pool_usage or 0.0,
+            (backlog or 0) / self.max_backlog if self.max_backlog > 0 else 0.0,
+        )
+
+        if not self.enabled:
+            return False
+        level = self.level
+        if self.pinned_level is not None:
+            level = min(self.pinned_level, self.max_level)
+        elif self.pressure > 1.0:
+            level = min(self.level + 1, self.max_level)
+            self._calm = 0
+        elif self.pressure < self.low_watermark:
+            self._calm += 1
+            if self._calm >= self.calm_ticks and self.level > 0:
+                level = self.level - 1
+                self._calm = 0
+        else:
+            self._calm = 0
+        if level == self.level:
+            return False
+        self.level = level
+        self.level_changes += 1
+        return True
+
+    def attach(self, websocket: WebSocket, device_id: int) -> None:
+        self._sockets[websocket] = device_id
+
+    def detach(self, websocket: WebSocket) -> None:
+        self._sockets.pop(websocket, None)
+
+    async def broadcast_config(self) -> int:
+        """Send the current config to every connected device; returns how many got it."""
+        message = self.config()
+        sent = 0
+        for websocket, device_id in list(self._sockets.items()):
+            try:
+                await websocket.send_json(message)
+                sent += 1
+            except Exception as exc:
+                _log.warning("downlink_failed", "⚠️ Config downlink failed", device_id=device_id, error=str(exc))
+                self.detach(websocket)
+        return sent
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "level": self.level,
+            "max_level": self.max_level,
+            "pinned_level": self.pinned_level,
+            "pressure": round(self.pressure, 3),
+            "signals": self.signals,
+            "config": self.config(),
+            "connected_devices": len(self._sockets),
+            "level_changes": self.level_changes,
+        }
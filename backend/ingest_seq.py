@@ -0,0 +1,128 @@
+"""
+Sequence-numbered sample batches from ESP32 devices.
+
+A ``sensor_data`` frame may carry ``samples``: readings buffered on the
+device, each with a monotonically increasing ``seq`` and the device-side
+capture time ``ts``. Devices send their buffer oldest first and drop a
+sample only once it is acknowledged, so per device the server only needs
+the highest ingested seq (``ingest_cursors``):
+
+- ``seq <= cursor``: already ingested (a replay after a lost ack), skipped.
+- ``seq > cursor + 1``: the samples in between are gone from the device
+  buffer (overflow); they are counted as lost and the cursor moves past them.
+
+The cursor is locked and updated in the same transaction as the rows, so a
+batch is ingested exactly once even if it is replayed, and the ack (the new
+cursor) is the highest contiguous seq the server has durably stored.
+"""
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from models import IngestCursor as IngestCursorModel
+
+# Device clocks further ahead than this are not trusted; the receive time is used instead.
+MAX_CLOCK_SKEW = timedelta(seconds=60)
+# Earliest plausible device timestamp (an unsynchronised clock reports 1970).
+MIN_DEVICE_TIME = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def sample_timestamp(value: Any, received_at: datetime) -> datetime:
+    """
+    Capture time of a sample: epoch seconds (or milliseconds) or an ISO 8601
+    string. Missing or implausible values fall back to ``received_at``.
+    """
+    ts: Optional[datetime] = None
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+        seconds = value / 1000.0 if value > 1e11 else float(value)
+        try:
+            ts = datetime.fromtimestamp(seconds, tz=timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            ts = None
+    elif isinstance(value, str) and value:
+        try:
+            ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            ts = None
+        if ts is not None and ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+    if ts is None or ts < MIN_DEVICE_TIME or ts > received_at + MAX_CLOCK_SKEW:
+        return received_at
+    return ts
+
+
+def parse_samples(samples: Any, max_samples: int) -> List[Dict[str, Any]]:
+    """Validate a ``samples`` array and return it ordered by seq (ValueError when malformed)."""
+    if not isinstance(samples, list) or not samples:
+        raise ValueError("samples must be a non-empty array")
+    if len(samples) > max_samples:
+        raise ValueError(f"Too many samples in one frame (max {max_samples})")
+    parsed: List[Dict[str, Any]] = []
+    for sample in samples:
+        if not isinstance(sample, dict):
+            raise ValueError("Each sample must be an object")
+        seq = sample.get("seq")
+        if not isinstance(seq, int) or isinstance(seq, bool) or seq < 0:
+            raise ValueError("Each sample needs a non-negative integer seq")
+        if not isinstance(sample.get("data", {}), dict):
+            raise ValueError("Sample data must be an object")
+        parsed.append(sample)
+    parsed.sort(key=lambda sample: sample["seq"])
+    return parsed
+
+
+def lock_cursor(db: Session, device_id: int) -> Optional[int]:
+    """Highest ingested seq of a device, row-locked until the caller commits (None if never set)."""
+    cursor = (
+        db.query(IngestCursorModel.seq)
+        .filter(IngestCursorModel.device_id == device_id)
+        .with_for_update()
+        .first()
+    )
+    return cursor[0] if cursor else None
+
+
+def split_new(samples: List[Dict[str, Any]], cursor: Optional[int]) -> Tuple[List[Dict[str, Any]], int, int]:
+    """
+    Samples newer than ``cursor`` (duplicate seqs within the frame dropped),
+    plus the number of replayed duplicates and of seqs lost in gaps.
+    """
+    fresh: List[Dict[str, Any]] = []
+    duplicates = lost = 0
+    last = cursor
+    for sample in samples:
+        seq = sample["seq"]
+        if last is not None and seq <= last:
+            duplicates += 1
+            continue
+        # A device seen for the first time starts at its first sample, not at seq 0.
+        if last is not None:
+            lost += seq - last - 1
+        fresh.append(sample)
+        last = seq
+    return fresh, duplicates, lost
+
+
+def save_cursor(db: Session, device_id: int, seq: int) -> None:
+    """Move the device's cursor to ``seq`` in the caller's transaction."""
+    statement = pg_insert(IngestCursorModel).values(device_id=device_id, seq=seq)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[IngestCursorModel.device_id],
+        set_={"seq": statement.excluded.seq, "updated_at": datetime.now(timezone.utc)},
+    ))
+
+
+def advance_cursor(db: Session, device_id: int, seq: int) -> None:
+    """Move the device's cursor forward to ``seq`` (never backwards) in the caller's transaction."""
+    statement = pg_insert(IngestCursorModel).values(device_id=device_id, seq=seq)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[IngestCursorModel.device_id],
+        set_={
+            "seq": func.greatest(IngestCursorModel.seq, statement.excluded.seq),
+            "updated_at": datetime.now(timezone.utc),
+        },
+    ))
@@ -0,0 +1,242 @@
+"""
+Structured, non-blocking logging for the ingest hot paths.
+
+Records are ``event`` names plus key/value fields (``esp32.heartbeat
+device_id=5 rssi=-61``). The calling thread (usually the event loop) only
+puts the record on a bounded queue, without formatting or I/O; a
+``QueueListener`` thread formats it and writes to stdout and, with
+``LOG_FILE``, to a size-rotated file. When the queue is full the record is
+dropped and counted instead of blocking.
+
+Sampling: ``LOG_SAMPLE_RATES`` (``"esp32.heartbeat=1,esp32.vfd_frame=5"``)
+caps each event at that many records per second across the fleet; the next
+record written carries ``suppressed=N``. Warnings and errors are never
+sampled. Levels and rates can be changed at runtime (``PUT /admin/logging``).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+ROOT_LOGGER = "vfd"
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+# Records per second for the chattiest events unless LOG_SAMPLE_RATES says otherwise.
+DEFAULT_SAMPLE_RATES = {
+    "esp32.heartbeat": 1.0,
+    "esp32.vfd_frame": 5.0,
+    "esp32.vfd_batch": 5.0,
+    "esp32.spooled": 5.0,
+    "rs485.data": 5.0,
+}
+
+
+def parse_rates(value: str) -> Dict[str, float]:
+    """``"event=rate,..."`` -> {event: rate}; rate 0 means unlimited."""
+    rates: Dict[str, float] = {}
+    for item in value.split(","):
+        if "=" in item:
+            event, rate = item.split("=", 1)
+            rates[event.strip()] = float(rate)
+    return rates
+
+
+class EventSampler:
+    """Per-event token buckets (rate records/s, burst of one second)."""
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None) -> None:
+        self.rates: Dict[str, float] = dict(rates or {})
+        self._lock = threading.Lock()
+        # event -> [tokens, last refill, suppressed since last written record]
+        self._buckets: Dict[str, list] = {}
+
+    def allow(self, event: str) -> Tuple[bool, int]:
+        """Whether to write a record of ``event``, and how many were suppressed before it."""
+        rate = self.rates.get(event)
+        if not rate:
+            return True, 0
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(event)
+            if bucket is None:
+                bucket = self._buckets[event] = [max(rate, 1.0), now, 0]
+            bucket[0] = min(max(rate, 1.0), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1.0:
+                bucket[2] += 1
+                return False, 0
+            bucket[0] -= 1.0
+            suppressed, bucket[2] = bucket[2], 0
+            return True, suppressed
+
+    def set_rates(self, rates: Dict[str, float]) -> None:
+        with self._lock:
+            for event, rate in rates.items():
+                if rate:
+                    self.rates[event] = rate
+                else:
+                    self.rates.pop(event, None)
+                self._buckets.pop(event, None)
+
+    def suppressed(self) -> Dict[str, int]:
+        with self._lock:
+            return {event: bucket[2] for event, bucket in self._buckets.items() if bucket[2]}
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records as they are (formatting happens on the writer thread); drop when full."""
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]") -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class StructuredFormatter(logging.Formatter):
+    """``key=value`` lines (``LOG_FORMAT=kv``) or one JSON object per line (``LOG_FORMAT=json``)."""
+
+    def __init__(self, style: str = "kv") -> None:
+        super().__init__()
+        self.json = style == "json"
+
+    def format(self, record: logging.LogRecord) -> str:
+        ts = datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds")
+        logger = record.name[len(ROOT_LOGGER) + 1:] if record.name.startswith(ROOT_LOGGER + ".") else record.name
+        event = getattr(record, "event", None) or logger
+        fields: Dict[str, Any] = getattr(record, "fields", None) or {}
+        message = record.getMessage()
+        error = self.formatException(record.exc_info) if record.exc_info else None
+        if self.json:
+            document = {"ts": ts, "level": record.levelname, "event": event, "msg": message, **fields}
+            if error:
+                document["exc"] = error
+            return json.dumps(document, default=str, ensure_ascii=False)
+        parts = [ts, record.levelname, event]
+        if message:
+            parts.append(message)
+        parts.extend(f"{key}={value}" for key, value in fields.items())
+        line = " ".join(str(part) for part in parts)
+        return f"{line}\n{error}" if error else line
+
+
+class StructLogger:
+    """``log.info("heartbeat", "💖 Heartbeat", device_id=5, rssi=-61)``"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._logger = logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+    def _log(self, level: int, event: str, message: str, fields: Dict[str, Any], exc_info: bool = False) -> None:
+        if not self._logger.isEnabledFor(level):
+            return
+        if level < logging.WARNING:
+            allowed, suppressed = sampler.allow(f"{self.name}.{event}")
+            if not allowed:
+                return
+            if suppressed:
+                fields["suppressed"] = suppressed
+        self._logger.log(
+            level, message, exc_info=exc_info, extra={"event": f"{self.name}.{event}", "fields": fields}
+        )
+
+    def debug(self, event: str, message: str = "", **fields: Any) -> None:
+        self._log(logging.DEBUG, event, message, fields)
+
+    def info(self, event: str, message: str = "", **fields: Any) -> None:
+        self._log(logging.INFO, event, message, fields)
+
+    def warning(self, event: str, message: str = "", **fields: Any) -> None:
+        self._log(logging.WARNING, event, message, fields)
+
+    def error(self, event: str, message: str = "", **fields: Any) -> None:
+        self._log(logging.ERROR, event, message, fields)
+
+    def exception(self, event: str, message: str = "", **fields: Any) -> None:
+        """Error record with the current exception's traceback."""
+        self._log(logging.ERROR, event, message, fields, exc_info=True)
+
+
+sampler = EventSampler({**DEFAULT_SAMPLE_RATES, **parse_rates(os.getenv("LOG_SAMPLE_RATES", ""))})
+_queue_handler: Optional[_DroppingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def get_logger(name: str) -> StructLogger:
+    return StructLogger(name)
+
+
+def setup_logging() -> None:
+    """Attach the queue handler and start the writer thread (idempotent)."""
+    global _queue_handler, _listener
+    if _listener is not None:
+        return
+    formatter = StructuredFormatter(os.getenv("LOG_FORMAT", "kv").lower())
+    handlers = [logging.StreamHandler(sys.stdout)]
+    log_file = os.getenv("LOG_FILE")
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file,
+            maxBytes=int(float(os.getenv("LOG_MAX_MB", "50")) * 1024 * 1024),
+            backupCount=int(os.getenv("LOG_BACKUPS", "5")),
+            encoding="utf-8",
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    _queue_handler = _DroppingQueueHandler(queue.Queue(int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    root.addHandler(_queue_handler)
+    root.propagate = False
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=False)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Flush the queue and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def set_level(name: str, level: str) -> None:
+    """Level of ``vfd.<name>`` (empty name: all structured loggers)."""
+    level = level.upper()
+    if level not in LEVELS:
+        raise ValueError(f"level must be one of {', '.join(LEVELS)}")
+    logging.getLogger(f"{ROOT_LOGGER}.{name}" if name else ROOT_LOGGER).setLevel(level)
+
+
+def logging_snapshot() -> Dict[str, Any]:
+    root = logging.getLogger(ROOT_LOGGER)
+    levels = {"": logging.getLevelName(root.level)}
+    for name, logger in logging.Logger.manager.loggerDict.items():
+        if name.startswith(ROOT_LOGGER + ".") and isinstance(logger, logging.Logger) and logger.level:
+            levels[name[len(ROOT_LOGGER) + 1:]] = logging.getLevelName(logger.level)
+    log_queue = _queue_handler.queue if _queue_handler is not None else None
+    return {
+        "levels": levels,
+        "sample_rates": dict(sampler.rates),
+        "suppressed": sampler.suppressed(),
+        "queue": {
+            "pending": log_queue.qsize() if log_queue is not None else 0,
+            "capacity": log_queue.maxsize if log_queue is not None else 0,
+            "dropped": _queue_handler.dropped if _queue_handler is not None else 0,
+        },
+        "file": os.getenv("LOG_FILE"),
+    }
@@ -1,49 +1,171 @@
-from fastapi import FastAPI, Depends, HTTPException, Header, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Depends, HTTPException, Header, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sqlalchemy import func, insert, text
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from database import engine, get_db, Base
-from models import Device as DeviceModel, User as UserModel, SensorReading as SensorReadingModel, VFDReading as VFDReadingModel
+from database import engine, get_db, Base, SessionLocal, SLOW_QUERY_THRESHOLD_MS
+from models import Device as DeviceModel, User as UserModel, SensorReading as SensorReadingModel, VFDReading as VFDReadingModel, Metric as MetricModel, MetricSample as MetricSampleModel, VFDReadingBucket as VFDReadingBucketModel, AnomalyEvent as AnomalyEventModel, AlertRule as AlertRuleModel, Alert as AlertModel, VFDEvent as VFDEventModel
 from schemas import (
     Device, DeviceCreate, DeviceUpdate, HealthCheck, DeviceStatus,
     UserLogin, LoginResponse, UserBase, UserWithDevices,
     SensorReading, SensorReadingCreate,
-    VFDReading, VFDReadingCreate
+    VFDReading, VFDReadingCreate,
+    ModbusTopology, Metric, MetricSeries, DeviceAnalytics, AnomalyEvent,
+    AlertRule, AlertRuleCreate, Alert, VFDEvent, VFDTimeline, LoggingConfig
 )
 from typing import Dict, List, Optional
+import csv
 import hashlib
+import heapq
+import io
 import os
 import jwt
 from datetime import datetime, timedelta, timezone
 import json
 import asyncio
+import time
 import uuid
 import uvicorn
-from modbus_polling import ModbusPoller
+from modbus_scheduler import (
+    ModbusScheduler, load_topology_db, load_topology_file, migrate_modbus_slave_columns, save_topology_db,
+    single_bus_topology,
+)
+from modbus_process import ModbusProcessRunner
+from register_plans import get_register_plans
+from custom_data import (
+    custom_data_filter, custom_data_matches, ensure_custom_data_indexes, migrate_custom_data_columns, to_document, to_text
+)
+from perf_monitoring import EventLoopWatchdog, LATENCY_BUCKETS_MS, RequestTimingMiddleware, route_latency, slow_queries
+from telemetry_filter import storage_filter
+from vfd_archive import archive_summary, archived_vfd_readings, compact_vfd_readings, iter_archived_rows, reading_row, with_archived_readings
+from cold_archive import ColdArchive, move_to_cold_archive, with_cold_readings
+from analytics import device_analytics
+from alert_rules import (
+    alert_engine, alert_message, load_alert_rules, numeric_fields, publish_alerts, record_alerts, validate_rule
+)
+from anomaly import anomaly_message, anomaly_monitor, record_anomalies
+from vfd_events import interval_summary, record_vfd_transition, vfd_state_tracker
+from metric_store import (
+    AGGREGATES, insert_metric_samples, list_metrics, metric_catalog, metric_sample_rows, query_metric_series, write_metric_sample
+)
+from ingest_seq import lock_cursor, parse_samples, sample_timestamp, save_cursor, split_new
+from flow_control import ReportRateController
+from bulk_ingest import SENSOR_TABLE, VFD_TABLE, BulkIngestError, BulkTable, bulk_copy
+from spool import ReadingSpool, replay_records
+from log_setup import get_logger, logging_snapshot, sampler, set_level, setup_logging
+
+# Hot paths (device WebSockets, ingest) log through the queued structured logger.
+setup_logging()
+ws_log = get_logger("ws")
+esp32_log = get_logger("esp32")
+rs485_log = get_logger("rs485")
+ingest_log = get_logger("ingest")
 
 # Create tables
 Base.metadata.create_all(bind=engine)
 
+# custom_data became JSONB; convert text columns of databases created before that.
+for converted_table in migrate_custom_data_columns(engine, ("vfd_readings", "sensor_readings")):
+    print(f"✅ Converted {converted_table}.custom_data to JSONB")
+for migrated in migrate_modbus_slave_columns(engine):
+    print(f"✅ Migrated modbus_slaves: {migrated}")
+
+# Optional custom_data indexes: GIN for containment/key filters and numeric
+# expression indexes for range filters on the listed keys (e.g. "rssi,uptime").
+CUSTOM_DATA_GIN_INDEX = os.getenv("CUSTOM_DATA_GIN_INDEX", "0").lower() in {"1", "true", "yes", "on"}
+CUSTOM_DATA_INDEX_KEYS = [key.strip() for key in os.getenv("CUSTOM_DATA_INDEX_KEYS", "").split(",") if key.strip()]
+if CUSTOM_DATA_GIN_INDEX or CUSTOM_DATA_INDEX_KEYS:
+    for indexed_model in (VFDReadingModel, SensorReadingModel):
+        for index_name in ensure_custom_data_indexes(engine, indexed_model, CUSTOM_DATA_GIN_INDEX, CUSTOM_DATA_INDEX_KEYS):
+            print(f"✅ Created index {index_name}")
+
 app = FastAPI(title="Device Management API", version="1.0.0")
 
 HEARTBEAT_CHECK_INTERVAL_SECONDS = int(os.getenv("HEARTBEAT_CHECK_INTERVAL_SECONDS", "15"))
 HEARTBEAT_WARNING_SECONDS = int(os.getenv("HEARTBEAT_WARNING_SECONDS", "60"))
 HEARTBEAT_OFFLINE_SECONDS = int(os.getenv("HEARTBEAT_OFFLINE_SECONDS", "120"))
 
+# Compressed archive: vfd_readings older than the hot window are packed into
+# per-device bucket rows (vfd_reading_buckets). Reads always include archived rows.
+VFD_ARCHIVE_ENABLED = os.getenv("VFD_ARCHIVE_ENABLED", "0").lower() in {"1", "true", "yes", "on"}
+VFD_ARCHIVE_HOT_HOURS = float(os.getenv("VFD_ARCHIVE_HOT_HOURS", "24"))
+VFD_ARCHIVE_BUCKET_SECONDS = int(os.getenv("VFD_ARCHIVE_BUCKET_SECONDS", "3600"))
+VFD_ARCHIVE_INTERVAL_SECONDS = int(os.getenv("VFD_ARCHIVE_INTERVAL_SECONDS", "600"))
+VFD_ARCHIVE_BATCH_ROWS = int(os.getenv("VFD_ARCHIVE_BATCH_ROWS", "20000"))
+vfd_archive_state = {"last_run": None, "last_result": None, "total_rows": 0}
+
+# Cold tier: readings older than VFD_COLD_AFTER_DAYS leave PostgreSQL for mmap'd
+# segment files (one per device per day) under VFD_COLD_DIR. 0 disables moving.
+VFD_COLD_AFTER_DAYS = int(os.getenv("VFD_COLD_AFTER_DAYS", "0"))
+VFD_COLD_DIR = os.getenv("VFD_COLD_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "vfd_cold"))
+cold_archive = ColdArchive(VFD_COLD_DIR)
+vfd_cold_state = {"last_run": None, "last_result": None, "total_rows": 0}
+
+# Most samples accepted in one batched ESP32 sensor_data frame.
+ESP32_MAX_BATCH_SAMPLES = int(os.getenv("ESP32_MAX_BATCH_SAMPLES", "500"))
+
+# Server-driven ESP32 reporting rate: under ingest pressure the report interval
+# and batch size are doubled per level, up to the maximums.
+flow_controller = ReportRateController(
+    enabled=os.getenv("FLOW_CONTROL_ENABLED", "1").lower() in {"1", "true", "yes", "on"},
+    base_interval_ms=int(os.getenv("ESP32_REPORT_INTERVAL_MS", "1000")),
+    max_interval_ms=int(os.getenv("ESP32_MAX_REPORT_INTERVAL_MS", "30000")),
+    base_batch_size=int(os.getenv("ESP32_BATCH_SIZE", "1")),
+    max_batch_size=min(int(os.getenv("ESP32_MAX_BATCH_SIZE", "60")), ESP32_MAX_BATCH_SAMPLES),
+    target_ms=float(os.getenv("FLOW_TARGET_FRAME_MS", "200")),
+    max_backlog=int(os.getenv("FLOW_MAX_WRITER_BACKLOG", "5000")),
+)
+FLOW_CONTROL_INTERVAL_SECONDS = float(os.getenv("FLOW_CONTROL_INTERVAL_SECONDS", "5"))
+
+# Local spool for ESP32 readings while PostgreSQL is unavailable; replayed once it answers again.
+reading_spool = ReadingSpool(
+    os.getenv("SPOOL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "spool")),
+    enabled=os.getenv("SPOOL_ENABLED", "1").lower() in {"1", "true", "yes", "on"},
+    segment_bytes=int(os.getenv("SPOOL_SEGMENT_MB", "16")) * 1024 * 1024,
+    fsync=os.getenv("SPOOL_FSYNC", "interval"),
+    fsync_interval_s=float(os.getenv("SPOOL_FSYNC_INTERVAL_MS", "1000")) / 1000.0,
+)
+SPOOL_REPLAY_INTERVAL_SECONDS = float(os.getenv("SPOOL_REPLAY_INTERVAL_SECONDS", "5"))
+SPOOL_REPLAY_BATCH = int(os.getenv("SPOOL_REPLAY_BATCH", "500"))
+
+# How often devices are checked against "no_data" alert rules.
+ALERT_SILENCE_CHECK_SECONDS = float(os.getenv("ALERT_SILENCE_CHECK_SECONDS", "5"))
+
+# Bulk uploads: columnar JSON is parsed whole, so its size is capped (NDJSON is streamed).
+BULK_MAX_JSON_BYTES = int(os.getenv("BULK_MAX_JSON_MB", "64")) * 1024 * 1024
+
+# Analytics: rows further apart than this are not assumed to hold their state in between.
+ANALYTICS_MAX_GAP_SECONDS = float(os.getenv("ANALYTICS_MAX_GAP_SECONDS", "300"))
+ANALYTICS_MAX_BUCKETS = int(os.getenv("ANALYTICS_MAX_BUCKETS", "2000"))
+
 MODBUS_ENABLED = os.getenv("MODBUS_ENABLED", "0").lower() in {"1", "true", "yes", "on"}
 MODBUS_PORT = os.getenv("MODBUS_PORT", "COM5" if os.name == "nt" else "/dev/ttyUSB0")
 MODBUS_BAUDRATE = int(os.getenv("MODBUS_BAUDRATE", "9600"))
 MODBUS_SLAVE_ID = int(os.getenv("MODBUS_SLAVE_ID", "1"))
 MODBUS_POLL_INTERVAL_MS = int(os.getenv("MODBUS_POLL_INTERVAL_MS", "1000"))
 MODBUS_BRAND = os.getenv("MODBUS_BRAND", "teco")
+# Max unused registers bridged when merging adjacent addresses into one block read.
+MODBUS_MAX_BLOCK_GAP = int(os.getenv("MODBUS_MAX_BLOCK_GAP", "8"))
+# Slave turnaround allowance; frame transmission time is added from the baud rate.
+MODBUS_RESPONSE_TIMEOUT_MS = int(os.getenv("MODBUS_RESPONSE_TIMEOUT_MS", "100"))
 MODBUS_DEVICE_ID = os.getenv("MODBUS_DEVICE_ID")
 MODBUS_DEVICE_ID = int(MODBUS_DEVICE_ID) if MODBUS_DEVICE_ID else None
+# Multi-bus topology: path to a JSON file, or "db" for the modbus_slaves table.
+# When unset, a single bus is built from the MODBUS_* settings above.
+MODBUS_TOPOLOGY = os.getenv("MODBUS_TOPOLOGY", "").strip()
+# Run the bus workers in a separate process that shares latest values through
+# shared memory and writes readings in batches.
+MODBUS_PROCESS_MODE = os.getenv("MODBUS_PROCESS_MODE", "0").lower() in {"1", "true", "yes", "on"}
+MODBUS_PERSIST_BATCH_SIZE = int(os.getenv("MODBUS_PERSIST_BATCH_SIZE", "200"))
+MODBUS_PERSIST_FLUSH_MS = int(os.getenv("MODBUS_PERSIST_FLUSH_MS", "1000"))
 MODBUS_REGISTER_PATH = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "..", "frontend", "public", "vfd_brand_model_registers.json")
 )
 
+register_plans = get_register_plans(MODBUS_REGISTER_PATH)
+
 # Static ESP32 test device configuration (kept in sync with ESP32 firmware)
 TEST_ESP32_DEVICE_ID = 1
 TEST_ESP32_DEVICE_NAME = "Testing"
@@ -80,6 +202,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency histograms (see /admin/metrics/requests)
+app.add_middleware(RequestTimingMiddleware)
+
+# Event-loop lag watchdog (opt-in; see /admin/metrics/event-loop)
+LOOP_WATCHDOG_ENABLED = os.getenv("LOOP_WATCHDOG_ENABLED", "0").lower() in {"1", "true", "yes", "on"}
+loop_watchdog = EventLoopWatchdog(
+    interval_ms=float(os.getenv("LOOP_LAG_INTERVAL_MS", "50")),
+    threshold_ms=float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100")),
+)
+
 
 # ==================== WebSocket Connection Manager ====================
 class ConnectionManager:
@@ -94,14 +226,14 @@ class ConnectionManager:
         if device_id not in self.active_connections:
             self.active_connections[device_id] = []
         self.active_connections[device_id].append(websocket)
-        print(f"✅ WebSocket connected for device {device_id}. Total connections: {len(self.active_connections[device_id])}")
+        ws_log.info("connect", "✅ Client connected", device_id=device_id, connections=len(self.active_connections[device_id]))
     
     def disconnect(self, websocket: WebSocket, device_id: int):
         """Remove a WebSocket connection"""
         if device_id in self.active_connections:
             if websocket in self.active_connections[device_id]:
                 self.active_connections[device_id].remove(websocket)
-                print(f"❌ WebSocket disconnected for device {device_id}. Remaining: {len(self.active_connections[device_id])}")
+                ws_log.info("disconnect", "❌ Client disconnected", device_id=device_id, connections=len(self.active_connections[device_id]))
             if len(self.active_connections[device_id]) == 0:
                 del self.active_connections[device_id]
     
@@ -113,7 +245,7 @@ class ConnectionManager:
                 try:
                     await connection.send_json(message)
                 except Exception as e:
-                    print(f"⚠️ Error sending to client: {e}")
+                    ws_log.warning("send_failed", "⚠️ Error sending to client", device_id=device_id, error=str(e))
                     disconnected.append(connection)
             
             # Clean up disconnected clients
@@ -123,6 +255,35 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+
+@app.on_event("startup")
+async def bind_event_notifiers():
+    """Load alert rules and push anomalies/alerts raised off the event loop to WebSocket clients"""
+    loop = asyncio.get_running_loop()
+
+    def notifier(to_message):
+        def notify(event: Dict) -> None:
+            asyncio.run_coroutine_threadsafe(manager.broadcast_to_device(event["device_id"], to_message(event)), loop)
+        return notify
+
+    anomaly_monitor.notifier = notifier(anomaly_message)
+    alert_engine.notifier = notifier(alert_message)
+    db = SessionLocal()
+    try:
+        alert_engine.load(*load_alert_rules(db))
+        print(f"🔔 Loaded {alert_engine.rule_count} alert rule(s)")
+    finally:
+        db.close()
+
+
+def reload_alert_rules(db: Session) -> None:
+    """Recompile the alert engine (and the poller process's copy) after a rule change."""
+    rules, firing = load_alert_rules(db)
+    alert_engine.load(rules, firing)
+    scheduler = getattr(app.state, "modbus_scheduler", None)
+    if isinstance(scheduler, ModbusProcessRunner):
+        scheduler.update_alert_rules(rules)
+
 # Track active ESP32 WebSocket sessions per device to avoid false offline flips
 # when a stale socket closes right after a successful reconnect.
 esp32_connection_counts: Dict[int, int] = {}
@@ -249,22 +410,43 @@ def ensure_default_user():
         db.close()
 
     if MODBUS_ENABLED:
-        poller = ModbusPoller(
-            port=MODBUS_PORT,
-            baudrate=MODBUS_BAUDRATE,
-            slave_id=MODBUS_SLAVE_ID,
-            poll_interval_ms=MODBUS_POLL_INTERVAL_MS,
-            register_source_path=MODBUS_REGISTER_PATH,
-            brand_key=MODBUS_BRAND,
-            device_id=MODBUS_DEVICE_ID,
-        )
-        poller.start()
-        app.state.modbus_poller = poller
-        print(f"✅ Modbus poller enabled on port {MODBUS_PORT}")
+        if MODBUS_PROCESS_MODE:
+            scheduler = ModbusProcessRunner(MODBUS_REGISTER_PATH, MODBUS_PERSIST_BATCH_SIZE, MODBUS_PERSIST_FLUSH_MS)
+        else:
+            scheduler = ModbusScheduler(MODBUS_REGISTER_PATH)
+        try:
+            changes = scheduler.apply(load_modbus_topology())
+            app.state.modbus_scheduler = scheduler
+            mode = "poller process" if MODBUS_PROCESS_MODE else "in-process"
+            print(f"✅ Modbus polling enabled ({mode}) on port(s): {', '.join(changes['started']) or 'none'}")
+        except Exception as e:
+            print(f"⚠️ Modbus topology load failed: {e}")
     else:
         print("ℹ️ Modbus poller disabled (set MODBUS_ENABLED=1 to enable)")
 
 
+def load_modbus_topology():
+    """Load Modbus buses from MODBUS_TOPOLOGY (file or DB) or the legacy MODBUS_* settings."""
+    if MODBUS_TOPOLOGY.lower() == "db":
+        db = SessionLocal()
+        try:
+            return load_topology_db(db, MODBUS_MAX_BLOCK_GAP, MODBUS_RESPONSE_TIMEOUT_MS)
+        finally:
+            db.close()
+    if MODBUS_TOPOLOGY:
+        return load_topology_file(MODBUS_TOPOLOGY, MODBUS_MAX_BLOCK_GAP, MODBUS_RESPONSE_TIMEOUT_MS)
+    return single_bus_topology(
+        port=MODBUS_PORT,
+        baudrate=MODBUS_BAUDRATE,
+        slave_id=MODBUS_SLAVE_ID,
+        brand_key=MODBUS_BRAND,
+        device_id=MODBUS_DEVICE_ID,
+        poll_interval_ms=MODBUS_POLL_INTERVAL_MS,
+        max_gap=MODBUS_MAX_BLOCK_GAP,
+        response_timeout_ms=MODBUS_RESPONSE_TIMEOUT_MS,
+    )
+
+
 @app.on_event("startup")
 def ensure_testing_device():
     """
@@ -326,9 +508,20 @@ def ensure_testing_device():
 
 @app.on_event("shutdown")
 def stop_modbus_poller():
-    poller = getattr(app.state, "modbus_poller", None)
-    if poller:
-        poller.stop()
+    scheduler = getattr(app.state, "modbus_scheduler", None)
+    if scheduler:
+        scheduler.stop()
+
+
+@app.on_event("shutdown")
+def close_reading_spool():
+    if reading_spool.enabled:
+        reading_spool.close()
+
+
+@app.on_event("shutdown")
+def stop_loop_watchdog():
+    loop_watchdog.stop()
 
 
 async def check_device_heartbeats():
@@ -349,6 +542,7 @@ async def check_device_heartbeats():
 
                 if seconds_since_heartbeat > HEARTBEAT_OFFLINE_SECONDS and device.is_online:
                     device.is_online = False
+                    record_vfd_transition(db, vfd_state_tracker.offline(device.id))
                     has_changes = True
                     print(
                         f"⚠️ Device {device.id} marked offline "
@@ -364,11 +558,182 @@ async def check_device_heartbeats():
             await asyncio.sleep(HEARTBEAT_CHECK_INTERVAL_SECONDS)
 
 
+def run_vfd_archive_compaction() -> Dict:
+    """Compact every vfd_readings row older than the hot window, one batch per transaction."""
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=VFD_ARCHIVE_HOT_HOURS)
+    result = {"rows": 0, "buckets": 0, "bytes": 0}
+    db = SessionLocal()
+    try:
+        while True:
+            batch = compact_vfd_readings(db, cutoff, VFD_ARCHIVE_BUCKET_SECONDS, VFD_ARCHIVE_BATCH_ROWS)
+            for key in result:
+                result[key] += batch[key]
+            if batch["rows"] < VFD_ARCHIVE_BATCH_ROWS:
+                break
+    finally:
+        db.close()
+    vfd_archive_state["last_run"] = datetime.now(timezone.utc).isoformat()
+    vfd_archive_state["last_result"] = result
+    vfd_archive_state["total_rows"] += result["rows"]
+    if result["rows"]:
+        print(f"🗜️ Archived {result['rows']} VFD readings into {result['buckets']} buckets ({result['bytes']} bytes)")
+    return result
+
+
+def run_vfd_cold_move() -> Dict:
+    """Move readings older than VFD_COLD_AFTER_DAYS (whole UTC days) into cold segment files."""
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    cutoff = today - timedelta(days=VFD_COLD_AFTER_DAYS)
+    db = SessionLocal()
+    try:
+        result = move_to_cold_archive(db, cold_archive, cutoff)
+    finally:
+        db.close()
+    vfd_cold_state["last_run"] = datetime.now(timezone.utc).isoformat()
+    vfd_cold_state["last_result"] = result
+    vfd_cold_state["total_rows"] += result["rows"]
+    if result["rows"]:
+        print(f"🧊 Moved {result['rows']} VFD readings to {result['segments']} cold segments ({result['bytes']} bytes)")
+    return result
+
+
+async def check_alert_silence():
+    """Background task firing "no_data" alert rules for devices that stopped reporting."""
+    while True:
+        await asyncio.sleep(ALERT_SILENCE_CHECK_SECONDS)
+        try:
+            events = alert_engine.check_silence()
+            if events:
+                await asyncio.to_thread(publish_alerts, events)
+        except Exception as e:
+            print(f"❌ Error in alert silence check: {e}")
+
+
+def db_pool_usage() -> Optional[float]:
+    """Share of the connection pool (including overflow) currently checked out."""
+    pool = engine.pool
+    try:
+        capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+        return pool.checkedout() / capacity if capacity > 0 else None
+    except AttributeError:
+        return None
+
+
+def modbus_writer_backlog() -> Optional[int]:
+    """Rows queued in the poller process's batch writer (None in thread mode)."""
+    scheduler = getattr(app.state, "modbus_scheduler", None)
+    if not isinstance(scheduler, ModbusProcessRunner):
+        return None
+    for bus in scheduler.status():
+        if bus.get("writer"):
+            return bus["writer"].get("pending")
+    return None
+
+
+async def control_report_rate():
+    """Background task adjusting the ESP32 report interval/batch size from ingest pressure."""
+    while True:
+        await asyncio.sleep(FLOW_CONTROL_INTERVAL_SECONDS)
+        try:
+            if flow_controller.update(db_pool_usage(), modbus_writer_backlog()):
+                config = flow_controller.config()
+                sent = await flow_controller.broadcast_config()
+                print(
+                    f"🚦 ESP32 report rate level {config['level']} (pressure {flow_controller.pressure:.2f}): "
+                    f"{config['report_interval_ms']} ms, batch {config['batch_size']} -> {sent} device(s)"
+                )
+        except Exception as e:
+            print(f"❌ Error in report rate controller: {e}")
+
+
+def database_reachable() -> bool:
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return True
+    except Exception as e:
+        reading_spool.last_error = str(e)
+        return False
+
+
+def run_spool_replay() -> int:
+    """Replay spooled records into the database, one transaction per batch; returns records replayed."""
+    total = 0
+    while True:
+        records, position = reading_spool.read_batch(SPOOL_REPLAY_BATCH)
+        if not records:
+            return total
+        db = SessionLocal()
+        try:
+            replay_records(db, records)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        reading_spool.commit(position, len(records))
+        total += len(records)
+
+
+async def replay_reading_spool():
+    """Background task: sync the spool, probe the database while it is down, and drain the spool once it is back."""
+    while True:
+        await asyncio.sleep(SPOOL_REPLAY_INTERVAL_SECONDS)
+        try:
+            reading_spool.flush_if_due()
+            if not reading_spool.db_available:
+                if not await asyncio.to_thread(database_reachable):
+                    continue
+                reading_spool.db_available = True
+                print(f"✅ Database reachable again; replaying {reading_spool.pending()} spooled record(s)")
+            if reading_spool.pending():
+                replayed = await asyncio.to_thread(run_spool_replay)
+                print(f"📼 Replayed {replayed} spooled record(s)")
+        except Exception as e:
+            reading_spool.fallback(e)
+            print(f"❌ Error in spool replay task: {e}")
+
+
+async def compact_vfd_archive():
+    """Background task moving old VFD readings into compressed bucket rows and cold segments."""
+    while True:
+        try:
+            if VFD_ARCHIVE_ENABLED:
+                await asyncio.to_thread(run_vfd_archive_compaction)
+            if VFD_COLD_AFTER_DAYS > 0:
+                await asyncio.to_thread(run_vfd_cold_move)
+        except Exception as e:
+            print(f"❌ Error in VFD archive task: {e}")
+        await asyncio.sleep(VFD_ARCHIVE_INTERVAL_SECONDS)
+
+
 # Start background heartbeat checker when app starts
 @app.on_event("startup")
 async def startup_background_tasks():
-    """Create background task for device heartbeat monitoring"""
+    """Create background tasks for device heartbeat monitoring, alert silence checks and VFD archiving"""
     asyncio.create_task(check_device_heartbeats())
+    asyncio.create_task(check_alert_silence())
+    if flow_controller.enabled:
+        asyncio.create_task(control_report_rate())
+    if reading_spool.enabled:
+        reading_spool.open()
+        asyncio.create_task(replay_reading_spool())
+    if LOOP_WATCHDOG_ENABLED:
+        print(
+            f"🐌 Event-loop watchdog enabled (every {loop_watchdog.interval_ms:g}ms, "
+            f"stalls over {loop_watchdog.threshold_ms:g}ms)"
+        )
+        asyncio.create_task(loop_watchdog.run())
+    if VFD_ARCHIVE_ENABLED:
+        print(
+            f"🗜️ VFD archive enabled (hot window {VFD_ARCHIVE_HOT_HOURS}h, "
+            f"{VFD_ARCHIVE_BUCKET_SECONDS}s buckets)"
+        )
+    if VFD_COLD_AFTER_DAYS > 0:
+        print(f"🧊 VFD cold tier enabled (after {VFD_COLD_AFTER_DAYS} days, {VFD_COLD_DIR})")
+    if VFD_ARCHIVE_ENABLED or VFD_COLD_AFTER_DAYS > 0:
+        asyncio.create_task(compact_vfd_archive())
 
 
 # Health check endpoint
@@ -377,10 +742,37 @@ def health_check():
     """Check API health status"""
     return HealthCheck(status="healthy", message="API is running")
 
-# Public static file needed by frontend builds
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    return bool(if_none_match) and etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+def etag_response(body: Optional[bytes], etag: str) -> Response:
+    """JSON response carrying an ETag, or 304 Not Modified when ``body`` is None."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if body is None:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# Public register map needed by frontend builds, served from the compiled plan cache
 @app.get("/vfd_brand_model_registers.json", include_in_schema=False)
-def vfd_brand_model_registers_json():
-    return FileResponse(MODBUS_REGISTER_PATH, media_type="application/json")
+def vfd_brand_model_registers_json(if_none_match: Optional[str] = Header(None)):
+    body, etag = register_plans.payload()
+    return etag_response(None if etag_matches(if_none_match, etag) else body, etag)
+
+
+@app.get("/vfd/register-plans/{brand}", tags=["VFD"])
+def get_register_plan(brand: str, if_none_match: Optional[str] = Header(None)):
+    """Compiled register plan of one brand: registers, field mapping and block-read layout"""
+    plan = register_plans.get(brand)
+    if plan is None:
+        raise HTTPException(status_code=404, detail=f"Brand '{brand}' not found in register map")
+    _, map_etag = register_plans.payload()
+    # Derived from the map version and block gap, so it changes whenever either does.
+    etag = f'"{map_etag.strip(chr(34))}-{brand}-{MODBUS_MAX_BLOCK_GAP}"'
+    if etag_matches(if_none_match, etag):
+        return etag_response(None, etag)
+    return etag_response(json.dumps(plan.to_dict(MODBUS_MAX_BLOCK_GAP), separators=(",", ":")).encode("utf-8"), etag)
 
 # API root endpoint (keep separate from frontend "/")
 @app.get("/api", include_in_schema=False)
@@ -511,6 +903,10 @@ def delete_device(
     
     db.delete(db_device)
     db.commit()
+    cold_archive.delete_device(device_id)
+    anomaly_monitor.forget(device_id)
+    alert_engine.forget(device_id)
+    vfd_state_tracker.forget(device_id)
     return {"message": "Device deleted successfully", "id": device_id}
 
 
@@ -628,8 +1024,189 @@ def get_system_stats(
     }
 
 
+@app.get("/admin/metrics/requests", tags=["Admin"])
+def get_request_metrics(admin: UserModel = Depends(get_admin_user)):
+    """Per-route latency histograms collected by RequestTimingMiddleware (Admin only)"""
+    return {"buckets_ms": list(LATENCY_BUCKETS_MS), "routes": route_latency.snapshot()}
+
+
+@app.get("/admin/metrics/slow-queries", tags=["Admin"])
+def get_slow_queries(admin: UserModel = Depends(get_admin_user)):
+    """Recent SQL statements that exceeded SLOW_QUERY_THRESHOLD_MS (Admin only)"""
+    return {"threshold_ms": SLOW_QUERY_THRESHOLD_MS, **slow_queries.snapshot()}
+
+
+@app.get("/admin/metrics/event-loop", tags=["Admin"])
+def get_event_loop_metrics(reset: bool = False, admin: UserModel = Depends(get_admin_user)):
+    """
+    Event-loop lag histogram and the code that blocked the loop (Admin only).
+
+    Needs LOOP_WATCHDOG_ENABLED=1. Offenders are grouped by the innermost
+    backend frame on the loop thread during the stall, worst total first.
+    With ``reset=true`` the counters restart after this snapshot.
+    """
+    snapshot = {"enabled": LOOP_WATCHDOG_ENABLED, **loop_watchdog.snapshot()}
+    if reset:
+        loop_watchdog.reset()
+    return snapshot
+
+
+@app.get("/admin/vfd-archive", tags=["Admin"])
+def get_vfd_archive_status(db: Session = Depends(get_db), admin: UserModel = Depends(get_admin_user)):
+    """Compressed VFD archive configuration, last compaction run and storage totals (Admin only)"""
+    return {
+        "enabled": VFD_ARCHIVE_ENABLED,
+        "hot_hours": VFD_ARCHIVE_HOT_HOURS,
+        "bucket_seconds": VFD_ARCHIVE_BUCKET_SECONDS,
+        **vfd_archive_state,
+        **archive_summary(db),
+        "cold": {"after_days": VFD_COLD_AFTER_DAYS, **vfd_cold_state, **cold_archive.summary()},
+    }
+
+
+@app.post("/admin/vfd-archive/compact", tags=["Admin"])
+async def compact_vfd_archive_now(admin: UserModel = Depends(get_admin_user)):
+    """Run one archive compaction pass now (Admin only)"""
+    return await asyncio.to_thread(run_vfd_archive_compaction)
+
+
+@app.post("/admin/vfd-archive/cold-move", tags=["Admin"])
+async def move_vfd_cold_now(admin: UserModel = Depends(get_admin_user)):
+    """Move readings past VFD_COLD_AFTER_DAYS into cold segment files now (Admin only)"""
+    if VFD_COLD_AFTER_DAYS <= 0:
+        raise HTTPException(status_code=409, detail="Cold tier is disabled (set VFD_COLD_AFTER_DAYS)")
+    return await asyncio.to_thread(run_vfd_cold_move)
+
+
+@app.get("/admin/metrics/storage-filter", tags=["Admin"])
+def get_storage_filter_metrics(admin: UserModel = Depends(get_admin_user)):
+    """Telemetry rows stored vs. suppressed by the deadband filter, per source (Admin only)"""
+    return storage_filter.snapshot()
+
+
+@app.get("/admin/metrics/alerts", tags=["Admin"])
+def get_alert_metrics(admin: UserModel = Depends(get_admin_user)):
+    """Loaded alert rules, firing alerts and evaluation counters (Admin only)"""
+    return alert_engine.snapshot()
+
+
+@app.get("/admin/flow-control", tags=["Admin"])
+def get_flow_control(admin: UserModel = Depends(get_admin_user)):
+    """ESP32 report rate controller: level, pressure signals and the current config downlink (Admin only)"""
+    return flow_controller.snapshot()
+
+
+@app.put("/admin/flow-control", tags=["Admin"])
+async def set_flow_control(level: Optional[int] = None, admin: UserModel = Depends(get_admin_user)):
+    """Pin the report rate level (omit ``level`` to return to automatic control) and push it to devices (Admin only)"""
+    if level is not None and not 0 <= level <= flow_controller.max_level:
+        raise HTTPException(status_code=400, detail=f"level must be between 0 and {flow_controller.max_level}")
+    flow_controller.pinned_level = level
+    if level is not None and level != flow_controller.level:
+        flow_controller.level = level
+        flow_controller.level_changes += 1
+        await flow_controller.broadcast_config()
+    return flow_controller.snapshot()
+
+
+@app.get("/admin/logging", tags=["Admin"])
+def get_logging_config(admin: UserModel = Depends(get_admin_user)):
+    """Structured log levels, sample rates, suppressed counts and writer queue state (Admin only)"""
+    return logging_snapshot()
+
+
+@app.put("/admin/logging", tags=["Admin"])
+def update_logging_config(config: LoggingConfig, admin: UserModel = Depends(get_admin_user)):
+    """Change log levels and per-event sample rates at runtime (Admin only)"""
+    try:
+        for name, level in config.levels.items():
+            set_level(name, level)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    sampler.set_rates(config.sample_rates)
+    return logging_snapshot()
+
+
+@app.get("/admin/metrics/spool", tags=["Admin"])
+def get_spool_metrics(admin: UserModel = Depends(get_admin_user)):
+    """Reading spool state: database availability, backlog records/bytes and replay counters (Admin only)"""
+    return reading_spool.snapshot()
+
+
+@app.get("/admin/metrics/anomaly", tags=["Admin"])
+def get_anomaly_metrics(admin: UserModel = Depends(get_admin_user)):
+    """Anomaly detector settings, tracked series and event counters (Admin only)"""
+    return anomaly_monitor.snapshot()
+
+
+def get_modbus_scheduler():
+    scheduler = getattr(app.state, "modbus_scheduler", None)
+    if scheduler is None:
+        raise HTTPException(status_code=409, detail="Modbus polling is disabled (set MODBUS_ENABLED=1)")
+    return scheduler
+
+
+@app.get("/admin/modbus/status", tags=["Admin"])
+def get_modbus_status(admin: UserModel = Depends(get_admin_user)):
+    """Running Modbus bus workers and per-slave counters (Admin only)"""
+    return {"buses": get_modbus_scheduler().status()}
+
+
+@app.get("/admin/modbus/health", tags=["Admin"])
+def get_modbus_health(admin: UserModel = Depends(get_admin_user)):
+    """Per-slave and per-register health and circuit breaker state (Admin only)"""
+    return {
+        "slaves": [
+            {"port": bus["port"], "slave_id": slave["slave_id"], "device_id": slave["device_id"], **slave["health"]}
+            for bus in get_modbus_scheduler().status()
+            for slave in bus["slaves"]
+        ]
+    }
+
+
+@app.post("/admin/modbus/reload", tags=["Admin"])
+def reload_modbus_topology(admin: UserModel = Depends(get_admin_user)):
+    """Re-read the Modbus topology and apply it without restarting the API (Admin only)"""
+    scheduler = get_modbus_scheduler()
+    try:
+        changes = scheduler.apply(load_modbus_topology())
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid Modbus topology: {e}")
+    return {"message": "Modbus topology applied", **changes}
+
+
+@app.put("/admin/modbus/topology", tags=["Admin"])
+def replace_modbus_topology(
+    topology: ModbusTopology,
+    db: Session = Depends(get_db),
+    admin: UserModel = Depends(get_admin_user)
+):
+    """Replace the DB-defined Modbus topology and apply it (Admin only, MODBUS_TOPOLOGY=db)"""
+    if MODBUS_TOPOLOGY.lower() != "db":
+        raise HTTPException(status_code=409, detail="Modbus topology is not DB-defined (set MODBUS_TOPOLOGY=db)")
+    ports = [bus.port for bus in topology.buses]
+    if len(ports) != len(set(ports)):
+        raise HTTPException(status_code=400, detail="Each serial port may only appear once")
+    save_topology_db(db, topology)
+    changes = get_modbus_scheduler().apply(load_topology_db(db, MODBUS_MAX_BLOCK_GAP, MODBUS_RESPONSE_TIMEOUT_MS))
+    return {"message": "Modbus topology saved", **changes}
+
+
 # ==================== RS485 / SENSOR READING ENDPOINTS ====================
 
+def sensor_sample(reading: SensorReadingModel) -> Dict:
+    """Fields of a sensor reading as seen by alert rules (numeric custom_data keys included)."""
+    return {
+        **numeric_fields(reading.custom_data),
+        "temperature": reading.temperature,
+        "humidity": reading.humidity,
+        "pressure": reading.pressure,
+        "light": reading.light,
+        "motion": reading.motion,
+        "distance": reading.distance,
+    }
+
+
 @app.post("/sensors/readings", response_model=SensorReading, tags=["Sensors"])
 async def create_sensor_reading(
     reading: SensorReadingCreate,
@@ -646,8 +1223,12 @@ async def create_sensor_reading(
             raise HTTPException(status_code=404, detail=f"Device {reading.device_id} not found")
         
         # Create sensor reading
-        db_reading = SensorReadingModel(**reading.dict())
+        reading_data = reading.dict()
+        reading_data["custom_data"] = to_document(reading_data.get("custom_data"))
+        db_reading = SensorReadingModel(**reading_data)
         db.add(db_reading)
+        alerts = alert_engine.observe(reading.device_id, sensor_sample(db_reading))
+        record_alerts(db, alerts)
         db.commit()
         db.refresh(db_reading)
         
@@ -663,18 +1244,90 @@ async def create_sensor_reading(
                 "light": db_reading.light,
                 "motion": db_reading.motion,
                 "distance": db_reading.distance,
-                "custom_data": db_reading.custom_data,
+                "custom_data": to_text(db_reading.custom_data),
                 "timestamp": db_reading.timestamp.isoformat()
             }
         }
         await manager.broadcast_to_device(reading.device_id, message)
+        for event in alerts:
+            await manager.broadcast_to_device(reading.device_id, alert_message(event))
         
-        print(f"📊 Sensor reading saved for device {reading.device_id}")
+        ingest_log.info("sensor_reading", "📊 Sensor reading saved", device_id=reading.device_id)
         return db_reading
         
     except Exception as e:
         db.rollback()
-        print(f"❌ Error saving sensor reading: {e}")
+        ingest_log.error("sensor_reading_failed", "❌ Error saving sensor reading", error=str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def bulk_upload(
+    request: Request,
+    table: BulkTable,
+    device_id: int,
+    skip_invalid: bool,
+    x_device_key: Optional[str],
+    authorization: Optional[str],
+    db: Session,
+) -> Dict:
+    """
+    Shared body of the bulk endpoints. The caller authenticates with the
+    device's key (``X-Device-Key``) or a user token.
+    """
+    device = db.query(DeviceModel).filter(DeviceModel.id == device_id).first()
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    if not (x_device_key and device.device_key and x_device_key == device.device_key):
+        get_current_user(authorization, db)
+    # The COPY runs on its own connection; do not hold this one for the whole upload.
+    db.close()
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    columnar = content_type == "application/json"
+    try:
+        result = await bulk_copy(
+            table, device_id, request.stream(),
+            columnar=columnar, skip_invalid=skip_invalid, max_json_bytes=BULK_MAX_JSON_BYTES,
+        )
+    except BulkIngestError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), "errors": e.errors})
+    except Exception as e:
+        ingest_log.error("bulk_failed", "❌ Bulk upload failed", table=table.name, device_id=device_id, error=str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+    seconds = result["seconds"]
+    result["rows_per_second"] = round(result["rows"] / seconds) if seconds > 0 else None
+    ingest_log.info("bulk", "📦 Bulk upload", table=table.name, device_id=device_id, rows=result["rows"], seconds=seconds)
+    return result
+
+
+@app.post("/devices/{device_id}/sensor-readings:bulk", tags=["Sensors"])
+async def bulk_sensor_readings(
+    device_id: int,
+    request: Request,
+    skip_invalid: bool = False,
+    x_device_key: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Bulk-load sensor readings with PostgreSQL COPY.
+
+    Body: NDJSON (``application/x-ndjson``, one reading object per line,
+    streamed) or columnar JSON (``application/json``, ``{"timestamp": [...],
+    "temperature": [...], ...}``). ``timestamp`` is epoch seconds/ms or ISO
+    8601 (receive time when missing). An invalid row rejects the whole upload
+    unless ``skip_invalid=true``. Alert rules are not evaluated for bulk rows.
+    """
+    return await bulk_upload(request, SENSOR_TABLE, device_id, skip_invalid, x_device_key, authorization, db)
+
+
+def apply_custom_data_filter(query, column, key: Optional[str], op: str, value: Optional[str]):
+    """Narrow ``query`` by one custom_data condition (evaluated in PostgreSQL)."""
+    if not key:
+        return query
+    try:
+        return query.filter(custom_data_filter(column, key, op, value))
+    except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
@@ -682,19 +1335,22 @@ async def create_sensor_reading(
 def get_sensor_readings(
     device_id: int,
     limit: int = 100,
+    data_key: Optional[str] = None,
+    data_op: str = "eq",
+    data_value: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_user)
 ):
-    """Get recent sensor readings for a specific device"""
+    """Get recent sensor readings for a specific device, optionally filtered on a custom_data key"""
     # Verify device exists
     device = db.query(DeviceModel).filter(DeviceModel.id == device_id).first()
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
     
     # Get recent readings
-    readings = db.query(SensorReadingModel).filter(
-        SensorReadingModel.device_id == device_id
-    ).order_by(
+    query = db.query(SensorReadingModel).filter(SensorReadingModel.device_id == device_id)
+    query = apply_custom_data_filter(query, SensorReadingModel.custom_data, data_key, data_op, data_value)
+    readings = query.order_by(
         SensorReadingModel.timestamp.desc()
     ).limit(limit).all()
     
@@ -731,11 +1387,106 @@ def get_latest_sensor_reading(
         "pressure": reading.pressure,
         "light": reading.light,
         "motion": reading.motion,
-        "custom_data": reading.custom_data,
+        "custom_data": to_text(reading.custom_data),
         "timestamp": reading.timestamp
     }
 
 
+# ==================== ALERT RULE ENDPOINTS ====================
+
+def save_alert_rule(db: Session, db_rule: AlertRuleModel, rule: AlertRuleCreate) -> AlertRuleModel:
+    """Validate and store a rule, close alerts it can no longer resolve, then recompile the engine."""
+    rule_data = rule.dict()
+    try:
+        validate_rule(rule_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if rule.device_id is not None and not db.query(DeviceModel).filter(DeviceModel.id == rule.device_id).first():
+        raise HTTPException(status_code=404, detail="Device not found")
+    for field, value in rule_data.items():
+        setattr(db_rule, field, value)
+    db.add(db_rule)
+    db.flush()
+    if not db_rule.enabled:
+        db.query(AlertModel).filter(
+            AlertModel.rule_id == db_rule.id, AlertModel.resolved_at.is_(None)
+        ).update({"resolved_at": datetime.now(timezone.utc)}, synchronize_session=False)
+    db.commit()
+    db.refresh(db_rule)
+    reload_alert_rules(db)
+    return db_rule
+
+
+@app.get("/alert-rules", response_model=List[AlertRule], tags=["Alerts"])
+def get_alert_rules(
+    device_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """List alert rules; with ``device_id``, the rules that apply to that device"""
+    query = db.query(AlertRuleModel)
+    if device_id is not None:
+        query = query.filter((AlertRuleModel.device_id == device_id) | AlertRuleModel.device_id.is_(None))
+    return query.order_by(AlertRuleModel.id).all()
+
+
+@app.post("/alert-rules", response_model=AlertRule, tags=["Alerts"])
+def create_alert_rule(
+    rule: AlertRuleCreate,
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """Create an alert rule, e.g. ``current gt 12`` for 30 s, ``status eq 2`` or ``no_data`` for 300 s"""
+    return save_alert_rule(db, AlertRuleModel(), rule)
+
+
+@app.put("/alert-rules/{rule_id}", response_model=AlertRule, tags=["Alerts"])
+def update_alert_rule(
+    rule_id: int,
+    rule: AlertRuleCreate,
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """Replace an alert rule; disabling it resolves its active alerts"""
+    db_rule = db.query(AlertRuleModel).filter(AlertRuleModel.id == rule_id).first()
+    if not db_rule:
+        raise HTTPException(status_code=404, detail="Alert rule not found")
+    return save_alert_rule(db, db_rule, rule)
+
+
+@app.delete("/alert-rules/{rule_id}", tags=["Alerts"])
+def delete_alert_rule(
+    rule_id: int,
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_user)
+):
+    """Delete an alert rule and its alert history"""
+    db_rule = db.query(AlertRuleModel).filter(AlertRuleModel.id == rule_id).first()
+    if not db_rule:
+        raise HTTPException(status_code=404, detail="Alert rule not found")
+    db.delete(db_rule)
+    db.commit()
+    reload_alert_rules(db)
+    return {"message": "Alert rule deleted successfully", "id": rule_id}
+
+
+@app.get("/devices/{device_id}/alerts", response_model=List[Alert], tags=["Alerts"])
+def get_device_alerts(
+    device_id: int,
+    active: bool = False,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """Alerts of a device, newest first; ``active=true`` returns only unresolved ones"""
+    device = db.query(DeviceModel).filter(DeviceModel.id == device_id).first()
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    query = db.query(AlertModel).filter(AlertModel.device_id == device_id)
+    if active:
+        query = query.filter(AlertModel.resolved_at.is_(None))
+    return query.order_by(AlertModel.fired_at.desc()).limit(limit).all()
+
+
 # ==================== WebSocket ENDPOINTS ====================
 
 @app.websocket("/ws/device/{device_id}")
@@ -757,9 +1508,8 @@ async def websocket_device_endpoint(websocket: WebSocket, device_id: int):
                 
     except WebSocketDisconnect:
         manager.disconnect(websocket, device_id)
-        print(f"🔌 Client disconnected from device {device_id}")
     except Exception as e:
-        print(f"⚠️ WebSocket error: {e}")
+        ws_log.warning("error", "⚠️ WebSocket error", device_id=device_id, error=str(e))
         manager.disconnect(websocket, device_id)
 
 
@@ -770,7 +1520,7 @@ async def websocket_rs485_sender(websocket: WebSocket, device_id: int):
     RS485 connects here and sends JSON data which is stored and broadcast to clients.
     """
     await websocket.accept()
-    print(f"🔌 RS485 connected for device {device_id}")
+    rs485_log.info("connect", "🔌 RS485 connected", device_id=device_id)
     
     # Get DB session for this connection
     db = next(get_db())
@@ -782,7 +1532,7 @@ async def websocket_rs485_sender(websocket: WebSocket, device_id: int):
             
             try:
                 sensor_data = json.loads(data)
-                print(f"📡 Received data from RS485 device {device_id}: {sensor_data}")
+                rs485_log.debug("data", "📡 RS485 data", device_id=device_id, data=sensor_data)
                 
                 # Validate device exists
                 device = db.query(DeviceModel).filter(DeviceModel.id == device_id).first()
@@ -802,9 +1552,11 @@ async def websocket_rs485_sender(websocket: WebSocket, device_id: int):
                     light=sensor_data.get("light"),
                     motion=sensor_data.get("motion"),
                     distance=sensor_data.get("distance"),
-                    custom_data=json.dumps(sensor_data.get("custom_data")) if sensor_data.get("custom_data") else None
+                    custom_data=to_document(sensor_data.get("custom_data"))
                 )
                 db.add(db_reading)
+                alerts = alert_engine.observe(device_id, sensor_sample(db_reading))
+                record_alerts(db, alerts)
                 db.commit()
                 db.refresh(db_reading)
                 
@@ -820,11 +1572,13 @@ async def websocket_rs485_sender(websocket: WebSocket, device_id: int):
                         "light": db_reading.light,
                         "motion": db_reading.motion,
                         "distance": db_reading.distance,
-                        "custom_data": db_reading.custom_data,
+                        "custom_data": to_text(db_reading.custom_data),
                         "timestamp": db_reading.timestamp.isoformat()
                     }
                 }
                 await manager.broadcast_to_device(device_id, message)
+                for event in alerts:
+                    await manager.broadcast_to_device(device_id, alert_message(event))
                 
                 # Acknowledge to RS485
                 await websocket.send_json({"status": "ok", "reading_id": db_reading.id})
@@ -832,13 +1586,13 @@ async def websocket_rs485_sender(websocket: WebSocket, device_id: int):
             except json.JSONDecodeError:
                 await websocket.send_json({"error": "Invalid JSON format"})
             except Exception as e:
-                print(f"❌ Error processing RS485 data: {e}")
+                rs485_log.error("data_failed", "❌ Error processing RS485 data", device_id=device_id, error=str(e))
                 await websocket.send_json({"error": str(e)})
                 
     except WebSocketDisconnect:
-        print(f"🔌 RS485 disconnected from device {device_id}; waiting for heartbeat timeout before offline")
+        rs485_log.info("disconnect", "🔌 RS485 disconnected; waiting for heartbeat timeout before offline", device_id=device_id)
     except Exception as e:
-        print(f"⚠️ RS485 WebSocket error for device {device_id}: {e}")
+        rs485_log.warning("error", "⚠️ RS485 WebSocket error", device_id=device_id, error=str(e))
     finally:
         db.close()
 
@@ -861,6 +1615,267 @@ def compute_device_status(device: DeviceModel) -> str:
 
 # ==================== WebSocket Endpoint: ESP32 Master ====================
 
+VFD_DATA_KEYS = ("frequency", "speed", "current", "voltage", "power", "torque")
+
+
+def vfd_code(sensor_data: Dict, key: str) -> Optional[int]:
+    """Integer status/fault code of an ESP32 ``data`` object (ValueError unless a whole number in INTEGER range)."""
+    value = sensor_data.get(key)
+    if value is None:
+        return None
+    try:
+        number: Optional[float] = float(value)
+    except (TypeError, ValueError):
+        number = None
+    if isinstance(value, bool) or number is None or not number.is_integer() or not -2**31 <= number < 2**31:
+        raise ValueError(f"{key} must be an integer, got {value!r}")
+    return int(number)
+
+
+def vfd_fields(sensor_data: Dict) -> Dict:
+    """
+    VFDReading columns from an ESP32 ``data`` object (measurements as text,
+    faultCode -> fault_code); ValueError if status or faultCode is not an integer.
+    """
+    fields = {key: str(sensor_data[key]) if sensor_data.get(key) is not None else None for key in VFD_DATA_KEYS}
+    fields["status"] = vfd_code(sensor_data, "status")
+    fields["fault_code"] = vfd_code(sensor_data, "faultCode")
+    return fields
+
+
+def forget_esp32_state(device_id: int) -> None:
+    """
+    Reset the in-memory per-device state (storage filter, detectors, drive
+    state) after a failed ingest: it already took in samples whose rows,
+    events and transitions were rolled back, and the device resends them.
+    """
+    storage_filter.forget(("esp32", device_id))
+    anomaly_monitor.forget(device_id)
+    alert_engine.forget(device_id)
+    vfd_state_tracker.forget(device_id)
+
+
+def ingest_esp32_batch(db: Session, device: DeviceModel, message: Dict) -> Dict:
+    """
+    Ingest a batched ``sensor_data`` frame (``samples`` with seq/ts) in one transaction.
+
+    Samples at or below the device's ingest cursor are replays and skipped.
+    The rest run through the same detectors and storage filter as single
+    frames, at their device-side time, and stored rows are bulk inserted.
+    Returns the ack plus what to broadcast.
+    """
+    received_at = datetime.now(timezone.utc)
+    samples = parse_samples(message.get("samples"), ESP32_MAX_BATCH_SAMPLES)
+    cursor = lock_cursor(db, device.id)
+    if message.get("reset"):
+        # The device restarted its numbering (e.g. flash wiped): take this frame as the new start.
+        cursor = None
+    fresh, duplicates, lost = split_new(samples, cursor)
+
+    readings: List[Dict] = []
+    metric_rows: List[Dict] = []
+    anomalies: List[Dict] = []
+    alerts: List[Dict] = []
+    latest: Optional[Dict] = None
+    rejected = 0
+    # The storage filter runs on the monotonic clock; shift each sample's device time onto it.
+    clock_offset = time.monotonic() - time.time()
+    for sample in fresh:
+        data = sample.get("data") or {}
+        if not isinstance(data, dict) or not any(key in data for key in VFD_DATA_KEYS):
+            rejected += 1
+            continue
+        try:
+            fields = vfd_fields(data)
+        except ValueError:
+            rejected += 1
+            continue
+        ts = sample_timestamp(sample.get("ts"), received_at)
+        epoch = ts.timestamp()
+        rssi = sample.get("rssi", message.get("rssi"))
+        anomalies.extend(anomaly_monitor.observe(device.id, fields, now=epoch))
+        alerts.extend(alert_engine.observe(device.id, {**fields, "rssi": rssi}, now=epoch))
+        record_vfd_transition(db, vfd_state_tracker.observe(device.id, fields, now=epoch))
+        custom_data = {"rssi": rssi, "uptime": sample.get("uptime", message.get("uptime")), "seq": sample["seq"], "verified": True}
+        stored = storage_filter.should_store(
+            ("esp32", device.id), fields, "esp32", device_id=device.id, now=epoch + clock_offset
+        )
+        if stored:
+            readings.append({"device_id": device.id, "timestamp": ts, **fields, "custom_data": custom_data})
+            metric_rows.extend(metric_sample_rows(db, device.id, ts, {**fields, "rssi": rssi}, {"rssi": "dBm"}))
+        if latest is None or ts >= latest["timestamp"]:
+            latest = {**fields, "custom_data": custom_data, "timestamp": ts, "stored": stored}
+
+    if readings:
+        db.execute(insert(VFDReadingModel), readings)
+    insert_metric_samples(db, metric_rows)
+    record_anomalies(db, anomalies)
+    record_alerts(db, alerts)
+    if fresh:
+        save_cursor(db, device.id, fresh[-1]["seq"])
+    mark_device_online(device)
+    db.commit()
+    if fresh:
+        reading_spool.note_db_cursor(device.id, fresh[-1]["seq"])
+
+    ack = {
+        "status": "ok",
+        "type": "sensor_ack",
+        "ack_seq": fresh[-1]["seq"] if fresh else cursor,
+        "accepted": len(fresh) - rejected,
+        "stored": len(readings),
+        "duplicates": duplicates,
+        "lost": lost,
+        "rejected": rejected,
+    }
+    return {"ack": ack, "latest": latest, "anomalies": anomalies, "alerts": alerts}
+
+
+def spool_esp32_frame(device: DeviceModel, message: Dict, observe: bool) -> Dict:
+    """
+    Ingest a ``sensor_data`` frame (single or batched) into the local spool
+    while the database is unavailable or the spool is not drained yet; same
+    ack as the database paths, plus ``"spooled": true``.
+
+    With ``observe`` the detectors and storage filter run as usual (without,
+    they already ran in the failed database attempt and every reading is
+    kept). Anomaly/alert events are broadcast but not stored. Drive state
+    transitions are spooled with the rows and recorded on replay.
+    """
+    received_at = datetime.now(timezone.utc)
+    batched = "samples" in message
+    cursor = None
+    if batched:
+        samples = parse_samples(message.get("samples"), ESP32_MAX_BATCH_SAMPLES)
+        cursor = None if message.get("reset") else reading_spool.device_seq(device.id)
+        fresh, duplicates, lost = split_new(samples, cursor)
+    else:
+        fresh, duplicates, lost = [{"data": message.get("data") or {}}], 0, 0
+    if not observe:
+        # The failed attempt already moved the tracker, but its transition was rolled back.
+        # Start over from the stored interval (an "initial" transition is a no-op if unchanged).
+        vfd_state_tracker.forget(device.id)
+
+    rows: List[Dict] = []
+    transitions: List[Dict] = []
+    anomalies: List[Dict] = []
+    alerts: List[Dict] = []
+    latest: Optional[Dict] = None
+    rejected = 0
+    clock_offset = time.monotonic() - time.time()
+    for sample in fresh:
+        data = sample.get("data") or {}
+        if not isinstance(data, dict) or not any(key in data for key in VFD_DATA_KEYS):
+            rejected += 1
+            continue
+        if not batched:
+            fields = vfd_fields(data)
+        else:
+            try:
+                fields = vfd_fields(data)
+            except ValueError:
+                rejected += 1
+                continue
+        ts = sample_timestamp(sample.get("ts"), received_at) if batched else received_at
+        epoch = ts.timestamp()
+        rssi = sample.get("rssi", message.get("rssi"))
+        custom_data = {"rssi": rssi, "uptime": sample.get("uptime", message.get("uptime")), "verified": True}
+        if batched:
+            custom_data["seq"] = sample["seq"]
+        transition = vfd_state_tracker.observe(device.id, fields, now=epoch)
+        if transition is not None:
+            transitions.append({**transition, "timestamp": transition["timestamp"].isoformat()})
+        stored = True
+        if observe:
+            anomalies.extend(anomaly_monitor.observe(device.id, fields, now=epoch))
+            alerts.extend(alert_engine.observe(device.id, {**fields, "rssi": rssi}, now=epoch))
+            stored = storage_filter.should_store(
+                ("esp32", device.id), fields, "esp32", device_id=device.id, now=epoch + clock_offset
+            )
+        if stored:
+            rows.append({"device_id": device.id, "timestamp": ts.isoformat(), **fields, "custom_data": custom_data})
+        if latest is None or ts >= latest["timestamp"]:
+            latest = {**fields, "custom_data": custom_data, "timestamp": ts, "stored": stored}
+    if not batched and rejected:
+        raise ValueError("Only VFD data is accepted. Sensor-only data rejected.")
+
+    if rows or transitions or (batched and fresh):
+        reading_spool.append({
+            "kind": "vfd",
+            "rows": rows,
+            "transitions": transitions,
+            "cursor": [device.id, fresh[-1]["seq"]] if batched and fresh else None,
+            # Seq the samples were split against; replay skips only those at or below it.
+            "floor": cursor,
+            "reset": bool(batched and message.get("reset")),
+        })
+    mark_device_online(device)
+    if batched:
+        ack = {
+            "status": "ok",
+            "type": "sensor_ack",
+            "ack_seq": fresh[-1]["seq"] if fresh else cursor,
+            "accepted": len(fresh) - rejected,
+            "stored": len(rows),
+            "duplicates": duplicates,
+            "lost": lost,
+            "rejected": rejected,
+            "spooled": True,
+        }
+    else:
+        ack = {"status": "ok", "reading_id": None, "type": "vfd", "stored": bool(rows), "spooled": True}
+    return {"ack": ack, "latest": latest, "anomalies": anomalies, "alerts": alerts}
+
+
+def release_session(db: Session, device: DeviceModel, exc: Exception) -> bool:
+    """
+    Roll back after a failed database call. On a database outage ``device``
+    is detached first, so its loaded state stays readable without the
+    database, and True is returned (the caller spools).
+    """
+    outage = reading_spool.fallback(exc)
+    if outage and device in db:
+        db.expunge(device)
+    try:
+        db.rollback()
+    except Exception:
+        pass
+    return outage
+
+
+async def broadcast_esp32_result(device_id: int, result: Dict) -> None:
+    """Push the newest sample and detector events of an ingested frame to frontend clients."""
+    latest = result["latest"]
+    if latest is not None:
+        # Only the newest sample is pushed live; replayed history is read from the API.
+        await manager.broadcast_to_device(device_id, {
+            "type": "vfd_update",
+            "device_id": device_id,
+            "data": {
+                **latest,
+                "id": None,
+                "custom_data": to_text(latest["custom_data"]),
+                "timestamp": latest["timestamp"].isoformat(),
+            },
+        })
+    for event in result["anomalies"]:
+        await manager.broadcast_to_device(device_id, anomaly_message(event))
+    for event in result["alerts"]:
+        await manager.broadcast_to_device(device_id, alert_message(event))
+
+
+async def send_spooled_frame(websocket: WebSocket, device: DeviceModel, message: Dict, observe: bool) -> None:
+    ack_type = "sensor_ack" if "samples" in message else "vfd"
+    try:
+        result = spool_esp32_frame(device, message, observe)
+    except (ValueError, OSError) as e:
+        await websocket.send_json({"status": "error", "type": ack_type, "error": str(e)})
+        return
+    await websocket.send_json(result["ack"])
+    esp32_log.info("spooled", "📼 Frame spooled", device_id=device.id, stored=result["ack"]["stored"])
+    await broadcast_esp32_result(device.id, result)
+
+
 @app.websocket("/ws/esp32/connect")
 async def websocket_esp32_handler(
     websocket: WebSocket,
@@ -888,7 +1903,7 @@ async def websocket_esp32_handler(
 
     # Fallback: if query params missing, try to get from first message
     if not mac_address or not mac_address.strip():
-        print(f"⚠️  Query params missing for WebSocket from {client_ip}, attempting first-message fallback...")
+        esp32_log.debug("credentials_fallback", "⚠️ Query params missing, waiting for first-message credentials", ip=client_ip)
         try:
             # Wait up to 2 seconds for ESP32 to send credentials in first message
             init_msg = await asyncio.wait_for(websocket.receive_json(), timeout=2.0)
@@ -897,9 +1912,9 @@ async def websocket_esp32_handler(
             device_key = init_msg.get("device_key", "").strip()
             
             if mac_address:
-                print(f"✅ Credentials received in first message from {client_ip}: mac={mac_address}")
+                esp32_log.debug("credentials_received", "✅ Credentials received in first message", ip=client_ip, mac=mac_address)
             else:
-                print(f"❌ ESP32 WebSocket rejected: no credentials in query params or first message from {client_ip}")
+                esp32_log.warning("rejected", "❌ No credentials in query params or first message", ip=client_ip)
                 await websocket.send_json({
                     "type": "registration",
                     "status": "error",
@@ -908,7 +1923,7 @@ async def websocket_esp32_handler(
                 await websocket.close(code=4000)
                 return
         except asyncio.TimeoutError:
-            print(f"❌ ESP32 WebSocket rejected: timeout waiting for credentials from {client_ip}")
+            esp32_log.warning("rejected", "❌ Timeout waiting for credentials", ip=client_ip)
             await websocket.send_json({
                 "type": "registration",
                 "status": "error",
@@ -917,7 +1932,7 @@ async def websocket_esp32_handler(
             await websocket.close(code=4000)
             return
         except Exception as e:
-            print(f"❌ ESP32 WebSocket rejected: error parsing first message from {client_ip}: {e}")
+            esp32_log.warning("rejected", "❌ Error parsing first message", ip=client_ip, error=str(e))
             await websocket.send_json({
                 "type": "registration",
                 "status": "error",
@@ -927,7 +1942,10 @@ async def websocket_esp32_handler(
             return
 
     mac_address = mac_address.strip()
-    print(f"🔌 ESP32 WebSocket from {client_ip} | mac={mac_address} | device_id={device_id} | device_key={'***' if device_key else None}")
+    esp32_log.info(
+        "connect", "🔌 ESP32 WebSocket", ip=client_ip, mac=mac_address, device_id=device_id,
+        device_key="***" if device_key else None,
+    )
 
     device = None
     is_new_device = False
@@ -944,7 +1962,7 @@ async def websocket_esp32_handler(
             if device:
                 # Keep MAC address in sync
                 if device.mac_address != mac_address:
-                    print(f"⚠️ MAC updated for device {device_id}: {device.mac_address} -> {mac_address}")
+                    esp32_log.warning("mac_updated", "⚠️ MAC updated", device_id=device_id, old=device.mac_address, new=mac_address)
                     device.mac_address = mac_address
                     db.commit()
 
@@ -952,7 +1970,7 @@ async def websocket_esp32_handler(
         if not device:
             device = db.query(DeviceModel).filter(DeviceModel.mac_address == mac_address).first()
             if device:
-                print(f"ℹ️ Device found by MAC: {mac_address} -> Device ID {device.id}")
+                esp32_log.info("found_by_mac", "ℹ️ Device found by MAC", mac=mac_address, device_id=device.id)
 
         # 4. IF STILL NOT FOUND, AUTO-REGISTER NEW DEVICE
         if not device:
@@ -973,7 +1991,10 @@ async def websocket_esp32_handler(
                 db.commit()
                 db.refresh(device)
                 is_new_device = True
-                print(f"🆕 Auto-registered new device: name={device_name}, MAC={mac_address}, IP={client_ip}, ID={device.id}")
+                esp32_log.info(
+                    "auto_registered", "🆕 Auto-registered new device",
+                    name=device_name, mac=mac_address, ip=client_ip, device_id=device.id,
+                )
 
             except IntegrityError:
                 # IP address already taken by another device — find it and adopt it
@@ -987,7 +2008,7 @@ async def websocket_esp32_handler(
                         device.device_key = str(uuid.uuid4())
                     db.commit()
                     db.refresh(device)
-                    print(f"ℹ️ Reused existing device ID {device.id} for IP {client_ip}")
+                    esp32_log.info("reused_device", "ℹ️ Reused existing device ID for IP", device_id=device.id, ip=client_ip)
                 else:
                     await websocket.send_json({
                         "type": "registration",
@@ -999,7 +2020,7 @@ async def websocket_esp32_handler(
 
         # 5. KEEP IP ADDRESS IN SYNC
         if device.ip_address != client_ip:
-            print(f"⚠️ IP updated for device {device.id}: {device.ip_address} -> {client_ip}")
+            esp32_log.warning("ip_updated", "⚠️ IP updated", device_id=device.id, old=device.ip_address, new=client_ip)
             device.ip_address = client_ip
 
         # 6. MARK DEVICE ONLINE
@@ -1008,7 +2029,7 @@ async def websocket_esp32_handler(
 
         active_sessions = await register_esp32_connection(device.id)
         session_registered = True
-        print(f"🔗 ESP32 device {device.id} active sessions: {active_sessions}")
+        esp32_log.debug("sessions", "🔗 Active sessions", device_id=device.id, sessions=active_sessions)
 
         # 7. SEND CREDENTIALS BACK TO ESP32
         registration_response = {
@@ -1021,15 +2042,17 @@ async def websocket_esp32_handler(
             "message": "Device registered successfully" if is_new_device else "Device authenticated"
         }
         await websocket.send_json(registration_response)
+        flow_controller.attach(websocket, device.id)
+        if flow_controller.enabled:
+            await websocket.send_json(flow_controller.config())
 
         if is_new_device:
-            print(f"✅ New ESP32 device {device.id} ({device.device_name}) registered from {client_ip}")
+            esp32_log.info("registered", "✅ New ESP32 device registered", device_id=device.id, name=device.device_name, ip=client_ip)
         else:
-            print(f"✅ ESP32 device {device.id} ({device.device_name}) authenticated from {client_ip}")
+            esp32_log.info("authenticated", "✅ ESP32 device authenticated", device_id=device.id, name=device.device_name, ip=client_ip)
     except Exception as e:
-        print(f"❌ ESP32 WebSocket setup error: {e}")
-        import traceback
-        traceback.print_exc()
+        esp32_log.exception("setup_failed", "❌ ESP32 WebSocket setup error", ip=client_ip, error=str(e))
+        flow_controller.detach(websocket)
         if device is not None and session_registered:
             await unregister_esp32_connection(device.id)
         try:
@@ -1047,28 +2070,75 @@ async def websocket_esp32_handler(
     try:
         while True:
             message = await websocket.receive_json()
+            received = time.perf_counter()
             message_type = message.get("type")
+            if device not in db and not reading_spool.db_down():
+                # Detached during a database outage; attach again (with its pending changes).
+                try:
+                    device = db.merge(device)
+                except Exception as e:
+                    if not release_session(db, device, e):
+                        raise
             
             if message_type == "heartbeat":
                 # Update last heartbeat timestamp and ensure device is online
                 mark_device_online(device)
-                db.commit()
-                print(f"💖 Heartbeat from device {device.id}: RSSI={message.get('rssi', 'N/A')}")
+                if not reading_spool.db_down():
+                    try:
+                        db.commit()
+                    except Exception as e:
+                        if not release_session(db, device, e):
+                            raise
+                esp32_log.info("heartbeat", "💖 Heartbeat", device_id=device.id, rssi=message.get("rssi"))
                 
                 # Send acknowledgment
                 await websocket.send_json({"status": "ok", "type": "heartbeat_ack"})
                 
+            elif message_type == "sensor_data" and reading_spool.bypass_db():
+                # Database unavailable (or the spool not replayed yet): keep the frame in the
+                # local spool, ack and broadcast it.
+                await send_spooled_frame(websocket, device, message, observe=True)
+                flow_controller.observe_frame((time.perf_counter() - received) * 1000.0)
+
+            elif message_type == "sensor_data" and "samples" in message:
+                # Batched, sequence-numbered samples (buffered on the device, possibly replayed)
+                try:
+                    result = ingest_esp32_batch(db, device, message)
+                except ValueError as e:
+                    db.rollback()
+                    await websocket.send_json({"status": "error", "type": "sensor_ack", "error": str(e)})
+                    continue
+                except Exception as e:
+                    # Nothing was committed; spool the frame if the database is down,
+                    # otherwise the device resends from its last acked seq.
+                    if release_session(db, device, e):
+                        await send_spooled_frame(websocket, device, message, observe=False)
+                        continue
+                    forget_esp32_state(device.id)
+                    esp32_log.error("vfd_batch_failed", "❌ Error ingesting VFD batch", device_id=device.id, error=str(e))
+                    await websocket.send_json({"status": "error", "type": "sensor_ack", "error": str(e)})
+                    continue
+
+                ack = result["ack"]
+                await websocket.send_json(ack)
+                flow_controller.observe_frame((time.perf_counter() - received) * 1000.0)
+                esp32_log.info(
+                    "vfd_batch", "📦 VFD batch", device_id=device.id, ack_seq=ack["ack_seq"], accepted=ack["accepted"],
+                    stored=ack["stored"], duplicates=ack["duplicates"], lost=ack["lost"],
+                )
+                await broadcast_esp32_result(device.id, result)
+
             elif message_type == "sensor_data":
                 # Process sensor data from ESP32
                 try:
                     sensor_data = message.get("data", {})
                     
                     # Only accept VFD data (must contain frequency, speed, etc.)
-                    is_vfd_data = any(key in sensor_data for key in ["frequency", "speed", "current", "voltage", "power", "torque"])
+                    is_vfd_data = any(key in sensor_data for key in VFD_DATA_KEYS)
                     
                     if not is_vfd_data:
                         # Reject non-VFD sensor data
-                        print(f"⚠️ Rejected non-VFD sensor data from device {device.id}")
+                        esp32_log.warning("rejected_data", "⚠️ Rejected non-VFD sensor data", device_id=device.id)
                         await websocket.send_json({
                             "status": "error",
                             "error": "Only VFD data is accepted. Sensor-only data rejected."
@@ -1077,30 +2147,57 @@ async def websocket_esp32_handler(
                     
                     # Update last activity so device appears online and status stays fresh
                     mark_device_online(device)
-                    print(f"✅ Device {device.id} marked online - heartbeat updated")
                     
                     # Create VFD reading record
                     db_reading = VFDReadingModel(
                         device_id=device.id,
-                        frequency=str(sensor_data.get("frequency")) if sensor_data.get("frequency") is not None else None,
-                        speed=str(sensor_data.get("speed")) if sensor_data.get("speed") is not None else None,
-                        current=str(sensor_data.get("current")) if sensor_data.get("current") is not None else None,
-                        voltage=str(sensor_data.get("voltage")) if sensor_data.get("voltage") is not None else None,
-                        power=str(sensor_data.get("power")) if sensor_data.get("power") is not None else None,
-                        torque=str(sensor_data.get("torque")) if sensor_data.get("torque") is not None else None,
-                        status=sensor_data.get("status"),
-                        fault_code=sensor_data.get("faultCode"),
-                        custom_data=json.dumps({
+                        **vfd_fields(sensor_data),
+                        custom_data={
                             "rssi": message.get("rssi"),
                             "uptime": message.get("uptime"),
                             "verified": True
-                        })
+                        }
                     )
-                    db.add(db_reading)
-                    db.commit()  # This commits both device status and reading
-                    db.refresh(db_reading)
+                    sample = {
+                        "frequency": db_reading.frequency,
+                        "speed": db_reading.speed,
+                        "current": db_reading.current,
+                        "voltage": db_reading.voltage,
+                        "power": db_reading.power,
+                        "torque": db_reading.torque,
+                        "status": db_reading.status,
+                        "fault_code": db_reading.fault_code,
+                    }
+                    # Every sample goes through the anomaly detectors, stored or not.
+                    anomalies = anomaly_monitor.observe(device.id, sample)
+                    record_anomalies(db, anomalies)
+                    alerts = alert_engine.observe(device.id, {**sample, "rssi": message.get("rssi")})
+                    record_alerts(db, alerts)
+                    record_vfd_transition(db, vfd_state_tracker.observe(device.id, sample))
+                    # Persist only meaningful changes (or a max-silence heartbeat row);
+                    # every sample is still broadcast to the frontend.
+                    stored = storage_filter.should_store(("esp32", device.id), sample, "esp32", device_id=device.id)
+                    if stored:
+                        db_reading.timestamp = datetime.now(timezone.utc)
+                        db.add(db_reading)
+                        write_metric_sample(
+                            db,
+                            device.id,
+                            db_reading.timestamp,
+                            {**sample, "rssi": message.get("rssi")},
+                            {"rssi": "dBm"},
+                        )
+                        db.commit()  # This commits device status, reading, metric samples, anomalies, alerts and state changes
+                        db.refresh(db_reading)
+                        reading_timestamp = db_reading.timestamp
+                    else:
+                        db.commit()  # Device status (and anomalies/alerts/state changes) only
+                        reading_timestamp = datetime.now(timezone.utc)
                     
-                    print(f"📡 VFD data from device {device.id}: Freq={sensor_data.get('frequency')}Hz, Speed={sensor_data.get('speed')}RPM, Status={sensor_data.get('status')}")
+                    esp32_log.info(
+                        "vfd_frame", "📡 VFD data", device_id=device.id, frequency=sensor_data.get("frequency"),
+                        speed=sensor_data.get("speed"), status=sensor_data.get("status"), stored=stored,
+                    )
                     
                     # Broadcast to all connected frontend clients watching this device
                     broadcast_message = {
@@ -1116,37 +2213,47 @@ async def websocket_esp32_handler(
                             "torque": db_reading.torque,
                             "status": db_reading.status,
                             "fault_code": db_reading.fault_code,
-                            "custom_data": db_reading.custom_data,
-                            "timestamp": db_reading.timestamp.isoformat()
+                            "custom_data": to_text(db_reading.custom_data),
+                            "timestamp": reading_timestamp.isoformat(),
+                            "stored": stored
                         }
                     }
                     await manager.broadcast_to_device(device.id, broadcast_message)
+                    for event in anomalies:
+                        await manager.broadcast_to_device(device.id, anomaly_message(event))
+                    for event in alerts:
+                        await manager.broadcast_to_device(device.id, alert_message(event))
                     
                     # Acknowledge to ESP32
-                    await websocket.send_json({"status": "ok", "reading_id": db_reading.id, "type": "vfd"})
+                    await websocket.send_json({"status": "ok", "reading_id": db_reading.id, "type": "vfd", "stored": stored})
+                    flow_controller.observe_frame((time.perf_counter() - received) * 1000.0)
                     
+                except ValueError as e:
+                    db.rollback()
+                    await websocket.send_json({"status": "error", "type": "vfd", "error": str(e)})
                 except Exception as e:
-                    print(f"❌ Error processing VFD data: {e}")
-                    import traceback
-                    traceback.print_exc()
+                    if release_session(db, device, e):
+                        await send_spooled_frame(websocket, device, message, observe=False)
+                        continue
+                    forget_esp32_state(device.id)
+                    esp32_log.exception("vfd_frame_failed", "❌ Error processing VFD data", device_id=device.id, error=str(e))
                     await websocket.send_json({"error": str(e)})
             
             else:
-                print(f"⚠️ Unknown message type: {message_type}")
+                esp32_log.warning("unknown_message", "⚠️ Unknown message type", device_id=device.id, type=message_type)
                 await websocket.send_json({"error": "Unknown message type"})
     
     except WebSocketDisconnect:
+        flow_controller.detach(websocket)
         remaining = await unregister_esp32_connection(device.id)
-        print(
-            f"🔌 ESP32 device {device.id} disconnected; active sessions={remaining}. "
-            "Status will follow heartbeat timeout."
+        esp32_log.info(
+            "disconnect", "🔌 ESP32 disconnected; status will follow heartbeat timeout",
+            device_id=device.id, sessions=remaining,
         )
     except Exception as e:
+        flow_controller.detach(websocket)
         remaining = await unregister_esp32_connection(device.id)
-        print(
-            f"⚠️ ESP32 WebSocket error for device {device.id}: {e}; "
-            f"active sessions={remaining}."
-        )
+        esp32_log.warning("error", "⚠️ ESP32 WebSocket error", device_id=device.id, sessions=remaining, error=str(e))
 
 
 # ==================== New API Endpoints ====================
@@ -1239,18 +2346,30 @@ def initialize_esp32_device(
 def get_vfd_readings(
     device_id: int,
     limit: int = 100,
+    data_key: Optional[str] = None,
+    data_op: str = "eq",
+    data_value: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """Get VFD readings for a specific device (most recent first)"""
+    """
+    Get VFD readings for a specific device (most recent first).
+
+    Optional custom_data filter, e.g. ``data_key=rssi&data_op=lt&data_value=-80``
+    or ``data_key=Current.value&data_op=gt&data_value=10``.
+    Operators: eq, ne, lt, le, gt, ge, exists.
+    Readings moved to the compressed archive or the cold tier are decoded and included transparently.
+    """
     device = db.query(DeviceModel).filter(DeviceModel.id == device_id).first()
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
     
-    readings = db.query(VFDReadingModel).filter(
-        VFDReadingModel.device_id == device_id
-    ).order_by(VFDReadingModel.timestamp.desc()).limit(limit).all()
+    query = db.query(VFDReadingModel).filter(VFDReadingModel.device_id == device_id)
+    query = apply_custom_data_filter(query, VFDReadingModel.custom_data, data_key, data_op, data_value)
+    readings = query.order_by(VFDReadingModel.timestamp.desc()).limit(limit).all()
     
-    return readings
+    matches = (lambda document: custom_data_matches(document, data_key, data_op, data_value)) if data_key else None
+    readings = with_archived_readings(db, device_id, readings, limit, matches)
+    return with_cold_readings(cold_archive, device_id, readings, limit, matches)
 
 
 @app.get("/devices/{device_id}/vfd-readings/latest", response_model=VFDReading, tags=["VFD"])
@@ -1264,12 +2383,271 @@ def get_latest_vfd_reading(device_id: int, db: Session = Depends(get_db)):
         VFDReadingModel.device_id == device_id
     ).order_by(VFDReadingModel.timestamp.desc()).first()
     
+    if not reading:
+        archived = archived_vfd_readings(db, device_id, 1) or cold_archive.readings(device_id, 1)
+        reading = archived[0] if archived else None
     if not reading:
         raise HTTPException(status_code=404, detail="No VFD readings found for this device")
     
     return reading
 
 
+@app.get("/devices/{device_id}/vfd-readings/live", tags=["VFD"])
+def get_live_vfd_values(device_id: int):
+    """Latest polled Modbus register values of a device, served from memory without a DB query"""
+    scheduler = get_modbus_scheduler()
+    return {"device_id": device_id, "registers": scheduler.latest(device_id)}
+
+
+VFD_EXPORT_COLUMNS = (
+    "id", "timestamp", "frequency", "speed", "current", "voltage",
+    "power", "torque", "status", "fault_code", "custom_data",
+)
+
+
+@app.get("/devices/{device_id}/vfd-readings/export", tags=["VFD"])
+def export_vfd_readings(
+    device_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Stream a device's VFD readings in ``[start, end)`` as CSV, oldest first.
+
+    Hot rows, the compressed archive and cold segment files are merged by timestamp.
+    """
+    device = db.query(DeviceModel).filter(DeviceModel.id == device_id).first()
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    start = start.replace(tzinfo=timezone.utc) if start and start.tzinfo is None else start
+    end = end.replace(tzinfo=timezone.utc) if end and end.tzinfo is None else end
+
+    def csv_chunks():
+        # Own session: the request's session is closed before the body is streamed.
+        session = SessionLocal()
+        try:
+            query = session.query(VFDReadingModel).filter(VFDReadingModel.device_id == device_id)
+            if start is not None:
+                query = query.filter(VFDReadingModel.timestamp >= start)
+            if end is not None:
+                query = query.filter(VFDReadingModel.timestamp < end)
+            hot = (
+                reading_row(reading)
+                for reading in query.order_by(VFDReadingModel.timestamp.asc(), VFDReadingModel.id.asc()).yield_per(1000)
+            )
+            rows = heapq.merge(
+                cold_archive.iter_rows(device_id, start, end),
+                iter_archived_rows(session, device_id, start, end),
+                hot,
+                key=lambda row: (row["timestamp"], row["id"]),
+            )
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(VFD_EXPORT_COLUMNS)
+            last_id = None
+            for row in rows:
+                if row["id"] == last_id:
+                    continue  # Present in two tiers while being moved
+                last_id = row["id"]
+                writer.writerow([
+                    row["id"], row["timestamp"].isoformat(),
+                    *(row[name] for name in VFD_EXPORT_COLUMNS[2:-1]),
+                    to_text(row["custom_data"]),
+                ])
+                if buffer.tell() >= 65536:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        finally:
+            session.close()
+
+    return StreamingResponse(
+        csv_chunks(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="vfd_readings_{device_id}.csv"'},
+    )
+
+
+def utc_range(start: Optional[datetime], end: Optional[datetime], default: timedelta):
+    """``[start, end)`` as aware UTC datetimes; ``end`` defaults to now and ``start`` to ``end - default``."""
+    end = end or datetime.now(timezone.utc)
+    end = end.replace(tzinfo=timezone.utc) if end.tzinfo is None else end
+    start = start or end - default
+    start = start.replace(tzinfo=timezone.utc) if start.tzinfo is None else start
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    return start, end
+
+
+@app.get("/devices/{device_id}/analytics", response_model=DeviceAnalytics, tags=["VFD"])
+def get_device_analytics(
+    device_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    bucket: int = 3600,
+    db: Session = Depends(get_db)
+):
+    """
+    Energy, run hours, starts, mean load and faults of a device in ``[start, end)``.
+
+    Defaults to the last 24 hours; ``bucket`` (seconds) sets the breakdown
+    interval. kWh comes from the Energy register (counter resets handled) or,
+    without one, from integrating power.
+    """
+    device = db.query(DeviceModel).filter(DeviceModel.id == device_id).first()
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    start, end = utc_range(start, end, timedelta(days=1))
+    if bucket <= 0:
+        raise HTTPException(status_code=400, detail="bucket must be a positive number of seconds")
+    if (end - start).total_seconds() / bucket > ANALYTICS_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Too many buckets (max {ANALYTICS_MAX_BUCKETS}); use a larger bucket")
+
+    result = device_analytics(db, cold_archive, device_id, start, end, bucket, ANALYTICS_MAX_GAP_SECONDS)
+    return {"device_id": device_id, **result}
+
+
+@app.get("/devices/{device_id}/anomalies", response_model=List[AnomalyEvent], tags=["VFD"])
+def get_device_anomalies(
+    device_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """Anomalies detected on a device's telemetry, newest first"""
+    device = db.query(DeviceModel).filter(DeviceModel.id == device_id).first()
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    query = db.query(AnomalyEventModel).filter(AnomalyEventModel.device_id == device_id)
+    if start is not None:
+        query = query.filter(AnomalyEventModel.timestamp >= start)
+    if end is not None:
+        query = query.filter(AnomalyEventModel.timestamp < end)
+    return query.order_by(AnomalyEventModel.timestamp.desc()).limit(limit).all()
+
+
+@app.get("/devices/{device_id}/timeline", response_model=VFDTimeline, tags=["VFD"])
+def get_device_timeline(
+    device_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Run/stop/fault/offline intervals of a drive overlapping ``[start, end)`` (default: last 24 hours),
+    plus the seconds spent in each state within the range.
+    """
+    device = db.query(DeviceModel).filter(DeviceModel.id == device_id).first()
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    start, end = utc_range(start, end, timedelta(days=1))
+    events = db.query(VFDEventModel).filter(
+        VFDEventModel.device_id == device_id,
+        VFDEventModel.started_at < end,
+        (VFDEventModel.ended_at.is_(None)) | (VFDEventModel.ended_at > start),
+    ).order_by(VFDEventModel.started_at.asc()).all()
+    return {
+        "device_id": device_id,
+        "start": start,
+        "end": end,
+        "intervals": events,
+        "seconds_by_state": interval_summary(events, start, end, datetime.now(timezone.utc)),
+    }
+
+
+@app.get("/devices/{device_id}/faults", response_model=List[VFDEvent], tags=["VFD"])
+def get_device_faults(
+    device_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """Fault intervals of a drive (with fault code and duration), newest first"""
+    device = db.query(DeviceModel).filter(DeviceModel.id == device_id).first()
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    query = db.query(VFDEventModel).filter(VFDEventModel.device_id == device_id, VFDEventModel.state == "fault")
+    if start is not None:
+        query = query.filter((VFDEventModel.ended_at.is_(None)) | (VFDEventModel.ended_at > start))
+    if end is not None:
+        query = query.filter(VFDEventModel.started_at < end)
+    return query.order_by(VFDEventModel.started_at.desc()).limit(limit).all()
+
+
+@app.get("/metrics", response_model=List[Metric], tags=["VFD"])
+def get_metrics(device_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """Metric catalog of the metric_samples time series, optionally only metrics recorded for one device"""
+    return list_metrics(db, device_id)
+
+
+@app.get("/devices/{device_id}/metrics/{name}", response_model=MetricSeries, tags=["VFD"])
+def get_metric_series(
+    device_id: int,
+    name: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    bucket: Optional[int] = None,
+    agg: str = "avg",
+    limit: int = 10000,
+    db: Session = Depends(get_db)
+):
+    """
+    Time series of one metric (register or telemetry field) for a device, oldest first.
+
+    ``start``/``end`` bound the range (end exclusive); ``bucket`` (seconds)
+    aggregates the points per bucket with ``agg`` (avg, min, max, sum, count).
+    """
+    device = db.query(DeviceModel).filter(DeviceModel.id == device_id).first()
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    if agg not in AGGREGATES:
+        raise HTTPException(status_code=400, detail=f"Unsupported aggregate '{agg}' (use one of {', '.join(AGGREGATES)})")
+    if bucket is not None and bucket <= 0:
+        raise HTTPException(status_code=400, detail="bucket must be a positive number of seconds")
+
+    metric_id = metric_catalog.lookup(db, name)
+    if metric_id is None:
+        raise HTTPException(status_code=404, detail=f"Metric '{name}' not found")
+    metric = db.get(MetricModel, metric_id)
+
+    points = query_metric_series(db, device_id, metric_id, start, end, bucket, agg, limit)
+    return {
+        "device_id": device_id,
+        "metric": metric.name,
+        "unit": metric.unit,
+        "bucket_seconds": bucket,
+        "aggregate": agg if bucket else None,
+        "points": [{"ts": ts, "value": value} for ts, value in points],
+    }
+
+
+@app.post("/devices/{device_id}/vfd-readings:bulk", tags=["VFD"])
+async def bulk_vfd_readings(
+    device_id: int,
+    request: Request,
+    skip_invalid: bool = False,
+    x_device_key: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Bulk-load VFD readings (backfills, gateway uploads) with PostgreSQL COPY.
+
+    Body: NDJSON (``application/x-ndjson``, one reading object per line,
+    streamed) or columnar JSON (``application/json``, ``{"timestamp": [...],
+    "frequency": [...], ...}``). Fields: frequency, speed, current, voltage,
+    power, torque, status, fault_code (or faultCode), custom_data. All rows
+    are stored in one transaction; an invalid row rejects the whole upload
+    unless ``skip_invalid=true``. The storage filter, anomaly detection,
+    alert rules and metric_samples are not applied to bulk rows.
+    """
+    return await bulk_upload(request, VFD_TABLE, device_id, skip_invalid, x_device_key, authorization, db)
+
+
 @app.delete("/devices/{device_id}/vfd-readings", tags=["VFD"])
 def delete_vfd_readings(
     device_id: int,
@@ -1282,7 +2660,14 @@ def delete_vfd_readings(
         raise HTTPException(status_code=404, detail="Device not found")
     
     count = db.query(VFDReadingModel).filter(VFDReadingModel.device_id == device_id).delete()
+    buckets = db.query(VFDReadingBucketModel).filter(VFDReadingBucketModel.device_id == device_id)
+    count += buckets.with_entities(func.coalesce(func.sum(VFDReadingBucketModel.row_count), 0)).scalar()
+    buckets.delete()
+    cold_archive.delete_device(device_id)
+    db.query(MetricSampleModel).filter(MetricSampleModel.device_id == device_id).delete()
+    db.query(VFDEventModel).filter(VFDEventModel.device_id == device_id).delete()
     db.commit()
+    vfd_state_tracker.forget(device_id)
     
     return {"message": f"Deleted {count} VFD readings for device {device_id}"}
 
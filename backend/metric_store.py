@@ -0,0 +1,181 @@
+"""
+Narrow per-metric time series (``metric_samples``) and its metric catalog.
+
+Every numeric register or telemetry field is stored as one
+``(device_id, metric_id, ts, value)`` row, with metric names dictionary
+encoded through the ``metrics`` table. Name -> id lookups are cached per
+process, so writers only touch the catalog the first time a name is seen.
+"""
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Float, cast, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from models import Metric as MetricModel, MetricSample as MetricSampleModel
+
+# Units of the fixed VFD fields, used when the source does not provide one.
+FIELD_UNITS = {
+    "frequency": "Hz",
+    "speed": "RPM",
+    "current": "A",
+    "voltage": "V",
+    "power": "kW",
+    "torque": "Nm",
+    "energy": "kWh",
+}
+
+# Value aggregates available for bucketed series queries.
+AGGREGATES = {"avg": func.avg, "min": func.min, "max": func.max, "sum": func.sum, "count": func.count}
+
+
+class MetricCatalog:
+    """Process-wide cache of the metrics table (name -> id)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._ids: Dict[str, int] = {}
+
+    def ids_for(self, db: Session, units: Dict[str, Optional[str]]) -> Dict[str, int]:
+        """Return ids for the given metric names, registering unknown names (with their unit)."""
+        with self._lock:
+            missing = [name for name in units if name not in self._ids]
+        if missing:
+            # Registered in a separate, immediately committed transaction so a cached id
+            # never points at a row lost to the caller's rollback. ON CONFLICT keeps
+            # concurrent writers (threads or the poller process) from racing.
+            with db.get_bind().begin() as connection:
+                connection.execute(
+                    pg_insert(MetricModel)
+                    .values([{"name": name, "unit": units[name] or FIELD_UNITS.get(name)} for name in missing])
+                    .on_conflict_do_nothing(index_elements=["name"])
+                )
+                rows = connection.execute(
+                    select(MetricModel.name, MetricModel.id).where(MetricModel.name.in_(missing))
+                ).all()
+            with self._lock:
+                self._ids.update({name: metric_id for name, metric_id in rows})
+        with self._lock:
+            return {name: self._ids[name] for name in units if name in self._ids}
+
+    def lookup(self, db: Session, name: str) -> Optional[int]:
+        with self._lock:
+            metric_id = self._ids.get(name)
+        if metric_id is not None:
+            return metric_id
+        metric_id = db.execute(select(MetricModel.id).where(MetricModel.name == name)).scalar()
+        if metric_id is not None:
+            with self._lock:
+                self._ids[name] = metric_id
+        return metric_id
+
+
+metric_catalog = MetricCatalog()
+
+
+def numeric_values(sample: Dict[str, Any]) -> Dict[str, float]:
+    """Keep the entries of ``sample`` that are numbers (or numeric strings)."""
+    values: Dict[str, float] = {}
+    for name, value in sample.items():
+        if value is None or isinstance(value, bool):
+            continue
+        try:
+            values[name] = float(value)
+        except (TypeError, ValueError):
+            continue
+    return values
+
+
+def metric_sample_rows(
+    db: Session,
+    device_id: int,
+    ts: datetime,
+    sample: Dict[str, Any],
+    units: Optional[Dict[str, Optional[str]]] = None,
+) -> List[Dict]:
+    """Rows for ``metric_samples`` from one {metric name: value} sample."""
+    values = numeric_values(sample)
+    if not values:
+        return []
+    units = units or {}
+    ids = metric_catalog.ids_for(db, {name: units.get(name) for name in values})
+    return [
+        {"device_id": device_id, "metric_id": ids[name], "ts": ts, "value": value}
+        for name, value in values.items()
+        if name in ids
+    ]
+
+
+def insert_metric_samples(db: Session, rows: List[Dict]) -> None:
+    """Insert metric rows in the caller's transaction; duplicate (device, metric, ts) rows are ignored."""
+    if rows:
+        db.execute(pg_insert(MetricSampleModel).on_conflict_do_nothing(), rows)
+
+
+def write_metric_sample(
+    db: Session,
+    device_id: int,
+    ts: datetime,
+    sample: Dict[str, Any],
+    units: Optional[Dict[str, Optional[str]]] = None,
+) -> int:
+    """Store one sample as metric rows (caller commits). Returns the number of rows."""
+    rows = metric_sample_rows(db, device_id, ts, sample, units)
+    insert_metric_samples(db, rows)
+    return len(rows)
+
+
+def query_metric_series(
+    db: Session,
+    device_id: int,
+    metric_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    bucket_seconds: Optional[int] = None,
+    aggregate: str = "avg",
+    limit: int = 10000,
+) -> List[Tuple[datetime, float]]:
+    """
+    Points of one metric in ``[start, end)``, oldest first.
+
+    With ``bucket_seconds`` the points are aggregated per time bucket in
+    PostgreSQL; the bucket timestamp is the start of the bucket.
+    """
+    conditions = [MetricSampleModel.device_id == device_id, MetricSampleModel.metric_id == metric_id]
+    if start is not None:
+        conditions.append(MetricSampleModel.ts >= start)
+    if end is not None:
+        conditions.append(MetricSampleModel.ts < end)
+
+    if not bucket_seconds:
+        statement = (
+            select(MetricSampleModel.ts, MetricSampleModel.value)
+            .where(*conditions)
+            .order_by(MetricSampleModel.ts.asc())
+            .limit(limit)
+        )
+        return [(ts, value) for ts, value in db.execute(statement).all()]
+
+    bucket = func.to_timestamp(
+        func.floor(func.extract("epoch", MetricSampleModel.ts) / bucket_seconds) * bucket_seconds
+    ).label("bucket")
+    value = AGGREGATES[aggregate](MetricSampleModel.value)
+    if aggregate == "count":
+        value = cast(value, Float)
+    statement = select(bucket, value).where(*conditions).group_by(bucket).order_by(bucket.asc()).limit(limit)
+    return [(ts, float(value)) for ts, value in db.execute(statement).all() if value is not None]
+
+
+def list_metrics(db: Session, device_id: Optional[int] = None) -> Iterable[MetricModel]:
+    """All catalog metrics, or only those with samples for ``device_id``."""
+    query = db.query(MetricModel)
+    if device_id is not None:
+        # One primary-key probe per catalog entry instead of a DISTINCT over the device's samples.
+        query = query.filter(
+            select(MetricSampleModel.metric_id)
+            .where(MetricSampleModel.device_id == device_id, MetricSampleModel.metric_id == MetricModel.id)
+            .exists()
+        )
+    return query.order_by(MetricModel.name.asc()).all()
@@ -0,0 +1,127 @@
+"""
+Table-driven Modbus RTU codec.
+
+CRC16 uses a precomputed 256-entry table (one lookup per byte instead of an
+8-step bit loop), read requests are built once and cached per
+(slave, function, address, quantity), and register payloads are decoded in a
+single ``struct`` call per frame.
+"""
+import struct
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+
+def _build_crc16_table() -> Tuple[int, ...]:
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC16_TABLE = _build_crc16_table()
+
+
+def crc16(data: bytes) -> int:
+    """Modbus CRC16 (poly 0xA001, init 0xFFFF) of ``data``."""
+    crc = 0xFFFF
+    table = CRC16_TABLE
+    for b in data:
+        crc = (crc >> 8) ^ table[(crc ^ b) & 0xFF]
+    return crc
+
+
+def append_crc(payload: bytes) -> bytes:
+    """Return ``payload`` followed by its CRC16, low byte first."""
+    crc = crc16(payload)
+    return bytes(payload) + bytes((crc & 0xFF, crc >> 8))
+
+
+def check_crc(frame: bytes) -> bool:
+    """True if the last two bytes of ``frame`` are the CRC16 of the rest."""
+    if len(frame) < 3:
+        return False
+    return crc16(frame[:-2]) == (frame[-2] | (frame[-1] << 8))
+
+
+_REQUEST_HEADER = struct.Struct(">BBHH")
+
+
+@lru_cache(maxsize=4096)
+def read_request(slave_id: int, address: int, quantity: int = 1, function: int = 0x03) -> bytes:
+    """Precompiled read request frame (function 0x03/0x04), cached per argument tuple."""
+    return append_crc(_REQUEST_HEADER.pack(slave_id, function, address, quantity))
+
+
+# Register payload formats: name -> (registers per value, struct code, word-swapped)
+REGISTER_FORMATS: Dict[str, Tuple[int, str, bool]] = {
+    "u16": (1, "H", False),
+    "s16": (1, "h", False),
+    "u32": (2, "I", False),
+    "s32": (2, "i", False),
+    "f32": (2, "f", False),
+    "u32_ws": (2, "I", True),
+    "s32_ws": (2, "i", True),
+    "f32_ws": (2, "f", True),
+}
+
+
+@lru_cache(maxsize=512)
+def _payload_struct(code: str, count: int) -> struct.Struct:
+    return struct.Struct(f">{count}{code}")
+
+
+def swap_words(payload: bytes) -> bytes:
+    """Swap the two 16-bit words of every 32-bit value (low word first on the wire)."""
+    swapped = bytearray(len(payload))
+    swapped[0::4] = payload[2::4]
+    swapped[1::4] = payload[3::4]
+    swapped[2::4] = payload[0::4]
+    swapped[3::4] = payload[1::4]
+    return bytes(swapped)
+
+
+def decode_registers(payload: bytes, fmt: str = "u16") -> Tuple:
+    """
+    Decode a big-endian register payload into a tuple of values.
+
+    ``fmt`` is one of REGISTER_FORMATS; 32-bit formats consume two registers
+    per value and the ``_ws`` variants expect the low word first.
+    """
+    registers, code, word_swapped = REGISTER_FORMATS[fmt]
+    width = 2 * registers
+    count = len(payload) // width
+    if count * width != len(payload):
+        raise ValueError(f"Payload of {len(payload)} bytes is not a whole number of {fmt} values")
+    if word_swapped:
+        payload = swap_words(payload)
+    return _payload_struct(code, count).unpack(payload)
+
+
+def decode_read_response(
+    frame: bytes, slave_id: int, quantity: Optional[int] = None, function: int = 0x03
+) -> Optional[Tuple[int, ...]]:
+    """
+    Validate a read response frame and return its raw 16-bit registers.
+
+    Returns None for a wrong slave/function, an exception frame, a short or
+    odd-length payload, a register count other than ``quantity`` or a CRC
+    mismatch.
+    """
+    if len(frame) < 5 or frame[0] != slave_id or frame[1] != function:
+        return None
+    byte_count = frame[2]
+    expected_len = 3 + byte_count + 2
+    if len(frame) < expected_len or byte_count < 2 or byte_count % 2:
+        return None
+    if quantity is not None and byte_count != quantity * 2:
+        return None
+    frame = frame[:expected_len]
+    if not check_crc(frame):
+        return None
+    return _payload_struct("H", byte_count // 2).unpack_from(frame, 3)
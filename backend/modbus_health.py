@@ -0,0 +1,152 @@
+import time
+from typing import Dict, Optional
+
+# Consecutive failed requests that open a slave's circuit breaker.
+BREAKER_FAILURE_THRESHOLD = 3
+# First probe delay after opening; doubles after each failed probe up to the max.
+BREAKER_BASE_PROBE_S = 1.0
+BREAKER_MAX_PROBE_S = 60.0
+
+OUTCOME_OK = "ok"
+OUTCOME_TIMEOUT = "timeout"
+OUTCOME_CRC = "crc_error"
+OUTCOME_EXCEPTION = "exception"
+OUTCOME_INVALID = "invalid"
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+
+class RegisterStats:
+    """Read counters for one register address."""
+
+    __slots__ = ("reads_ok", "reads_failed", "crc_errors", "latency_ms", "last_ok")
+
+    def __init__(self) -> None:
+        self.reads_ok = 0
+        self.reads_failed = 0
+        self.crc_errors = 0
+        self.latency_ms: Optional[float] = None
+        self.last_ok: Optional[float] = None
+
+    def record(self, outcome: str, latency_ms: float) -> None:
+        if outcome == OUTCOME_OK:
+            self.reads_ok += 1
+            self.last_ok = time.time()
+            # Exponentially weighted so the figure tracks the current bus state.
+            self.latency_ms = latency_ms if self.latency_ms is None else 0.8 * self.latency_ms + 0.2 * latency_ms
+            return
+        self.reads_failed += 1
+        if outcome == OUTCOME_CRC:
+            self.crc_errors += 1
+
+    def to_dict(self) -> Dict:
+        total = self.reads_ok + self.reads_failed
+        return {
+            "reads_ok": self.reads_ok,
+            "reads_failed": self.reads_failed,
+            "crc_errors": self.crc_errors,
+            "success_rate": round(self.reads_ok / total, 4) if total else None,
+            "latency_ms": round(self.latency_ms, 3) if self.latency_ms is not None else None,
+            "last_ok": self.last_ok,
+        }
+
+
+class SlaveHealth:
+    """
+    Request accounting and circuit breaker for one slave.
+
+    After ``failure_threshold`` consecutive timeouts/CRC errors the breaker
+    opens and the slave is skipped until a probe is due. A probe is a single
+    small read; success closes the breaker, failure re-opens it with a doubled
+    probe interval (capped at ``max_probe_s``). Exception replies count as
+    answers: the slave is alive even if it rejected the request.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        base_probe_s: float = BREAKER_BASE_PROBE_S,
+        max_probe_s: float = BREAKER_MAX_PROBE_S,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.base_probe_s = base_probe_s
+        self.max_probe_s = max_probe_s
+        self.state = BREAKER_CLOSED
+        self.probe_interval_s = base_probe_s
+        self.open_until = 0.0
+        self.consecutive_failures = 0
+        self.outcomes: Dict[str, int] = {}
+        self.requests = 0
+        self.latency_ms: Optional[float] = None
+        self.max_latency_ms = 0.0
+        self.skipped_polls = 0
+        self.times_opened = 0
+        self.registers: Dict[int, RegisterStats] = {}
+
+    def allow(self, now: float) -> bool:
+        """True if the slave may be polled now; moves an expired open breaker to half-open."""
+        if self.state == BREAKER_OPEN:
+            if now < self.open_until:
+                return False
+            self.state = BREAKER_HALF_OPEN
+        return True
+
+    def is_open(self) -> bool:
+        return self.state == BREAKER_OPEN
+
+    def record(self, outcome: str, latency_ms: float, now: float) -> Optional[str]:
+        """Account one request; returns the new breaker state if it changed."""
+        self.requests += 1
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        if outcome in (OUTCOME_OK, OUTCOME_EXCEPTION):
+            self.latency_ms = latency_ms if self.latency_ms is None else 0.8 * self.latency_ms + 0.2 * latency_ms
+            self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+            self.consecutive_failures = 0
+            if self.state != BREAKER_CLOSED:
+                self.state = BREAKER_CLOSED
+                self.probe_interval_s = self.base_probe_s
+                return BREAKER_CLOSED
+            return None
+
+        self.consecutive_failures += 1
+        if self.state == BREAKER_HALF_OPEN:
+            self.probe_interval_s = min(self.probe_interval_s * 2, self.max_probe_s)
+            self._open(now)
+            return BREAKER_OPEN
+        if self.state == BREAKER_CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self.probe_interval_s = self.base_probe_s
+            self._open(now)
+            self.times_opened += 1
+            return BREAKER_OPEN
+        return None
+
+    def _open(self, now: float) -> None:
+        self.state = BREAKER_OPEN
+        self.open_until = now + self.probe_interval_s
+
+    def register(self, address: int) -> RegisterStats:
+        stats = self.registers.get(address)
+        if stats is None:
+            stats = self.registers[address] = RegisterStats()
+        return stats
+
+    def to_dict(self, now: Optional[float] = None) -> Dict:
+        now = time.monotonic() if now is None else now
+        answered = self.outcomes.get(OUTCOME_OK, 0) + self.outcomes.get(OUTCOME_EXCEPTION, 0)
+        return {
+            "breaker": self.state,
+            "next_probe_in_s": round(max(0.0, self.open_until - now), 3) if self.state == BREAKER_OPEN else None,
+            "probe_interval_s": self.probe_interval_s,
+            "times_opened": self.times_opened,
+            "consecutive_failures": self.consecutive_failures,
+            "requests": self.requests,
+            "success_rate": round(answered / self.requests, 4) if self.requests else None,
+            "outcomes": dict(self.outcomes),
+            "crc_errors": self.outcomes.get(OUTCOME_CRC, 0),
+            "latency_ms": round(self.latency_ms, 3) if self.latency_ms is not None else None,
+            "max_latency_ms": round(self.max_latency_ms, 3),
+            "skipped_polls": self.skipped_polls,
+            "registers": {str(address): stats.to_dict() for address, stats in sorted(self.registers.items())},
+        }
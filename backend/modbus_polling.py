@@ -1,110 +1,190 @@
-import json
 import threading
 import time
-from datetime import datetime
-from typing import Dict, List, Optional
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
 
 import serial
 from sqlalchemy.orm import Session
 
+from alert_rules import alert_engine, publish_alerts
+from anomaly import anomaly_monitor, publish_anomalies
 from database import SessionLocal
+from log_setup import get_logger
+from modbus_codec import check_crc, crc16, decode_read_response, read_request
+from modbus_health import (
+    BREAKER_CLOSED, BREAKER_HALF_OPEN, BREAKER_OPEN,
+    OUTCOME_CRC, OUTCOME_EXCEPTION, OUTCOME_INVALID, OUTCOME_OK, OUTCOME_TIMEOUT,
+    SlaveHealth,
+)
+from metric_store import write_metric_sample
 from models import Device as DeviceModel, VFDReading as VFDReadingModel
+from register_plans import MODBUS_DEFAULT_MAX_GAP, RegisterPlan, get_register_plans, plan_block_reads
+from telemetry_filter import storage_filter
+from vfd_events import publish_vfd_transition, vfd_state_tracker
 
-FIELD_MAP = {
-    "frequency": "frequency",
-    "freq": "frequency",
-    "speed": "speed",
-    "rpm": "speed",
-    "current": "current",
-    "voltage": "voltage",
-    "power": "power",
-    "torque": "torque",
-    "status": "status",
-    "run_status": "status",
-    "fault_code": "fault_code",
-    "faultcode": "fault_code",
-    "fault": "fault_code",
-}
+_log = get_logger("modbus")
+
+# 8N1 framing on the wire: start bit + 8 data bits + 1 stop bit.
+RTU_BITS_PER_CHAR = 10
+# Default time a slave gets to start answering after the request is sent.
+MODBUS_DEFAULT_RESPONSE_TIMEOUT_MS = 100
 
 
 def calculate_crc(data: bytes) -> int:
-    crc = 0xFFFF
-    for b in data:
-        crc ^= b
-        for _ in range(8):
-            if crc & 1:
-                crc = (crc >> 1) ^ 0xA001
-            else:
-                crc >>= 1
-    return crc
+    return crc16(data)
+
+
+def rtu_char_time(baudrate: int) -> float:
+    """Seconds needed to transmit one RTU character at ``baudrate``."""
+    return RTU_BITS_PER_CHAR / float(baudrate)
+
+
+def rtu_frame_gap(baudrate: int) -> float:
+    """
+    Modbus RTU t3.5 inter-frame silence in seconds.
+
+    Above 19200 baud the spec fixes it at 1.75 ms instead of 3.5 characters.
+    """
+    if baudrate > 19200:
+        return 0.00175
+    return 3.5 * rtu_char_time(baudrate)
+
+
+def read_response_length(quantity: int) -> int:
+    """Byte length of a function 0x03 response carrying ``quantity`` registers."""
+    return 5 + 2 * quantity
 
 
 def build_read_request(slave_id: int, address: int, quantity: int = 1) -> bytes:
-    payload = bytearray(6)
-    payload[0] = slave_id
-    payload[1] = 0x03
-    payload[2] = (address >> 8) & 0xFF
-    payload[3] = address & 0xFF
-    payload[4] = (quantity >> 8) & 0xFF
-    payload[5] = quantity & 0xFF
-    crc = calculate_crc(payload)
-    payload.extend([crc & 0xFF, (crc >> 8) & 0xFF])
-    return bytes(payload)
-
-
-def parse_read_response(response: bytes, slave_id: int) -> Optional[int]:
-    if len(response) < 5:
-        return None
-    if response[0] != slave_id:
-        return None
-    function_code = response[1]
-    if function_code & 0x80:
-        return None
-    if function_code != 0x03:
-        return None
-    byte_count = response[2]
-    expected_len = 3 + byte_count + 2
-    if len(response) < expected_len:
-        return None
-    received_crc = response[expected_len - 2] | (response[expected_len - 1] << 8)
-    calculated_crc = calculate_crc(response[: expected_len - 2])
-    if received_crc != calculated_crc:
-        return None
-    if byte_count < 2:
+    return read_request(slave_id, address, quantity)
+
+
+def parse_read_registers(response: bytes, slave_id: int, quantity: Optional[int] = None) -> Optional[Tuple[int, ...]]:
+    """Decode a function 0x03 response into its 16-bit register values."""
+    return decode_read_response(response, slave_id, quantity)
+
+
+def parse_read_response(response: bytes, slave_id: int, quantity: int = 1) -> Optional[int]:
+    """Decode a function 0x03 response and return its first register value."""
+    values = parse_read_registers(response, slave_id, quantity)
+    if not values:
         return None
-    high = response[3]
-    low = response[4]
-    return (high << 8) + low
+    return values[0]
+
+
+@dataclass(frozen=True)
+class SlaveConfig:
+    """One drive on a bus. ``register_rates_ms`` overrides the poll rate per register name."""
+
+    slave_id: int
+    brand_key: str
+    device_id: Optional[int] = None
+    poll_interval_ms: int = 1000
+    register_rates_ms: Tuple[Tuple[str, int], ...] = ()
+
+
+@dataclass(frozen=True)
+class BusConfig:
+    """One RS-485 bus (serial port) and the slaves polled on it."""
+
+    port: str
+    baudrate: int = 9600
+    max_gap: int = MODBUS_DEFAULT_MAX_GAP
+    slaves: Tuple[SlaveConfig, ...] = ()
+    response_timeout_ms: int = MODBUS_DEFAULT_RESPONSE_TIMEOUT_MS
+
+
+class _SlaveState:
+    """Per-slave register plan, schedule and latest values owned by a bus worker."""
+
+    def __init__(self, config: SlaveConfig, plan: RegisterPlan) -> None:
+        self.config = config
+        self.latest_raw: Dict[int, int] = {}
+        self.health = SlaveHealth()
+        self.strict_blocks = False
+        self.device_cache: Optional[int] = None
+        self.device_missing = False
+        self.last_success: Optional[datetime] = None
+        self.reads_ok = 0
+        self.reads_failed = 0
+        self.overruns = 0
+        self.max_lag_ms = 0.0
+        self.apply_plan(plan)
+
+    def apply_plan(self, plan: RegisterPlan) -> None:
+        """Switch to a (re)compiled plan, keeping schedule and values of unchanged addresses."""
+        previous_due = {}
+        if getattr(self, "plan", None) is not None:
+            previous_due = {reg.address: due for reg, due in zip(self.registers, self.next_due)}
+        self.plan = plan
+        self.registers = plan.registers
+        rates = {name.strip().lower(): int(ms) for name, ms in self.config.register_rates_ms}
+        self.intervals = [rates.get(reg.key, self.config.poll_interval_ms) / 1000.0 for reg in plan.registers]
+        self.next_due = [previous_due.get(reg.address, 0.0) for reg in plan.registers]
+        self.addresses = set(plan.addresses)
+        self.latest_raw = {address: value for address, value in self.latest_raw.items() if address in self.addresses}
+
+    def schedule_next(self, index: int, now: float) -> int:
+        """
+        Advance register ``index`` on a fixed-rate grid anchored at its first poll.
+
+        Deadlines advance by whole intervals from the previous deadline rather
+        than from ``now``, so cycle time does not accumulate as drift. Periods
+        that were missed entirely are skipped (not bursted) and returned.
+        """
+        interval = self.intervals[index]
+        due = self.next_due[index]
+        if due == 0.0:
+            self.next_due[index] = now + interval
+            return 0
+        lag_ms = (now - due) * 1000.0
+        if lag_ms > self.max_lag_ms:
+            self.max_lag_ms = lag_ms
+        missed = int((now - due) // interval)
+        self.next_due[index] = due + (missed + 1) * interval
+        self.overruns += missed
+        return missed
+
+    def due_indexes(self, now: float) -> List[int]:
+        return [i for i, due in enumerate(self.next_due) if due <= now]
+
+    def earliest_due(self) -> float:
+        return min(self.next_due) if self.next_due else float("inf")
 
 
 class ModbusPoller:
-    def __init__(
-        self,
-        port: str,
-        baudrate: int,
-        slave_id: int,
-        poll_interval_ms: int,
-        register_source_path: str,
-        brand_key: str,
-        device_id: Optional[int],
-    ) -> None:
-        self.port = port
-        self.baudrate = baudrate
-        self.slave_id = slave_id
-        self.poll_interval_ms = poll_interval_ms
+    """
+    Worker thread that owns one serial port and polls every slave on it.
+
+    Slaves are interleaved round-robin so none is always served last, and each
+    register is scheduled on its own rate (``SlaveConfig.register_rates_ms``)
+    so fast values such as current can be sampled more often than energy.
+    """
+
+    def __init__(self, bus: BusConfig, register_source_path: str) -> None:
+        self.bus = bus
+        self.port = bus.port
+        self.baudrate = bus.baudrate
+        self.max_gap = bus.max_gap
+        self.response_timeout = bus.response_timeout_ms / 1000.0
+        self.char_time = rtu_char_time(bus.baudrate)
+        self.frame_gap = rtu_frame_gap(bus.baudrate)
         self.register_source_path = register_source_path
-        self.brand_key = brand_key
-        self.device_id = device_id
         self._stop_event = threading.Event()
         self._thread: Optional[threading.Thread] = None
         self._serial: Optional[serial.Serial] = None
-        self._registers: List[Dict] = []
-        self._device_cache: Optional[int] = None
+        self._slaves: List[_SlaveState] = []
+        self._round_robin = 0
+        self._bus_idle_at = 0.0
+        self._last_overrun_report = 0.0
+        self.cycles = 0
+        self.last_cycle_ms: Optional[float] = None
 
     def start(self) -> None:
         if self._thread and self._thread.is_alive():
             return
-        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread = threading.Thread(target=self._run, name=f"modbus-{self.port}", daemon=True)
         self._thread.start()
 
     def stop(self) -> None:
@@ -117,13 +197,66 @@ class ModbusPoller:
             except Exception:
                 pass
 
+    def is_alive(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def status(self) -> Dict:
+        return {
+            "port": self.port,
+            "baudrate": self.baudrate,
+            "alive": self.is_alive(),
+            "cycles": self.cycles,
+            "last_cycle_ms": self.last_cycle_ms,
+            "slaves": [
+                {
+                    "slave_id": state.config.slave_id,
+                    "brand": state.config.brand_key,
+                    "device_id": state.device_cache or state.config.device_id,
+                    "reads_ok": state.reads_ok,
+                    "reads_failed": state.reads_failed,
+                    "overruns": state.overruns,
+                    "max_lag_ms": round(state.max_lag_ms, 3),
+                    "health": state.health.to_dict(),
+                    "last_success": state.last_success.isoformat() if state.last_success else None,
+                }
+                for state in self._slaves
+            ],
+        }
+
+    def latest(self, device_id: int) -> List[Dict]:
+        """Latest polled value of every register of the slaves mapped to ``device_id``."""
+        values: List[Dict] = []
+        for state in list(self._slaves):
+            if (state.device_cache or state.config.device_id) != device_id:
+                continue
+            for reg in state.registers:
+                raw_value = state.latest_raw.get(reg.address)
+                if raw_value is None:
+                    continue
+                stats = state.health.registers.get(reg.address)
+                values.append({
+                    "slave_id": state.config.slave_id,
+                    "address": reg.address,
+                    "name": reg.name,
+                    "unit": reg.unit,
+                    "raw": raw_value,
+                    "value": round(raw_value * reg.divisor, 1),
+                    "timestamp": stats.last_ok if stats else None,
+                })
+        return values
+
     def _load_registers(self) -> None:
-        with open(self.register_source_path, "r", encoding="utf-8") as handle:
-            data = json.load(handle)
-        registers = data.get(self.brand_key)
-        if not registers:
-            raise ValueError(f"Brand '{self.brand_key}' not found in register map")
-        self._registers = registers
+        plans = get_register_plans(self.register_source_path)
+        self._slaves = [_SlaveState(config, plans.plan(config.brand_key)) for config in self.bus.slaves]
+
+    def _refresh_plans(self) -> None:
+        """Pick up recompiled plans after the register map changed on disk."""
+        plans = get_register_plans(self.register_source_path)
+        for state in self._slaves:
+            plan = plans.get(state.config.brand_key)
+            if plan is not None and plan.registers and plan is not state.plan:
+                state.apply_plan(plan)
+                state.strict_blocks = False
 
     def _ensure_serial(self) -> None:
         if self._serial and self._serial.is_open:
@@ -134,119 +267,346 @@ class ModbusPoller:
             bytesize=8,
             parity="N",
             stopbits=1,
-            timeout=1,
+            timeout=self.response_timeout,
+            # A gap longer than t3.5 ends the frame, so short (exception) replies
+            # return without waiting for the full expected length.
+            inter_byte_timeout=self.frame_gap,
         )
 
-    def _resolve_device_id(self, db: Session) -> Optional[int]:
-        if self._device_cache is not None:
-            return self._device_cache
-        if self.device_id is not None:
-            device = db.query(DeviceModel).filter(DeviceModel.id == self.device_id).first()
+    def _resolve_device_id(self, db: Session, state: _SlaveState) -> Optional[int]:
+        if state.device_cache is not None:
+            return state.device_cache
+        if state.config.device_id is not None:
+            device = db.query(DeviceModel).filter(DeviceModel.id == state.config.device_id).first()
             if device:
-                self._device_cache = device.id
-                return self._device_cache
+                state.device_cache = device.id
+                return state.device_cache
+            return None
         device = db.query(DeviceModel).order_by(DeviceModel.id.asc()).first()
         if device:
-            self._device_cache = device.id
-            return self._device_cache
+            state.device_cache = device.id
+            return state.device_cache
         return None
 
-    def _read_frame(self) -> Optional[bytes]:
+    def _read_frame(self, expected_len: int) -> Optional[bytes]:
+        """
+        Read one response frame of ``expected_len`` bytes.
+
+        The timeout covers the slave turnaround plus the frame's transmission
+        time at the bus baud rate, so a silent slave costs milliseconds rather
+        than a fixed one-second serial timeout.
+        """
         if not self._serial:
             return None
-        header = self._serial.read(3)
-        if len(header) < 3:
+        timeout = self.response_timeout + expected_len * self.char_time + self.frame_gap
+        if self._serial.timeout != timeout:
+            self._serial.timeout = timeout
+        frame = self._serial.read(expected_len)
+        if len(frame) < 5:
             return None
-        byte_count = header[2]
-        remainder = self._serial.read(byte_count + 2)
-        return header + remainder
+        return frame
+
+    def _transact(self, request: bytes, expected_len: int) -> Optional[bytes]:
+        """Send a request after the t3.5 bus silence and read its response."""
+        if not self._serial:
+            raise RuntimeError("Serial not available")
+        wait = self._bus_idle_at - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        # Drop late bytes from a previous timed-out exchange before talking again.
+        self._serial.reset_input_buffer()
+        self._serial.write(request)
+        self._serial.flush()
+        try:
+            return self._read_frame(expected_len)
+        finally:
+            self._bus_idle_at = time.monotonic() + self.frame_gap
+
+    def _request_registers(
+        self, state: _SlaveState, start: int, quantity: int
+    ) -> Tuple[Optional[Tuple[int, ...]], str]:
+        """Send one read request, account it in the slave's health and return (values, outcome)."""
+        slave_id = state.config.slave_id
+        sent_at = time.monotonic()
+        try:
+            request = build_read_request(slave_id, start, quantity)
+            response = self._transact(request, read_response_length(quantity)) or b""
+        except Exception:
+            response = b""
+        latency_ms = (time.monotonic() - sent_at) * 1000.0
+
+        values = parse_read_registers(response, slave_id, quantity)
+        if values is not None:
+            outcome = OUTCOME_OK
+        elif not response:
+            outcome = OUTCOME_TIMEOUT
+        elif len(response) == 5 and response[0] == slave_id and response[1] & 0x80:
+            outcome = OUTCOME_EXCEPTION
+        elif len(response) >= 5 and response[0] == slave_id and not check_crc(response[: 3 + response[2] + 2]):
+            outcome = OUTCOME_CRC
+        else:
+            outcome = OUTCOME_INVALID
+
+        health = state.health
+        for address in range(start, start + quantity):
+            if address in state.addresses:
+                health.register(address).record(outcome, latency_ms)
+        transition = health.record(outcome, latency_ms, time.monotonic())
+        if transition == BREAKER_OPEN:
+            self._breaker_opened(state)
+            _log.warning(
+                "breaker_open", "🔌 Modbus slave not answering; backing off", port=self.port, slave_id=slave_id,
+                outcome=outcome, probe_interval_s=round(health.probe_interval_s),
+            )
+        elif transition == BREAKER_CLOSED:
+            _log.info("breaker_closed", "✅ Modbus slave answering again", port=self.port, slave_id=slave_id)
+        return values, outcome
+
+    def _breaker_opened(self, state: _SlaveState) -> None:
+        """Drop the slave's latest values: after the outage they would be stale."""
+        state.latest_raw.clear()
+
+    def _read_addresses(self, state: _SlaveState, addresses: List[int]) -> Dict[int, int]:
+        """
+        Read the given addresses as planned block reads and return {address: raw_value}.
+
+        If the slave rejects a multi-register block with an exception (typically
+        an unmapped hole inside the gap), its registers are read individually
+        and the slave is switched to gap-free planning for the following cycles.
+        A silent slave is not retried register by register, and reading stops
+        as soon as its circuit breaker opens.
+        """
+        slave_id = state.config.slave_id
+        max_gap = 0 if state.strict_blocks else self.max_gap
+        if len(set(addresses)) == len(state.plan.addresses):
+            # Every register is due (the common single-rate case): reuse the precomputed layout.
+            blocks = state.plan.blocks(max_gap)
+        else:
+            blocks = plan_block_reads(addresses, max_gap)
+        result: Dict[int, int] = {}
+        for start, quantity in blocks:
+            if self._stop_event.is_set() or state.health.is_open():
+                break
+            values, outcome = self._request_registers(state, start, quantity)
+            if values is not None:
+                result.update((start + offset, value) for offset, value in enumerate(values))
+                continue
+            if quantity == 1 or outcome != OUTCOME_EXCEPTION:
+                continue
+            if not state.strict_blocks:
+                state.strict_blocks = True
+                _log.warning(
+                    "block_rejected", "⚠️ Modbus block rejected; re-planning without gaps", port=self.port,
+                    slave_id=slave_id, start=start, quantity=quantity,
+                )
+            wanted = [address for address in addresses if start <= address < start + quantity]
+            for sub_start, sub_quantity in plan_block_reads(wanted, 0):
+                sub_values, _ = self._request_registers(state, sub_start, sub_quantity)
+                if sub_values is not None:
+                    result.update((sub_start + offset, value) for offset, value in enumerate(sub_values))
+        return result
+
+    def _poll_slave(self, state: _SlaveState, now: float) -> bool:
+        """
+        Read the registers that are due on one slave. Returns True if anything
+        was read and the slave's values should be persisted.
+
+        A half-open probe reads a single register and returns False: it only
+        tells whether the slave answers again, and the other registers are read
+        (and the reading stored) on the next cycle.
+        """
+        due = state.due_indexes(now)
+        if not due:
+            return False
+        if not state.health.allow(now):
+            # Breaker open: keep the schedule moving without spending bus time.
+            for i in due:
+                state.schedule_next(i, now)
+            state.health.skipped_polls += 1
+            return False
+        registers = state.registers
+        addresses = [registers[i].address for i in due]
+        probing = state.health.state == BREAKER_HALF_OPEN
+        if probing:
+            # Probe with the smallest possible request.
+            addresses = addresses[:1]
+        requested = set(addresses)
+        values = self._read_addresses(state, addresses)
+        any_read = False
+        for i in due:
+            address = registers[i].address
+            state.schedule_next(i, now)
+            if address not in requested:
+                continue
+            raw_value = values.get(address)
+            if raw_value is None:
+                state.reads_failed += 1
+                continue
+            state.latest_raw[address] = raw_value
+            state.reads_ok += 1
+            any_read = True
+        if any_read:
+            state.last_success = datetime.utcnow()
+        return any_read and not probing
+
+    def _reading_fields(self, state: _SlaveState) -> Dict:
+        """VFDReading column values built from the latest value of every register of a slave."""
+        custom_payload: Dict[str, Dict] = {}
+        mapped_fields: Dict[str, str] = {}
+        status_value: Optional[int] = None
+        fault_code_value: Optional[int] = None
+
+        for reg in state.registers:
+            raw_value = state.latest_raw.get(reg.address)
+            if raw_value is None:
+                continue
+            value = round(raw_value * reg.divisor, 1)
+            custom_payload[reg.name] = {
+                "address": reg.address,
+                "raw": raw_value,
+                "value": value,
+                "unit": reg.unit,
+            }
+            if reg.field == "status":
+                status_value = raw_value
+            elif reg.field == "fault_code":
+                fault_code_value = raw_value
+            elif reg.field:
+                mapped_fields[reg.field] = str(value)
+
+        return {
+            "frequency": mapped_fields.get("frequency"),
+            "speed": mapped_fields.get("speed"),
+            "current": mapped_fields.get("current"),
+            "voltage": mapped_fields.get("voltage"),
+            "power": mapped_fields.get("power"),
+            "torque": mapped_fields.get("torque"),
+            "status": status_value,
+            "fault_code": fault_code_value,
+            "custom_data": custom_payload,
+        }
+
+    def _sample(self, state: _SlaveState) -> Dict[str, float]:
+        """Latest scaled value per field name, as compared by the storage deadband filter."""
+        sample: Dict[str, float] = {}
+        for reg in state.registers:
+            raw_value = state.latest_raw.get(reg.address)
+            if raw_value is not None:
+                sample[reg.field or reg.key] = reg.scale(raw_value)
+        return sample
+
+    @staticmethod
+    def _units(state: _SlaveState) -> Dict[str, str]:
+        return {reg.field or reg.key: reg.unit for reg in state.registers}
+
+    def _stream(self, state: _SlaveState) -> Tuple[str, str, int]:
+        """Deadband stream key of a slave."""
+        return ("modbus", self.port, state.config.slave_id)
+
+    def _should_store(self, state: _SlaveState, sample: Dict[str, float]) -> bool:
+        return storage_filter.should_store(
+            self._stream(state),
+            sample,
+            "modbus",
+            brand=state.config.brand_key,
+            device_id=state.device_cache or state.config.device_id,
+        )
+
+    def _observe_sample(self, state: _SlaveState, sample: Dict[str, float]) -> None:
+        """Run every polled sample (stored or not) through the anomaly detectors, alert rules and state tracker."""
+        device_id = state.device_cache if state.device_cache is not None else state.config.device_id
+        if device_id is not None:
+            publish_anomalies(anomaly_monitor.observe(device_id, sample))
+            publish_alerts(alert_engine.observe(device_id, sample))
+            publish_vfd_transition(vfd_state_tracker.observe(device_id, sample))
+
+    def _persist(self, state: _SlaveState) -> None:
+        """Store the latest value of every register of a slave as one reading row."""
+        sample = self._sample(state)
+        self._observe_sample(state, sample)
+        if not self._should_store(state, sample):
+            return
+        fields = self._reading_fields(state)
+        sampled_at = datetime.now(timezone.utc)
+        db = SessionLocal()
+        try:
+            device_id = self._resolve_device_id(db, state)
+            if device_id is None:
+                # Logged once per slave, not on every poll cycle.
+                if not state.device_missing:
+                    state.device_missing = True
+                    _log.warning(
+                        "no_device", "⚠️ Modbus polling skipped: no device for slave", port=self.port,
+                        slave_id=state.config.slave_id,
+                    )
+                return
+            state.device_missing = False
+            reading = VFDReadingModel(device_id=device_id, timestamp=sampled_at, **fields)
+            # Every register, including those without a VFDReading column, as narrow metric rows.
+            write_metric_sample(db, device_id, sampled_at, sample, self._units(state))
+            # Keep device status aligned with live Modbus telemetry.
+            device = db.query(DeviceModel).filter(DeviceModel.id == device_id).first()
+            if device:
+                device.is_online = True
+                device.last_heartbeat = datetime.utcnow()
+            db.add(reading)
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            # The deadband already took this sample as its baseline; drop it so the next sample is stored.
+            storage_filter.forget(self._stream(state))
+            _log.error("db_error", "❌ Modbus polling DB error", port=self.port, slave_id=state.config.slave_id, error=str(exc))
+        finally:
+            db.close()
+
+    def _report_overruns(self) -> None:
+        """Log missed poll periods at most once a minute per bus."""
+        now = time.monotonic()
+        if now - self._last_overrun_report < 60.0:
+            return
+        overrun = [state for state in self._slaves if state.overruns]
+        if not overrun:
+            return
+        self._last_overrun_report = now
+        summary = ", ".join(
+            f"slave {state.config.slave_id}: {state.overruns} missed (max lag {state.max_lag_ms:.0f} ms)"
+            for state in overrun
+        )
+        _log.warning("overrun", "⏱️ Modbus poll overrun", port=self.port, slaves=summary)
 
     def _run(self) -> None:
         try:
             self._load_registers()
         except Exception as exc:
-            print(f"Modbus register load failed: {exc}")
+            _log.error("register_load_failed", "❌ Modbus register load failed", port=self.port, error=str(exc))
             return
 
         while not self._stop_event.is_set():
             try:
                 self._ensure_serial()
             except Exception as exc:
-                print(f"Modbus serial open failed on {self.port}: {exc}")
-                time.sleep(2)
+                _log.error("serial_open_failed", "❌ Modbus serial open failed", port=self.port, error=str(exc))
+                self._stop_event.wait(2)
                 continue
 
-            cycle_values: List[str] = []
-            custom_payload: Dict[str, Dict[str, str]] = {}
-            mapped_fields: Dict[str, str] = {}
-            status_value: Optional[int] = None
-            fault_code_value: Optional[int] = None
-
-            for reg in self._registers:
+            self._refresh_plans()
+            cycle_start = time.monotonic()
+            # Rotate the starting slave every cycle so none is always served last.
+            count = len(self._slaves)
+            offset = self._round_robin % count if count else 0
+            self._round_robin += 1
+            polled = False
+            for state in self._slaves[offset:] + self._slaves[:offset]:
                 if self._stop_event.is_set():
                     break
-                address = int(reg["address"])
-                name = str(reg["name"])
-                unit = str(reg.get("unit", ""))
-                divisor = float(reg.get("divisor", 1))
-
-                try:
-                    request = build_read_request(self.slave_id, address, 1)
-                    if not self._serial:
-                        raise RuntimeError("Serial not available")
-                    self._serial.write(request)
-                    response = self._read_frame()
-                    raw_value = parse_read_response(response or b"", self.slave_id)
-                    if raw_value is None:
-                        raise ValueError("Invalid response")
-                    value = round(raw_value * divisor, 1)
-                    cycle_values.append(str(value))
-                    custom_payload[name] = {
-                        "address": str(address),
-                        "raw": str(raw_value),
-                        "value": str(value),
-                        "unit": unit,
-                    }
-                    field_key = FIELD_MAP.get(name.strip().lower())
-                    if field_key:
-                        if field_key == "status":
-                            status_value = int(raw_value)
-                        elif field_key == "fault_code":
-                            fault_code_value = int(raw_value)
-                        else:
-                            mapped_fields[field_key] = str(value)
-                except Exception:
-                    cycle_values.append("ERROR")
-            if cycle_values and not self._stop_event.is_set():
-                db = SessionLocal()
-                try:
-                    device_id = self._resolve_device_id(db)
-                    if device_id is None:
-                        print("Modbus polling skipped: no device available")
-                    else:
-                        reading = VFDReadingModel(
-                            device_id=device_id,
-                            frequency=mapped_fields.get("frequency"),
-                            speed=mapped_fields.get("speed"),
-                            current=mapped_fields.get("current"),
-                            voltage=mapped_fields.get("voltage"),
-                            power=mapped_fields.get("power"),
-                            torque=mapped_fields.get("torque"),
-                            status=status_value,
-                            fault_code=fault_code_value,
-                            custom_data=json.dumps(custom_payload),
-                        )
-                        # Keep device status aligned with live Modbus telemetry.
-                        device = db.query(DeviceModel).filter(DeviceModel.id == device_id).first()
-                        if device:
-                            device.is_online = True
-                            device.last_heartbeat = datetime.utcnow()
-                        db.add(reading)
-                        db.commit()
-                except Exception as exc:
-                    db.rollback()
-                    print(f"Modbus polling DB error: {exc}")
-                finally:
-                    db.close()
-
-            time.sleep(self.poll_interval_ms / 1000.0)
+                if self._poll_slave(state, time.monotonic()):
+                    polled = True
+                    if not self._stop_event.is_set():
+                        self._persist(state)
+            if polled:
+                self.cycles += 1
+                self.last_cycle_ms = round((time.monotonic() - cycle_start) * 1000.0, 3)
+            self._report_overruns()
+
+            next_due = min((state.earliest_due() for state in self._slaves), default=time.monotonic() + 1.0)
+            self._stop_event.wait(max(0.0, min(next_due - time.monotonic(), 1.0)))
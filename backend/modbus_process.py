@@ -0,0 +1,620 @@
+"""
+Poller-process mode for Modbus polling.
+
+The bus workers run in a child process so their CRC/decode loops do not
+compete with request handling for the GIL, and a crash on either side leaves
+the other running. Latest register values are published through a
+``multiprocessing.shared_memory`` block with a fixed layout (one slot per
+device, slave and register) that the API reads in place, and readings are
+persisted by a batching writer thread inside the child. Anomaly and alert
+events detected in the child are forwarded to the API process over a queue,
+and alert rule changes are sent to the child over another.
+"""
+import multiprocessing
+import queue
+import signal
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from multiprocessing import shared_memory
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, update
+
+from alert_rules import alert_engine, load_alert_rules, publish_alerts
+from anomaly import anomaly_monitor
+from database import SessionLocal
+from log_setup import get_logger, setup_logging, stop_logging
+from metric_store import insert_metric_samples, metric_sample_rows
+from models import Device as DeviceModel, VFDReading as VFDReadingModel
+from modbus_polling import BusConfig, ModbusPoller, SlaveConfig
+from register_plans import get_register_plans
+from telemetry_filter import storage_filter
+
+_log = get_logger("modbus")
+
+# Rows buffered by the child's writer before a flush is forced.
+MODBUS_PERSIST_BATCH_SIZE = 200
+# Longest time a row waits in the writer before it is flushed.
+MODBUS_PERSIST_FLUSH_MS = 1000
+# Anomaly/alert events buffered between the child and the API process; extra events are dropped.
+ANOMALY_EVENT_QUEUE_SIZE = 1000
+# How often the child publishes its bus status to the API process.
+STATUS_INTERVAL_S = 2.0
+
+SlotKey = Tuple[int, int, int]  # (device_id, slave_id, address)
+
+
+class LatestValueTable:
+    """
+    Fixed-layout latest-value array in shared memory.
+
+    Layout: a 16-byte header (magic, version, slot count), a key directory of
+    ``(device_id, slave_id, address)`` per slot, then one 24-byte slot per key
+    holding ``(seq, raw, value, timestamp)``. Each slot has a single writer
+    and is guarded by a seqlock: ``seq`` is odd while the slot is being
+    written, so readers retry instead of returning a torn value. A slot with
+    ``seq == 0`` has never been written; a zero timestamp marks one cleared
+    because its slave stopped answering.
+    """
+
+    MAGIC = b"MBLV"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHHI4x")
+    KEY = struct.Struct("<iHH")
+    SEQ = struct.Struct("<I")
+    DATA = struct.Struct("<Idd")
+    SLOT_SIZE = SEQ.size + DATA.size
+    READ_RETRIES = 16
+
+    def __init__(self, shm: shared_memory.SharedMemory, keys: List[SlotKey], owner: bool) -> None:
+        self.shm = shm
+        self.name = shm.name
+        self.keys = keys
+        self.owner = owner
+        self._index = {key: i for i, key in enumerate(keys)}
+        self._slots_offset = self.HEADER.size + len(keys) * self.KEY.size
+
+    @classmethod
+    def _size(cls, count: int) -> int:
+        return cls.HEADER.size + count * (cls.KEY.size + cls.SLOT_SIZE)
+
+    @classmethod
+    def create(cls, keys: Iterable[SlotKey]) -> "LatestValueTable":
+        keys = sorted(set(keys))
+        shm = shared_memory.SharedMemory(create=True, size=max(cls._size(len(keys)), 1))
+        buf = shm.buf
+        buf[: cls._size(len(keys))] = bytes(cls._size(len(keys)))
+        cls.HEADER.pack_into(buf, 0, cls.MAGIC, cls.VERSION, 0, len(keys))
+        for i, key in enumerate(keys):
+            cls.KEY.pack_into(buf, cls.HEADER.size + i * cls.KEY.size, *key)
+        return cls(shm, keys, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "LatestValueTable":
+        shm = shared_memory.SharedMemory(name=name)
+        magic, version, _, count = cls.HEADER.unpack_from(shm.buf, 0)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            shm.close()
+            raise ValueError(f"Shared memory block {name} is not a Modbus latest-value table")
+        keys = [tuple(cls.KEY.unpack_from(shm.buf, cls.HEADER.size + i * cls.KEY.size)) for i in range(count)]
+        return cls(shm, keys, owner=False)
+
+    def slot(self, device_id: int, slave_id: int, address: int) -> Optional[int]:
+        return self._index.get((device_id, slave_id, address))
+
+    def write(self, index: int, raw: int, value: float, timestamp: float) -> None:
+        buf = self.shm.buf
+        offset = self._slots_offset + index * self.SLOT_SIZE
+        seq = self.SEQ.unpack_from(buf, offset)[0]
+        self.SEQ.pack_into(buf, offset, (seq + 1) & 0xFFFFFFFF)
+        self.DATA.pack_into(buf, offset + self.SEQ.size, raw, value, timestamp)
+        self.SEQ.pack_into(buf, offset, (seq + 2) & 0xFFFFFFFF)
+
+    def clear(self, index: int) -> None:
+        """Invalidate a slot (readers get None until the next write); seq keeps increasing."""
+        self.write(index, 0, 0.0, 0.0)
+
+    def read(self, index: int) -> Optional[Tuple[int, float, float]]:
+        """Return (raw, value, timestamp) of a slot, or None if it was never written."""
+        buf = self.shm.buf
+        offset = self._slots_offset + index * self.SLOT_SIZE
+        for _ in range(self.READ_RETRIES):
+            seq = self.SEQ.unpack_from(buf, offset)[0]
+            if seq == 0:
+                return None
+            if seq & 1:
+                continue
+            data = self.DATA.unpack_from(buf, offset + self.SEQ.size)
+            if self.SEQ.unpack_from(buf, offset)[0] == seq:
+                # A zero timestamp marks a cleared slot.
+                return data if data[2] else None
+        return None
+
+    def read_device(self, device_id: int) -> List[Tuple[SlotKey, Tuple[int, float, float]]]:
+        result = []
+        for index, key in enumerate(self.keys):
+            if key[0] != device_id:
+                continue
+            data = self.read(index)
+            if data is not None:
+                result.append((key, data))
+        return result
+
+    def close(self) -> None:
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class BatchWriter:
+    """
+    Background writer that inserts VFD reading rows in batches.
+
+    Rows are flushed as one multi-row INSERT when ``batch_size`` rows are
+    pending or the oldest pending row is ``flush_interval_s`` old, and the
+    devices of the batch are marked online in the same transaction.
+    """
+
+    def __init__(self, batch_size: int = MODBUS_PERSIST_BATCH_SIZE, flush_interval_ms: int = MODBUS_PERSIST_FLUSH_MS) -> None:
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_s = flush_interval_ms / 1000.0
+        self._queue: "queue.Queue[Dict]" = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.rows_written = 0
+        self.batches = 0
+        self.errors = 0
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="modbus-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+
+    def put(
+        self,
+        row: Dict,
+        sample: Optional[Dict[str, float]] = None,
+        units: Optional[Dict[str, str]] = None,
+        stream: Optional[Hashable] = None,
+    ) -> None:
+        """
+        Queue one VFD reading row and, optionally, its per-metric sample for
+        metric_samples and the deadband stream it passed (forgotten if the
+        batch is dropped).
+        """
+        self._queue.put((row, sample, units, stream))
+
+    def _run(self) -> None:
+        pending: List[Tuple[Dict, Optional[Dict], Optional[Dict], Optional[Hashable]]] = []
+        oldest = 0.0
+        while True:
+            timeout = self.flush_interval_s - (time.monotonic() - oldest) if pending else self.flush_interval_s
+            try:
+                row = self._queue.get(timeout=max(0.0, timeout))
+                if not pending:
+                    oldest = time.monotonic()
+                pending.append(row)
+            except queue.Empty:
+                pass
+            stopping = self._stop_event.is_set()
+            if stopping:
+                while True:
+                    try:
+                        pending.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+            if pending and (
+                stopping or len(pending) >= self.batch_size or time.monotonic() - oldest >= self.flush_interval_s
+            ):
+                self._flush(pending)
+                pending = []
+            if stopping:
+                return
+
+    def _flush(self, items: List[Tuple[Dict, Optional[Dict], Optional[Dict], Optional[Hashable]]]) -> None:
+        rows = [row for row, _, _, _ in items]
+        db = SessionLocal()
+        try:
+            db.execute(insert(VFDReadingModel), rows)
+            metric_rows: List[Dict] = []
+            for row, sample, units, _ in items:
+                if sample:
+                    metric_rows.extend(metric_sample_rows(db, row["device_id"], row["timestamp"], sample, units))
+            insert_metric_samples(db, metric_rows)
+            device_ids = {row["device_id"] for row in rows}
+            db.execute(
+                update(DeviceModel)
+                .where(DeviceModel.id.in_(device_ids))
+                .values(is_online=True, last_heartbeat=datetime.utcnow())
+            )
+            db.commit()
+            self.rows_written += len(rows)
+            self.batches += 1
+        except Exception as exc:
+            db.rollback()
+            self.errors += 1
+            # The deadband took the dropped samples as baselines; forget them so the next samples are stored.
+            for stream in {stream for _, _, _, stream in items if stream is not None}:
+                storage_filter.forget(stream)
+            _log.error("batch_write_failed", "❌ Modbus batch write failed; rows dropped", rows=len(rows), error=str(exc))
+        finally:
+            db.close()
+
+    def status(self) -> Dict:
+        return {
+            "pending": self._queue.qsize(),
+            "rows_written": self.rows_written,
+            "batches": self.batches,
+            "errors": self.errors,
+        }
+
+
+class _ProcessPoller(ModbusPoller):
+    """Bus worker that publishes to the shared latest-value table and the batch writer."""
+
+    def __init__(self, bus: BusConfig, register_source_path: str, table: LatestValueTable, writer: BatchWriter) -> None:
+        super().__init__(bus, register_source_path)
+        self.table = table
+        self.writer = writer
+
+    def _breaker_opened(self, state) -> None:
+        super()._breaker_opened(state)
+        device_id = state.config.device_id
+        if device_id is None:
+            return
+        for reg in state.registers:
+            index = self.table.slot(device_id, state.config.slave_id, reg.address)
+            if index is not None:
+                self.table.clear(index)
+
+    def _persist(self, state) -> None:
+        device_id = state.config.device_id
+        if device_id is None:
+            return
+        slave_id = state.config.slave_id
+        for reg in state.registers:
+            raw_value = state.latest_raw.get(reg.address)
+            # Addresses added by a register map hot reload get a slot on the next topology apply.
+            index = self.table.slot(device_id, slave_id, reg.address)
+            if raw_value is None or index is None:
+                continue
+            stats = state.health.registers.get(reg.address)
+            self.table.write(
+                index,
+                raw_value,
+                round(raw_value * reg.divisor, 1),
+                stats.last_ok if stats and stats.last_ok else time.time(),
+            )
+        sample = self._sample(state)
+        self._observe_sample(state, sample)
+        if not self._should_store(state, sample):
+            return
+        # Rows are inserted later in a batch, so stamp them with the poll time.
+        self.writer.put(
+            {"device_id": device_id, "timestamp": datetime.now(timezone.utc), **self._reading_fields(state)},
+            sample,
+            self._units(state),
+            self._stream(state),
+        )
+
+
+def latest_value_keys(buses: List[BusConfig], register_source_path: str) -> List[SlotKey]:
+    """Slot keys for every register of every slave with a device id."""
+    plans = get_register_plans(register_source_path)
+    keys: List[SlotKey] = []
+    for bus in buses:
+        for slave in bus.slaves:
+            if slave.device_id is None:
+                continue
+            plan = plans.get(slave.brand_key)
+            for address in plan.addresses if plan else ():
+                keys.append((slave.device_id, slave.slave_id, address))
+    return keys
+
+
+def resolve_device_ids(buses: List[BusConfig]) -> List[BusConfig]:
+    """
+    Fill in the device id of slaves that have none (first device, as in thread mode).
+
+    The slot layout is fixed when the child starts, so device ids must be
+    known up front. Slaves whose configured device does not exist are dropped.
+    """
+    db = SessionLocal()
+    try:
+        existing = {row.id for row in db.query(DeviceModel.id).all()}
+    finally:
+        db.close()
+    fallback = min(existing) if existing else None
+
+    resolved: List[BusConfig] = []
+    for bus in buses:
+        slaves: List[SlaveConfig] = []
+        for slave in bus.slaves:
+            device_id = slave.device_id if slave.device_id is not None else fallback
+            if device_id is None or device_id not in existing:
+                _log.warning("no_device", "⚠️ Modbus polling skipped: no device for slave", port=bus.port, slave_id=slave.slave_id)
+                continue
+            slaves.append(SlaveConfig(
+                slave_id=slave.slave_id,
+                brand_key=slave.brand_key,
+                device_id=device_id,
+                poll_interval_ms=slave.poll_interval_ms,
+                register_rates_ms=slave.register_rates_ms,
+            ))
+        resolved.append(BusConfig(
+            port=bus.port,
+            baudrate=bus.baudrate,
+            max_gap=bus.max_gap,
+            slaves=tuple(slaves),
+            response_timeout_ms=bus.response_timeout_ms,
+        ))
+    return resolved
+
+
+def run_poller_process(
+    buses: List[BusConfig],
+    register_source_path: str,
+    shm_name: str,
+    stop_event,
+    status_queue,
+    event_queue,
+    rules_queue,
+    batch_size: int,
+    flush_interval_ms: int,
+) -> None:
+    """Entry point of the poller child process."""
+    # Ctrl+C reaches the whole process group; shutdown is driven by the API process.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # A spawned child does not import main.py, so it starts its own log writer.
+    setup_logging()
+
+    def forwarder(kind: str):
+        def forward_event(event: Dict) -> None:
+            try:
+                event_queue.put_nowait((kind, event))
+            except queue.Full:
+                pass
+        return forward_event
+
+    def apply_rule_updates() -> None:
+        while not stop_event.is_set():
+            try:
+                rules = rules_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (OSError, ValueError, EOFError):
+                return
+            alert_engine.load(rules)
+
+    # Events are stored by the child; the API process pushes them to WebSocket clients.
+    anomaly_monitor.notifier = forwarder("anomaly")
+    alert_engine.notifier = forwarder("alert")
+    db = SessionLocal()
+    try:
+        alert_engine.load(*load_alert_rules(db))
+    except Exception as exc:
+        _log.error("alert_rules_load_failed", "⚠️ Alert rules load failed", error=str(exc))
+    finally:
+        db.close()
+    # Started after the initial load: updates always carry the full rule set.
+    threading.Thread(target=apply_rule_updates, name="alert-rule-updates", daemon=True).start()
+    table = LatestValueTable.attach(shm_name)
+    writer = BatchWriter(batch_size, flush_interval_ms)
+    writer.start()
+    pollers = [_ProcessPoller(bus, register_source_path, table, writer) for bus in buses]
+    for poller in pollers:
+        poller.start()
+    try:
+        while not stop_event.wait(STATUS_INTERVAL_S):
+            publish_alerts(alert_engine.check_silence())
+            snapshot = {
+                "buses": [poller.status() for poller in pollers],
+                "writer": writer.status(),
+                "storage_filter": storage_filter.snapshot(),
+                "anomaly": anomaly_monitor.snapshot(),
+                "alerts": alert_engine.snapshot(),
+            }
+            try:
+                # Only the newest snapshot matters; drop one the API has not read yet.
+                status_queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                status_queue.put_nowait(snapshot)
+            except queue.Full:
+                pass
+    finally:
+        for poller in pollers:
+            poller.stop()
+        writer.stop()
+        table.close()
+        # multiprocessing exits the child without running atexit handlers.
+        stop_logging()
+
+
+class ModbusProcessRunner:
+    """
+    Drop-in replacement for ModbusScheduler that polls in a child process.
+
+    The latest-value layout is fixed per child, so ``apply`` restarts the
+    child (with a fresh shared-memory table) whenever the topology changes.
+    """
+
+    def __init__(
+        self,
+        register_source_path: str,
+        batch_size: int = MODBUS_PERSIST_BATCH_SIZE,
+        flush_interval_ms: int = MODBUS_PERSIST_FLUSH_MS,
+    ) -> None:
+        self.register_source_path = register_source_path
+        self.batch_size = batch_size
+        self.flush_interval_ms = flush_interval_ms
+        # Spawn, not fork: the API process holds an event loop, DB pool and threads.
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._process = None
+        self._stop_event = None
+        self._status_queue = None
+        self._event_queue = None
+        self._rules_queue = None
+        self._event_thread: Optional[threading.Thread] = None
+        self._table: Optional[LatestValueTable] = None
+        self._buses: List[BusConfig] = []
+        self._brands: Dict[Tuple[int, int], str] = {}
+        self._last_status: Dict = {}
+
+    def is_alive(self) -> bool:
+        return bool(self._process and self._process.is_alive())
+
+    def apply(self, buses: List[BusConfig]) -> Dict[str, List[str]]:
+        if len({bus.port for bus in buses}) != len(buses):
+            raise ValueError("Each serial port may only appear once in the Modbus topology")
+        buses = resolve_device_ids(buses)
+        changes: Dict[str, List[str]] = {"started": [], "restarted": [], "stopped": [], "unchanged": []}
+        with self._lock:
+            current = {bus.port: bus for bus in self._buses}
+            wanted = {bus.port: bus for bus in buses}
+            if current == wanted and self.is_alive():
+                changes["unchanged"] = list(wanted)
+                return changes
+            was_running = self._process is not None
+            self._stop_locked()
+            for port in current:
+                if port not in wanted:
+                    changes["stopped"].append(port)
+            for port in wanted:
+                changes["restarted" if was_running and port in current else "started"].append(port)
+            self._start_locked(buses)
+        return changes
+
+    def _start_locked(self, buses: List[BusConfig]) -> None:
+        self._brands = {(slave.device_id, slave.slave_id): slave.brand_key for bus in buses for slave in bus.slaves}
+        self._table = LatestValueTable.create(latest_value_keys(buses, self.register_source_path))
+        self._stop_event = self._context.Event()
+        self._status_queue = self._context.Queue(maxsize=1)
+        self._event_queue = self._context.Queue(maxsize=ANOMALY_EVENT_QUEUE_SIZE)
+        self._rules_queue = self._context.Queue()
+        self._process = self._context.Process(
+            target=run_poller_process,
+            args=(
+                buses, self.register_source_path, self._table.name, self._stop_event,
+                self._status_queue, self._event_queue, self._rules_queue, self.batch_size, self.flush_interval_ms,
+            ),
+            name="modbus-poller",
+            daemon=True,
+        )
+        self._process.start()
+        self._event_thread = threading.Thread(
+            target=self._forward_events,
+            args=(self._event_queue, self._stop_event),
+            name="modbus-events",
+            daemon=True,
+        )
+        self._event_thread.start()
+        self._buses = buses
+        self._last_status = {}
+
+    def _stop_locked(self) -> None:
+        if self._process is not None:
+            self._stop_event.set()
+            self._process.join(timeout=15)
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join(timeout=2)
+            self._status_queue.close()
+            self._event_thread.join(timeout=2)
+            self._event_queue.close()
+            self._rules_queue.close()
+            self._process = None
+        if self._table is not None:
+            self._table.close()
+            self._table = None
+        self._buses = []
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stop_locked()
+
+    def update_alert_rules(self, rules: List[Dict]) -> None:
+        """Send the full enabled rule set to the child's alert engine."""
+        with self._lock:
+            if self._rules_queue is not None and self.is_alive():
+                self._rules_queue.put(rules)
+
+    @staticmethod
+    def _forward_events(event_queue, stop_event) -> None:
+        """Hand anomaly and alert events from the child to this process's notifiers."""
+        while not stop_event.is_set():
+            try:
+                kind, event = event_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (OSError, ValueError, EOFError):
+                return
+            notifier = (alert_engine if kind == "alert" else anomaly_monitor).notifier
+            if notifier is not None:
+                try:
+                    notifier(event)
+                except Exception as exc:
+                    _log.warning("notify_failed", f"⚠️ {kind.capitalize()} notification failed", error=str(exc))
+
+    def _drain_status(self) -> Dict:
+        if self._status_queue is not None:
+            try:
+                while True:
+                    self._last_status = self._status_queue.get_nowait()
+            except (queue.Empty, OSError, ValueError):
+                pass
+        return self._last_status
+
+    def status(self) -> List[Dict]:
+        with self._lock:
+            snapshot = self._drain_status()
+            alive = self.is_alive()
+            pid = self._process.pid if self._process else None
+            buses = snapshot.get("buses")
+            if not buses:
+                buses = [{"port": bus.port, "baudrate": bus.baudrate, "cycles": 0, "slaves": []} for bus in self._buses]
+            return [
+                {
+                    **bus,
+                    "alive": alive and bus.get("alive", True),
+                    "pid": pid,
+                    "writer": snapshot.get("writer"),
+                    "storage_filter": snapshot.get("storage_filter"),
+                    "anomaly": snapshot.get("anomaly"),
+                    "alerts": snapshot.get("alerts"),
+                }
+                for bus in buses
+            ]
+
+    def latest(self, device_id: int) -> List[Dict]:
+        """Latest values of a device read in place from the shared-memory table."""
+        with self._lock:
+            table = self._table
+            if table is None:
+                return []
+            plans = get_register_plans(self.register_source_path)
+            values: List[Dict] = []
+            for (_, slave_id, address), (raw, value, timestamp) in table.read_device(device_id):
+                plan = plans.get(self._brands.get((device_id, slave_id), ""))
+                reg = plan.by_address.get(address) if plan else None
+                values.append({
+                    "slave_id": slave_id,
+                    "address": address,
+                    "name": reg.name if reg else "",
+                    "unit": reg.unit if reg else "",
+                    "raw": raw,
+                    "value": value,
+                    "timestamp": timestamp,
+                })
+            return values
@@ -0,0 +1,253 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from modbus_polling import (
+    MODBUS_DEFAULT_MAX_GAP, MODBUS_DEFAULT_RESPONSE_TIMEOUT_MS, BusConfig, ModbusPoller, SlaveConfig
+)
+from models import ModbusSlave as ModbusSlaveModel
+from schemas import ModbusTopology
+
+
+def topology_from_schema(
+    topology: ModbusTopology,
+    default_max_gap: int = MODBUS_DEFAULT_MAX_GAP,
+    default_response_timeout_ms: int = MODBUS_DEFAULT_RESPONSE_TIMEOUT_MS,
+) -> List[BusConfig]:
+    """Convert a validated topology document into immutable bus configs."""
+    buses: List[BusConfig] = []
+    for bus in topology.buses:
+        buses.append(
+            BusConfig(
+                port=bus.port,
+                baudrate=bus.baudrate,
+                max_gap=default_max_gap if bus.max_gap is None else bus.max_gap,
+                response_timeout_ms=(
+                    default_response_timeout_ms if bus.response_timeout_ms is None else bus.response_timeout_ms
+                ),
+                slaves=tuple(
+                    SlaveConfig(
+                        slave_id=slave.slave_id,
+                        brand_key=slave.brand,
+                        device_id=slave.device_id,
+                        poll_interval_ms=slave.poll_interval_ms,
+                        register_rates_ms=tuple(sorted(slave.register_rates_ms.items())),
+                    )
+                    for slave in bus.slaves
+                ),
+            )
+        )
+    return buses
+
+
+def load_topology_file(
+    path: str,
+    default_max_gap: int = MODBUS_DEFAULT_MAX_GAP,
+    default_response_timeout_ms: int = MODBUS_DEFAULT_RESPONSE_TIMEOUT_MS,
+) -> List[BusConfig]:
+    """Load a topology JSON file: {"buses": [{"port": ..., "slaves": [...]}]}."""
+    with open(path, "r", encoding="utf-8") as handle:
+        data = json.load(handle)
+    return topology_from_schema(ModbusTopology(**data), default_max_gap, default_response_timeout_ms)
+
+
+def migrate_modbus_slave_columns(engine: Engine) -> List[str]:
+    """
+    Bring modbus_slaves tables created by older versions up to date (idempotent):
+    add the bus-level columns and make the device foreign key ``ON DELETE SET NULL``.
+    Returns what was changed.
+    """
+    added: List[str] = []
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        if not inspector.has_table("modbus_slaves"):
+            return added
+        existing = {column["name"] for column in inspector.get_columns("modbus_slaves")}
+        for column in ("max_gap", "response_timeout_ms"):
+            if column not in existing:
+                connection.execute(text(f"ALTER TABLE modbus_slaves ADD COLUMN {column} INTEGER"))
+                added.append(column)
+        for foreign_key in inspector.get_foreign_keys("modbus_slaves"):
+            if foreign_key["constrained_columns"] != ["device_id"]:
+                continue
+            if (foreign_key.get("options") or {}).get("ondelete", "").upper() == "SET NULL":
+                continue
+            name = foreign_key["name"]
+            connection.execute(text(f'ALTER TABLE modbus_slaves DROP CONSTRAINT "{name}"'))
+            connection.execute(text(
+                f'ALTER TABLE modbus_slaves ADD CONSTRAINT "{name}" '
+                f"FOREIGN KEY (device_id) REFERENCES devices (id) ON DELETE SET NULL"
+            ))
+            added.append(f"{name} (ON DELETE SET NULL)")
+    return added
+
+
+def _bus_setting(port: str, rows: List[ModbusSlaveModel], name: str, default: Any) -> Any:
+    """The value all rows of a port agree on (NULL rows take the default); ValueError on conflict."""
+    values = {getattr(row, name) for row in rows} - {None}
+    if len(values) > 1:
+        detail = ", ".join(f"slave {row.slave_id}={getattr(row, name)}" for row in rows if getattr(row, name) is not None)
+        raise ValueError(f"Conflicting {name} on {port} ({detail}); every slave on a port must use the same value")
+    return values.pop() if values else default
+
+
+def load_topology_db(
+    db: Session,
+    default_max_gap: int = MODBUS_DEFAULT_MAX_GAP,
+    default_response_timeout_ms: int = MODBUS_DEFAULT_RESPONSE_TIMEOUT_MS,
+) -> List[BusConfig]:
+    """
+    Build buses from enabled rows of the modbus_slaves table, grouped by port.
+
+    Rows of one port must agree on baudrate, max_gap and response_timeout_ms
+    (ValueError otherwise); NULL max_gap/response_timeout_ms use the defaults.
+    """
+    rows = (
+        db.query(ModbusSlaveModel)
+        .filter(ModbusSlaveModel.enabled.is_(True))
+        .order_by(ModbusSlaveModel.port.asc(), ModbusSlaveModel.slave_id.asc())
+        .all()
+    )
+    grouped: "OrderedDict[str, List[ModbusSlaveModel]]" = OrderedDict()
+    for row in rows:
+        grouped.setdefault(row.port, []).append(row)
+
+    buses: List[BusConfig] = []
+    for port, slaves in grouped.items():
+        buses.append(
+            BusConfig(
+                port=port,
+                baudrate=_bus_setting(port, slaves, "baudrate", None),
+                max_gap=_bus_setting(port, slaves, "max_gap", default_max_gap),
+                response_timeout_ms=_bus_setting(port, slaves, "response_timeout_ms", default_response_timeout_ms),
+                slaves=tuple(
+                    SlaveConfig(
+                        slave_id=row.slave_id,
+                        brand_key=row.brand_key,
+                        device_id=row.device_id,
+                        poll_interval_ms=row.poll_interval_ms,
+                        register_rates_ms=tuple(sorted(json.loads(row.register_rates).items()))
+                        if row.register_rates
+                        else (),
+                    )
+                    for row in slaves
+                ),
+            )
+        )
+    return buses
+
+
+def save_topology_db(db: Session, topology: ModbusTopology) -> None:
+    """Replace the modbus_slaves table with the given topology."""
+    db.query(ModbusSlaveModel).delete()
+    for bus in topology.buses:
+        for slave in bus.slaves:
+            db.add(
+                ModbusSlaveModel(
+                    port=bus.port,
+                    baudrate=bus.baudrate,
+                    max_gap=bus.max_gap,
+                    response_timeout_ms=bus.response_timeout_ms,
+                    slave_id=slave.slave_id,
+                    brand_key=slave.brand,
+                    device_id=slave.device_id,
+                    poll_interval_ms=slave.poll_interval_ms,
+                    register_rates=json.dumps(slave.register_rates_ms) if slave.register_rates_ms else None,
+                    enabled=True,
+                )
+            )
+    db.commit()
+
+
+def single_bus_topology(
+    port: str,
+    baudrate: int,
+    slave_id: int,
+    brand_key: str,
+    device_id: Optional[int],
+    poll_interval_ms: int,
+    max_gap: int = MODBUS_DEFAULT_MAX_GAP,
+    response_timeout_ms: int = MODBUS_DEFAULT_RESPONSE_TIMEOUT_MS,
+) -> List[BusConfig]:
+    """Topology equivalent to the legacy MODBUS_* single-port settings."""
+    slave = SlaveConfig(
+        slave_id=slave_id,
+        brand_key=brand_key,
+        device_id=device_id,
+        poll_interval_ms=poll_interval_ms,
+    )
+    return [
+        BusConfig(
+            port=port,
+            baudrate=baudrate,
+            max_gap=max_gap,
+            slaves=(slave,),
+            response_timeout_ms=response_timeout_ms,
+        )
+    ]
+
+
+class ModbusScheduler:
+    """
+    Runs one ModbusPoller worker per bus and applies topology changes live.
+
+    ``apply`` diffs the new topology against the running one by port: buses
+    whose config is unchanged keep polling, changed buses are restarted and
+    removed buses are stopped, so reconfiguration needs no API restart.
+    """
+
+    def __init__(self, register_source_path: str) -> None:
+        self.register_source_path = register_source_path
+        self._lock = threading.Lock()
+        self._workers: Dict[str, ModbusPoller] = {}
+
+    def apply(self, buses: List[BusConfig]) -> Dict[str, List[str]]:
+        wanted = {bus.port: bus for bus in buses}
+        if len(wanted) != len(buses):
+            raise ValueError("Each serial port may only appear once in the Modbus topology")
+
+        changes: Dict[str, List[str]] = {"started": [], "restarted": [], "stopped": [], "unchanged": []}
+        with self._lock:
+            for port in list(self._workers):
+                worker = self._workers[port]
+                if port not in wanted:
+                    worker.stop()
+                    del self._workers[port]
+                    changes["stopped"].append(port)
+                elif worker.bus != wanted[port] or not worker.is_alive():
+                    worker.stop()
+                    del self._workers[port]
+                    changes["restarted"].append(port)
+                else:
+                    changes["unchanged"].append(port)
+
+            for port, bus in wanted.items():
+                if port in self._workers:
+                    continue
+                worker = ModbusPoller(bus, self.register_source_path)
+                worker.start()
+                self._workers[port] = worker
+                if port not in changes["restarted"]:
+                    changes["started"].append(port)
+        return changes
+
+    def stop(self) -> None:
+        with self._lock:
+            for worker in self._workers.values():
+                worker.stop()
+            self._workers.clear()
+
+    def status(self) -> List[Dict]:
+        with self._lock:
+            workers = list(self._workers.values())
+        return [worker.status() for worker in workers]
+
+    def latest(self, device_id: int) -> List[Dict]:
+        with self._lock:
+            workers = list(self._workers.values())
+        return [value for worker in workers for value in worker.latest(device_id)]
@@ -0,0 +1,314 @@
+"""
+Virtual Modbus RTU slave bus over a pseudo-terminal (Linux/macOS).
+
+Opens a pty pair and answers RTU requests on the master side for one or more
+simulated slaves, so ModbusPoller can be pointed at the slave side path
+(MODBUS_PORT) on any box without a real VFD. Register maps come from
+vfd_brand_model_registers.json.
+
+Supported functions: 0x03/0x04 (read), 0x06 (write single), 0x10 (write
+multiple). Turnaround latency, CRC-error and timeout injection, dead slaves
+and baud-rate pacing of responses are configurable.
+
+Usage (from backend/):
+    python -m modbus_simulator --brand teco --slaves 1,2,3 --baudrate 9600 \
+        --latency-ms 15 --crc-error-rate 0.01 --timeout-rate 0.01 --dead 3
+"""
+import argparse
+import json
+import os
+import random
+import select
+import struct
+import threading
+import time
+import tty
+from typing import Dict, Iterable, List, Optional
+
+from modbus_codec import append_crc, check_crc
+from modbus_polling import rtu_char_time, rtu_frame_gap
+
+# Plausible engineering values per register name, converted to raw via the divisor.
+TYPICAL_VALUES = {
+    "frequency": 50.0,
+    "speed": 1480.0,
+    "current": 6.5,
+    "voltage": 400.0,
+    "power": 3.6,
+    "torque": 22.0,
+    "energy": 1200.0,
+    "status": 1,
+    "fault_code": 0,
+}
+
+EXC_ILLEGAL_FUNCTION = 0x01
+EXC_ILLEGAL_ADDRESS = 0x02
+EXC_ILLEGAL_VALUE = 0x03
+
+
+def registers_for_brand(register_map_path: str, brand_key: str) -> Dict[int, Dict]:
+    """Return {address: register definition} for a brand of the register map."""
+    with open(register_map_path, "r", encoding="utf-8") as handle:
+        data = json.load(handle)
+    registers = data.get(brand_key)
+    if not registers:
+        raise ValueError(f"Brand '{brand_key}' not found in register map")
+    return {int(reg["address"]): reg for reg in registers}
+
+
+class SimulatedSlave:
+    """Register bank of one slave with slowly varying telemetry values."""
+
+    def __init__(self, slave_id: int, definitions: Dict[int, Dict], noise: float, rng: random.Random) -> None:
+        self.slave_id = slave_id
+        self.definitions = definitions
+        self.noise = noise
+        self.rng = rng
+        self.values: Dict[int, int] = {}
+        self.writable: Dict[int, int] = {}
+        for address, reg in definitions.items():
+            name = str(reg.get("name", "")).strip().lower()
+            divisor = float(reg.get("divisor", 1)) or 1.0
+            self.values[address] = int(round(TYPICAL_VALUES.get(name, 0) / divisor)) & 0xFFFF
+
+    def read(self, address: int) -> Optional[int]:
+        if address in self.writable:
+            return self.writable[address]
+        if address not in self.values:
+            return None
+        reg = self.definitions[address]
+        name = str(reg.get("name", "")).strip().lower()
+        if name == "energy":
+            # Energy counters only move forward.
+            self.values[address] = (self.values[address] + 1) & 0xFFFF
+            return self.values[address]
+        base = self.values[address]
+        if self.noise and base:
+            return max(0, min(0xFFFF, int(round(base * (1 + self.rng.uniform(-self.noise, self.noise))))))
+        return base
+
+    def write(self, address: int, value: int) -> None:
+        self.writable[address] = value & 0xFFFF
+
+
+class ModbusSlaveSimulator:
+    """
+    Serves simulated slaves on the master side of a pty pair.
+
+    ``start()`` returns the path of the slave side, which behaves like a
+    serial port for pyserial. Responses are delayed by the turnaround latency
+    plus the frame's transmission time at ``baudrate``.
+    """
+
+    def __init__(
+        self,
+        slaves: Dict[int, Dict[int, Dict]],
+        baudrate: int = 9600,
+        latency_ms: float = 10.0,
+        jitter_ms: float = 0.0,
+        crc_error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        dead_slaves: Iterable[int] = (),
+        strict: bool = False,
+        noise: float = 0.02,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.rng = random.Random(seed)
+        self.slaves = {
+            slave_id: SimulatedSlave(slave_id, definitions, noise, self.rng)
+            for slave_id, definitions in slaves.items()
+        }
+        self.baudrate = baudrate
+        self.char_time = rtu_char_time(baudrate)
+        self.frame_gap = rtu_frame_gap(baudrate)
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.crc_error_rate = crc_error_rate
+        self.timeout_rate = timeout_rate
+        self.dead_slaves = set(dead_slaves)
+        self.strict = strict
+        self.stats = {"requests": 0, "responses": 0, "exceptions": 0, "crc_errors": 0,
+                      "timeouts": 0, "bad_requests": 0, "ignored": 0}
+        self._master_fd: Optional[int] = None
+        self._slave_fd: Optional[int] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.port: Optional[str] = None
+
+    def start(self) -> str:
+        self._master_fd, self._slave_fd = os.openpty()
+        tty.setraw(self._master_fd)
+        tty.setraw(self._slave_fd)
+        self.port = os.ttyname(self._slave_fd)
+        self._thread = threading.Thread(target=self._serve, name="modbus-simulator", daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        for fd in (self._master_fd, self._slave_fd):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self._master_fd = self._slave_fd = None
+
+    @staticmethod
+    def request_length(buffer: bytes) -> Optional[int]:
+        """Expected length of the request at the start of ``buffer`` (None if unknown yet)."""
+        if len(buffer) < 2:
+            return None
+        function = buffer[1]
+        if function in (0x03, 0x04, 0x06):
+            return 8
+        if function == 0x10:
+            if len(buffer) < 7:
+                return None
+            return 9 + buffer[6]
+        return 8
+
+    def _serve(self) -> None:
+        buffer = b""
+        last_byte_at = 0.0
+        while not self._stop_event.is_set():
+            try:
+                readable, _, _ = select.select([self._master_fd], [], [], 0.1)
+            except (OSError, ValueError):
+                return
+            now = time.monotonic()
+            if buffer and now - last_byte_at > self.frame_gap:
+                # A t3.5 silence ends any partial frame; resynchronize.
+                self.stats["bad_requests"] += 1
+                buffer = b""
+            if not readable:
+                continue
+            try:
+                chunk = os.read(self._master_fd, 512)
+            except OSError:
+                return
+            buffer += chunk
+            last_byte_at = time.monotonic()
+            while True:
+                length = self.request_length(buffer)
+                if length is None or len(buffer) < length:
+                    break
+                frame, buffer = buffer[:length], buffer[length:]
+                self._handle(frame)
+
+    def _handle(self, frame: bytes) -> None:
+        self.stats["requests"] += 1
+        if not check_crc(frame):
+            self.stats["bad_requests"] += 1
+            return
+        slave_id, function = frame[0], frame[1]
+        slave = self.slaves.get(slave_id)
+        if slave_id == 0:
+            # Broadcast writes are applied by every slave and never answered.
+            for target in self.slaves.values():
+                self._execute(target, function, frame)
+            return
+        if slave is None or slave_id in self.dead_slaves:
+            self.stats["ignored"] += 1
+            return
+        if self.rng.random() < self.timeout_rate:
+            self.stats["timeouts"] += 1
+            return
+
+        response = self._execute(slave, function, frame)
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        time.sleep(delay + len(response) * self.char_time)
+        if self.rng.random() < self.crc_error_rate:
+            response = response[:-1] + bytes(((response[-1] ^ 0xFF),))
+            self.stats["crc_errors"] += 1
+        try:
+            os.write(self._master_fd, response)
+            self.stats["responses"] += 1
+        except OSError:
+            pass
+
+    def _exception(self, slave_id: int, function: int, code: int) -> bytes:
+        self.stats["exceptions"] += 1
+        return append_crc(bytes((slave_id, function | 0x80, code)))
+
+    def _execute(self, slave: SimulatedSlave, function: int, frame: bytes) -> bytes:
+        slave_id = slave.slave_id
+        if function in (0x03, 0x04):
+            address, quantity = struct.unpack_from(">HH", frame, 2)
+            if not 1 <= quantity <= 125:
+                return self._exception(slave_id, function, EXC_ILLEGAL_VALUE)
+            values: List[int] = []
+            for offset in range(quantity):
+                value = slave.read(address + offset)
+                if value is None:
+                    if self.strict:
+                        return self._exception(slave_id, function, EXC_ILLEGAL_ADDRESS)
+                    value = 0
+                values.append(value)
+            payload = struct.pack(f">BBB{quantity}H", slave_id, function, quantity * 2, *values)
+            return append_crc(payload)
+        if function == 0x06:
+            address, value = struct.unpack_from(">HH", frame, 2)
+            slave.write(address, value)
+            return frame
+        if function == 0x10:
+            address, quantity = struct.unpack_from(">HH", frame, 2)
+            byte_count = frame[6]
+            if byte_count != quantity * 2:
+                return self._exception(slave_id, function, EXC_ILLEGAL_VALUE)
+            for offset, value in enumerate(struct.unpack_from(f">{quantity}H", frame, 7)):
+                slave.write(address + offset, value)
+            return append_crc(frame[:6])
+        return self._exception(slave_id, function, EXC_ILLEGAL_FUNCTION)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    default_map = os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "..", "frontend", "public", "vfd_brand_model_registers.json")
+    )
+    parser = argparse.ArgumentParser(description="Virtual Modbus RTU slave bus over a pty")
+    parser.add_argument("--register-map", default=default_map)
+    parser.add_argument("--brand", default="teco", help="Brand key used for every slave")
+    parser.add_argument("--slaves", default="1", help="Comma-separated slave ids")
+    parser.add_argument("--baudrate", type=int, default=9600)
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="Slave turnaround before replying")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--crc-error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--dead", default="", help="Comma-separated slave ids that never answer")
+    parser.add_argument("--strict", action="store_true", help="Reject unmapped addresses with exception 0x02")
+    parser.add_argument("--noise", type=float, default=0.02, help="Relative noise on telemetry values")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    definitions = registers_for_brand(args.register_map, args.brand)
+    slave_ids = [int(value) for value in args.slaves.split(",") if value.strip()]
+    simulator = ModbusSlaveSimulator(
+        {slave_id: definitions for slave_id in slave_ids},
+        baudrate=args.baudrate,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        crc_error_rate=args.crc_error_rate,
+        timeout_rate=args.timeout_rate,
+        dead_slaves=[int(value) for value in args.dead.split(",") if value.strip()],
+        strict=args.strict,
+        noise=args.noise,
+        seed=args.seed,
+    )
+    port = simulator.start()
+    print(f"Simulating slaves {slave_ids} ({args.brand}) at {args.baudrate} baud on {port}")
+    print(f"Run the API with MODBUS_ENABLED=1 MODBUS_PORT={port} MODBUS_BAUDRATE={args.baudrate} MODBUS_BRAND={args.brand}")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"Simulator stats: {simulator.stats}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, DateTime, Float, ForeignKey, Boolean, LargeBinary, UniqueConstraint, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -51,7 +52,7 @@ class SensorReading(Base):
     light = Column(String, nullable=True)        # Light level
     motion = Column(String, nullable=True)       # Motion detected (boolean)
     distance = Column(String, nullable=True)     # Ultrasonic distance in cm
-    custom_data = Column(String, nullable=True)  # JSON string for additional data
+    custom_data = Column(JSONB, nullable=True)  # Additional data (JSON document)
     timestamp = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     
     # Relationship to device
@@ -71,7 +72,7 @@ class VFDReading(Base):
     torque = Column(String, nullable=True)       # Torque in Nm
     status = Column(Integer, nullable=True)      # 0=Stop, 1=Run, 2=Fault, 3=Ready
     fault_code = Column(Integer, nullable=True)  # Fault code number
-    custom_data = Column(String, nullable=True)  # JSON string for additional data (rssi, uptime, etc.)
+    custom_data = Column(JSONB, nullable=True)  # Additional data (rssi, uptime, registers, etc.)
     timestamp = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     
     # Relationship to device
@@ -80,3 +81,129 @@ class VFDReading(Base):
 
 # Update Device model to include vfd_readings relationship
 Device.vfd_readings = relationship("VFDReading", back_populates="device", cascade="all, delete-orphan")
+
+
+class ModbusSlave(Base):
+    """DB-defined Modbus topology: one row per slave, grouped into buses by port."""
+    __tablename__ = "modbus_slaves"
+
+    id = Column(Integer, primary_key=True, index=True)
+    port = Column(String, nullable=False, index=True)          # e.g. /dev/ttyUSB0 or COM5
+    baudrate = Column(Integer, default=9600, nullable=False)
+    # Bus-level settings are repeated on every row of the port and must agree.
+    max_gap = Column(Integer, nullable=True)                   # NULL = MODBUS_MAX_BLOCK_GAP
+    response_timeout_ms = Column(Integer, nullable=True)       # NULL = MODBUS_RESPONSE_TIMEOUT_MS
+    slave_id = Column(Integer, nullable=False)                 # Modbus unit id (1-247)
+    brand_key = Column(String, nullable=False)                 # Key in vfd_brand_model_registers.json
+    device_id = Column(Integer, ForeignKey("devices.id", ondelete="SET NULL"), nullable=True)
+    poll_interval_ms = Column(Integer, default=1000, nullable=False)
+    register_rates = Column(String, nullable=True)             # JSON string {register name: interval ms}
+    enabled = Column(Boolean, default=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class Metric(Base):
+    """Metric catalog: dictionary-encodes metric names (register/field names) to small ids."""
+    __tablename__ = "metrics"
+
+    id = Column(SmallInteger, primary_key=True)
+    name = Column(String, unique=True, nullable=False)     # Lower-cased register or field name, e.g. "energy"
+    unit = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class MetricSample(Base):
+    """Narrow time series: one numeric value per device, metric and timestamp."""
+    __tablename__ = "metric_samples"
+
+    device_id = Column(Integer, ForeignKey("devices.id", ondelete="CASCADE"), primary_key=True)
+    metric_id = Column(SmallInteger, ForeignKey("metrics.id"), primary_key=True)
+    ts = Column(DateTime(timezone=True), primary_key=True)
+    value = Column(Float, nullable=False)
+
+
+class VFDReadingBucket(Base):
+    """Compressed archive of vfd_readings: all of one device's rows in one time bucket."""
+    __tablename__ = "vfd_reading_buckets"
+    __table_args__ = (UniqueConstraint("device_id", "bucket_start", name="uq_vfd_reading_buckets_device_start"),)
+
+    id = Column(Integer, primary_key=True)
+    device_id = Column(Integer, ForeignKey("devices.id", ondelete="CASCADE"), nullable=False)
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    bucket_seconds = Column(Integer, nullable=False)
+    row_count = Column(Integer, nullable=False)
+    first_ts = Column(DateTime(timezone=True), nullable=False)
+    last_ts = Column(DateTime(timezone=True), nullable=False)
+    payload = Column(LargeBinary, nullable=False)              # vfd_archive format: delta-of-delta + XOR columns
+
+
+class AnomalyEvent(Base):
+    """Telemetry sample flagged by the streaming anomaly detectors (anomaly.py)."""
+    __tablename__ = "anomaly_events"
+    __table_args__ = (Index("ix_anomaly_events_device_timestamp", "device_id", "timestamp"),)
+
+    id = Column(Integer, primary_key=True)
+    device_id = Column(Integer, ForeignKey("devices.id", ondelete="CASCADE"), nullable=False)
+    field = Column(String, nullable=False)                     # current, frequency or power
+    kind = Column(String, nullable=False)                      # "zscore" or "rate"
+    value = Column(Float, nullable=False)
+    expected = Column(Float, nullable=True)                    # Baseline mean (zscore) or previous value (rate)
+    score = Column(Float, nullable=False)                      # z-score or rate per second
+    threshold = Column(Float, nullable=False)
+    timestamp = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class AlertRule(Base):
+    """User-defined threshold or silence rule, compiled into the in-memory alert engine (alert_rules.py)."""
+    __tablename__ = "alert_rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    device_id = Column(Integer, ForeignKey("devices.id", ondelete="CASCADE"), nullable=True)  # NULL = every device
+    field = Column(String, nullable=True)                      # Sample field, e.g. current; NULL for no_data
+    op = Column(String, nullable=False)                        # gt, ge, lt, le, eq, ne or no_data
+    threshold = Column(Float, nullable=True)
+    clear_threshold = Column(Float, nullable=True)             # Hysteresis: resolve only past this value
+    duration_s = Column(Float, default=0, nullable=False)      # Condition must hold this long (silence length for no_data)
+    severity = Column(String, default="warning", nullable=False)
+    enabled = Column(Boolean, default=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class Alert(Base):
+    """One firing of an alert rule on a device; ``resolved_at`` is set when it clears."""
+    __tablename__ = "alerts"
+    __table_args__ = (Index("ix_alerts_device_fired_at", "device_id", "fired_at"),)
+
+    id = Column(Integer, primary_key=True)
+    rule_id = Column(Integer, ForeignKey("alert_rules.id", ondelete="CASCADE"), nullable=False)
+    device_id = Column(Integer, ForeignKey("devices.id", ondelete="CASCADE"), nullable=False)
+    severity = Column(String, nullable=False)
+    value = Column(Float, nullable=True)                       # Value that fired the rule (NULL for no_data)
+    resolved_value = Column(Float, nullable=True)
+    fired_at = Column(DateTime(timezone=True), nullable=False)
+    resolved_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class VFDEvent(Base):
+    """Interval during which a drive stayed in one state (vfd_events.py); ``ended_at`` is NULL for the current one."""
+    __tablename__ = "vfd_events"
+    __table_args__ = (Index("ix_vfd_events_device_started_at", "device_id", "started_at"),)
+
+    id = Column(Integer, primary_key=True)
+    device_id = Column(Integer, ForeignKey("devices.id", ondelete="CASCADE"), nullable=False)
+    state = Column(String, nullable=False)                     # stopped, running, fault, ready, offline
+    status = Column(Integer, nullable=True)                    # Raw status register, if reported
+    fault_code = Column(Integer, nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    ended_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class IngestCursor(Base):
+    """Highest sample sequence number ingested per device (batched ESP32 frames, ingest_seq.py)."""
+    __tablename__ = "ingest_cursors"
+
+    device_id = Column(Integer, ForeignKey("devices.id", ondelete="CASCADE"), primary_key=True)
+    seq = Column(BigInteger, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,449 @@
+import asyncio
+import contextvars
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from log_setup import get_logger
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is +Inf.
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# ASGI scope of the request/WebSocket currently being served, so SQL hooks
+# can attribute statements to the route that issued them.
+_current_scope: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar(
+    "perf_current_scope", default=None
+)
+
+
+def current_route() -> Optional[str]:
+    """Return the matched route template (or raw path) of the active request."""
+    scope = _current_scope.get()
+    if scope is None:
+        return None
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope.get("path")
+    if scope.get("type") == "websocket":
+        return f"WS {path}"
+    return f"{scope.get('method', 'GET')} {path}"
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with count/sum/max."""
+
+    __slots__ = ("buckets", "count", "total_ms", "max_ms")
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, elapsed_ms: float) -> None:
+        index = len(LATENCY_BUCKETS_MS)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                index = i
+                break
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate quantile as the upper bound of the bucket that holds it."""
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= target:
+                return float(LATENCY_BUCKETS_MS[i]) if i < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"le_{bound}" for bound in LATENCY_BUCKETS_MS] + ["le_inf"]
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else None,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": dict(zip(labels, self.buckets)),
+        }
+
+
+class RouteLatencyRegistry:
+    """Thread-safe per-route histograms, keyed by (method, route template, status class)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, str, str], LatencyHistogram] = {}
+
+    def observe(self, method: str, route: str, status_code: int, elapsed_ms: float) -> None:
+        key = (method, route, f"{status_code // 100}xx")
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+            histogram.observe(elapsed_ms)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = [(key, hist.to_dict()) for key, hist in self._histograms.items()]
+        return [
+            {"method": method, "route": route, "status": status, **stats}
+            for (method, route, status), stats in sorted(items)
+        ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+
+route_latency = RouteLatencyRegistry()
+
+
+class RequestTimingMiddleware:
+    """
+    Pure ASGI middleware that records per-route latency histograms.
+
+    HTTP requests are timed from receipt to the final response body chunk and
+    grouped by the matched route template (e.g. ``/devices/{device_id}/vfd-readings``)
+    so path parameters do not explode the key space. WebSocket sessions are not
+    timed, but their scope is published so slow queries issued from WebSocket
+    handlers are still attributed to the route.
+    """
+
+    def __init__(self, app, registry: RouteLatencyRegistry = route_latency) -> None:
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        token = _current_scope.set(scope)
+        if scope["type"] == "websocket":
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _current_scope.reset(token)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            route = scope.get("route")
+            # Unmatched paths are collapsed to avoid one histogram per scanner probe.
+            route_path = getattr(route, "path", None) or "<unmatched>"
+            self.registry.observe(scope.get("method", "GET"), route_path, status_code, elapsed_ms)
+            _current_scope.reset(token)
+
+
+def describe_parameters(parameters: Any) -> Any:
+    """Summarize bound parameters by shape and type without leaking values."""
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return {"executemany": len(parameters), "row": describe_parameters(parameters[0])}
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+class SlowQueryLog:
+    """Bounded in-memory record of statements that exceeded the threshold."""
+
+    def __init__(self, maxlen: int = 200) -> None:
+        self._lock = threading.Lock()
+        self._entries: Deque[Dict[str, Any]] = deque(maxlen=maxlen)
+        self.total = 0
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries.append(entry)
+            self.total += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"total": self.total, "recent": list(reversed(self._entries))}
+
+
+slow_queries = SlowQueryLog()
+_db_log = get_logger("db")
+
+
+# Row-locking reads: ANALYZE would take the locks a second time.
+_LOCKING_CLAUSE = re.compile(r"\bFOR\s+(?:NO\s+KEY\s+)?(?:UPDATE|SHARE|KEY\s+SHARE)\b", re.IGNORECASE)
+
+
+def explainable(statement: str) -> bool:
+    """Plain SELECTs only; writes and row-locking reads are never re-executed."""
+    return statement.lstrip().upper().startswith("SELECT") and not _LOCKING_CLAUSE.search(statement)
+
+
+def _explain(cursor, statement: str, parameters: Any) -> Optional[str]:
+    """
+    Run EXPLAIN (ANALYZE, BUFFERS) for a SELECT on the same DBAPI connection.
+
+    The EXPLAIN runs inside a savepoint that is always rolled back, so a failing
+    EXPLAIN does not abort the caller's transaction.
+    """
+    explain_cursor = cursor.connection.cursor()
+    try:
+        explain_cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            explain_cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+            return "\n".join(row[0] for row in explain_cursor.fetchall())
+        finally:
+            explain_cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            explain_cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+    finally:
+        explain_cursor.close()
+
+
+def install_slow_query_logging(
+    engine: Engine,
+    threshold_ms: float,
+    explain: bool = False,
+    log: SlowQueryLog = slow_queries,
+) -> None:
+    """
+    Attach cursor-execute hooks that log statements slower than ``threshold_ms``.
+
+    When ``explain`` is enabled, slow SELECT statements are re-run under
+    ``EXPLAIN (ANALYZE, BUFFERS)``. Writes and ``SELECT ... FOR UPDATE/SHARE``
+    are never explained because ANALYZE executes the statement a second time.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start_time")
+        if not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000.0
+        if elapsed_ms < threshold_ms:
+            return
+
+        entry: Dict[str, Any] = {
+            "elapsed_ms": round(elapsed_ms, 3),
+            "route": current_route(),
+            "statement": statement,
+            "parameters": describe_parameters(parameters),
+            "executemany": executemany,
+            "at": time.time(),
+        }
+        if explain and not executemany and explainable(statement):
+            try:
+                entry["plan"] = _explain(cursor, statement, parameters)
+            except Exception as exc:
+                entry["plan_error"] = str(exc)
+        log.record(entry)
+
+        _db_log.warning(
+            "slow_query", "🐢 Slow query", elapsed_ms=round(elapsed_ms, 1), route=entry["route"] or "-",
+            params=entry["parameters"], statement=" ".join(statement.split())[:300],
+            **({"plan": entry["plan"]} if entry.get("plan") else {}),
+        )
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        # after_cursor_execute does not run for a failed statement; drop its start time.
+        conn = context.connection
+        starts = conn.info.get("query_start_time") if conn is not None else None
+        if starts:
+            starts.pop()
+
+
+class EventLoopWatchdog:
+    """
+    Measures event-loop lag and attributes stalls to the code that blocked the loop.
+
+    A heartbeat coroutine sleeps ``interval_ms`` and records how late it wakes
+    up (lag histogram). A watcher thread checks the heartbeat; once it is
+    ``threshold_ms`` overdue, the loop thread is stuck in synchronous code and
+    its stack is captured with ``sys._current_frames()``. When the loop
+    resumes, the stall is charged to the innermost backend frame of that stack
+    (e.g. the ``db.commit()`` line in ``websocket_esp32_handler``), together
+    with the call it was blocked in and the running task.
+    """
+
+    MAX_FRAMES = 30
+
+    def __init__(
+        self,
+        interval_ms: float = 50.0,
+        threshold_ms: float = 100.0,
+        max_offenders: int = 50,
+        recent: int = 50,
+        app_root: Optional[str] = None,
+    ) -> None:
+        self.interval_ms = interval_ms
+        self.threshold_ms = threshold_ms
+        self.max_offenders = max_offenders
+        self.app_root = app_root or os.path.dirname(os.path.abspath(__file__))
+        self.lag = LatencyHistogram()
+        self.stalls = 0
+        self.running = False
+        self._lock = threading.Lock()
+        self._offenders: Dict[str, Dict[str, Any]] = {}
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=recent)
+        # perf_counter time at which the next heartbeat is due (None before the first one)
+        self._expected: Optional[float] = None
+        self._captured_for: Optional[float] = None
+        self._pending: Optional[Dict[str, Any]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._log = get_logger("loop")
+
+    async def run(self) -> None:
+        """Heartbeat coroutine; starts the watcher thread. Run it as a task on the loop to watch."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        watcher = threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True)
+        watcher.start()
+        self.running = True
+        interval = self.interval_ms / 1000.0
+        try:
+            while not self._stop.is_set():
+                self._expected = time.perf_counter() + interval
+                await asyncio.sleep(interval)
+                lag_ms = max((time.perf_counter() - self._expected) * 1000.0, 0.0)
+                with self._lock:
+                    self.lag.observe(lag_ms)
+                    pending, self._pending = self._pending, None
+                    if pending is not None or lag_ms >= self.threshold_ms:
+                        self._record_stall(pending, lag_ms)
+        finally:
+            self.running = False
+            self._stop.set()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _watch(self) -> None:
+        poll = min(self.interval_ms, self.threshold_ms) / 2000.0
+        while not self._stop.wait(poll):
+            expected = self._expected
+            if expected is None or expected == self._captured_for:
+                continue
+            if (time.perf_counter() - expected) * 1000.0 < self.threshold_ms:
+                continue
+            self._captured_for = expected
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            capture = self._capture(frame)
+            with self._lock:
+                self._pending = capture
+
+    def _describe(self, frame: traceback.FrameSummary) -> str:
+        filename = frame.filename
+        if filename.startswith(self.app_root):
+            filename = os.path.relpath(filename, self.app_root)
+        return f"{filename}:{frame.lineno} in {frame.name}"
+
+    def _capture(self, frame) -> Dict[str, Any]:
+        stack = traceback.extract_stack(frame)[-self.MAX_FRAMES:]
+        this_module = os.path.abspath(__file__)
+        site = None
+        for summary in reversed(stack):
+            if summary.filename.startswith(self.app_root) and summary.filename != this_module:
+                site = summary
+                break
+        task = None
+        try:
+            current = asyncio.current_task(self._loop)
+        except RuntimeError:
+            current = None
+        if current is not None:
+            coro = current.get_coro()
+            task = f"{current.get_name()} ({getattr(coro, '__qualname__', type(coro).__name__)})"
+        return {
+            "site": self._describe(site) if site is not None else "<outside backend code>",
+            "blocked_in": self._describe(stack[-1]) if stack else None,
+            "code": site.line if site is not None else None,
+            "task": task,
+            "stack": [self._describe(summary) for summary in stack],
+        }
+
+    def _record_stall(self, capture: Optional[Dict[str, Any]], lag_ms: float) -> None:
+        # Called with the lock held. A stall shorter than threshold + poll time may end before a capture.
+        capture = capture or {"site": "<not captured>", "blocked_in": None, "code": None, "task": None, "stack": []}
+        self.stalls += 1
+        offender = self._offenders.get(capture["site"])
+        if offender is None:
+            if len(self._offenders) >= self.max_offenders:
+                smallest = min(self._offenders, key=lambda key: self._offenders[key]["total_ms"])
+                del self._offenders[smallest]
+            offender = self._offenders[capture["site"]] = {"site": capture["site"], "count": 0, "total_ms": 0.0, "max_ms": 0.0}
+        offender["count"] += 1
+        offender["total_ms"] += lag_ms
+        offender["max_ms"] = max(offender["max_ms"], lag_ms)
+        offender.update({key: capture[key] for key in ("blocked_in", "code", "task", "stack")})
+        self._recent.append({
+            "at": time.time(),
+            "lag_ms": round(lag_ms, 3),
+            "site": capture["site"],
+            "blocked_in": capture["blocked_in"],
+            "task": capture["task"],
+        })
+        self._log.warning(
+            "stall", "🐌 Event loop blocked", lag_ms=round(lag_ms, 1), site=capture["site"],
+            blocked_in=capture["blocked_in"], task=capture["task"],
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            offenders = sorted(self._offenders.values(), key=lambda entry: entry["total_ms"], reverse=True)
+            return {
+                "running": self.running,
+                "interval_ms": self.interval_ms,
+                "threshold_ms": self.threshold_ms,
+                "buckets_ms": list(LATENCY_BUCKETS_MS),
+                "lag": self.lag.to_dict(),
+                "stalls": self.stalls,
+                "offenders": [
+                    {**entry, "total_ms": round(entry["total_ms"], 3), "max_ms": round(entry["max_ms"], 3)}
+                    for entry in offenders
+                ],
+                "recent": list(reversed(self._recent)),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.lag = LatencyHistogram()
+            self.stalls = 0
+            self._offenders.clear()
+            self._recent.clear()
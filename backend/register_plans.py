@@ -0,0 +1,239 @@
+"""
+Compiled, immutable register plans built from vfd_brand_model_registers.json.
+
+Each brand's register list is compiled once into a RegisterPlan: addresses
+and divisors are coerced, names are mapped to VFDReading fields and the
+block-read layout is precomputed, so bus workers never touch the raw JSON in
+their poll loop. RegisterPlanCache rebuilds all plans when the file changes
+on disk (mtime/size, checked at most once per ``check_interval_s``) and
+keeps a serialized, ETag'ed copy for the HTTP endpoints.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Function 0x03 can return at most 125 registers per request.
+MODBUS_MAX_READ_REGISTERS = 125
+# Unused registers tolerated inside one block before it is split in two.
+MODBUS_DEFAULT_MAX_GAP = 8
+
+FIELD_MAP = {
+    "frequency": "frequency",
+    "freq": "frequency",
+    "speed": "speed",
+    "rpm": "speed",
+    "current": "current",
+    "voltage": "voltage",
+    "power": "power",
+    "torque": "torque",
+    "status": "status",
+    "run_status": "status",
+    "fault_code": "fault_code",
+    "faultcode": "fault_code",
+    "fault": "fault_code",
+}
+
+# Fields stored as raw integers rather than scaled values.
+DISCRETE_FIELDS = ("status", "fault_code")
+
+# Seconds between stat() calls on the register map file.
+REGISTER_MAP_CHECK_INTERVAL_S = 1.0
+
+
+def plan_block_reads(
+    addresses: Iterable[int],
+    max_gap: int = MODBUS_DEFAULT_MAX_GAP,
+    max_quantity: int = MODBUS_MAX_READ_REGISTERS,
+) -> List[Tuple[int, int]]:
+    """
+    Group register addresses into the fewest (start, quantity) block reads.
+
+    Adjacent addresses are merged while the hole between them is at most
+    ``max_gap`` unused registers and the block stays within ``max_quantity``
+    (125 is the function 0x03 protocol limit).
+    """
+    blocks: List[Tuple[int, int]] = []
+    start: Optional[int] = None
+    end = 0
+    for address in sorted(set(addresses)):
+        if start is not None and address - end - 1 <= max_gap and address - start + 1 <= max_quantity:
+            end = address
+            continue
+        if start is not None:
+            blocks.append((start, end - start + 1))
+        start = end = address
+    if start is not None:
+        blocks.append((start, end - start + 1))
+    return blocks
+
+
+@dataclass(frozen=True)
+class CompiledRegister:
+    address: int
+    name: str
+    key: str  # lower-cased name
+    field: Optional[str]  # VFDReading column, if the name maps to one
+    unit: str
+    divisor: float
+    discrete: bool
+
+    def scale(self, raw_value: int) -> float:
+        return raw_value if self.discrete else raw_value * self.divisor
+
+    def to_dict(self) -> Dict:
+        return {
+            "address": self.address,
+            "name": self.name,
+            "unit": self.unit,
+            "divisor": self.divisor,
+            "field": self.field,
+        }
+
+
+@dataclass(frozen=True)
+class RegisterPlan:
+    """Immutable register layout of one brand."""
+
+    brand: str
+    registers: Tuple[CompiledRegister, ...]
+    addresses: Tuple[int, ...]
+    by_address: Dict[int, CompiledRegister] = field(compare=False, repr=False)
+    _blocks: Dict[int, Tuple[Tuple[int, int], ...]] = field(default_factory=dict, compare=False, repr=False)
+
+    def blocks(self, max_gap: int = MODBUS_DEFAULT_MAX_GAP) -> Tuple[Tuple[int, int], ...]:
+        """Block reads covering every register, computed once per ``max_gap``."""
+        blocks = self._blocks.get(max_gap)
+        if blocks is None:
+            blocks = self._blocks[max_gap] = tuple(plan_block_reads(self.addresses, max_gap))
+        return blocks
+
+    def to_dict(self, max_gap: int = MODBUS_DEFAULT_MAX_GAP) -> Dict:
+        return {
+            "brand": self.brand,
+            "registers": [reg.to_dict() for reg in self.registers],
+            "blocks": [{"start": start, "quantity": quantity} for start, quantity in self.blocks(max_gap)],
+        }
+
+
+def compile_plan(brand: str, registers: List[Dict]) -> RegisterPlan:
+    compiled = []
+    for reg in registers:
+        name = str(reg["name"])
+        key = name.strip().lower()
+        field_key = FIELD_MAP.get(key)
+        compiled.append(CompiledRegister(
+            address=int(reg["address"]),
+            name=name,
+            key=key,
+            field=field_key,
+            unit=str(reg.get("unit", "")),
+            divisor=float(reg.get("divisor", 1)),
+            discrete=field_key in DISCRETE_FIELDS,
+        ))
+    registers_tuple = tuple(compiled)
+    return RegisterPlan(
+        brand=brand,
+        registers=registers_tuple,
+        addresses=tuple(sorted({reg.address for reg in registers_tuple})),
+        by_address={reg.address: reg for reg in registers_tuple},
+    )
+
+
+class RegisterPlanCache:
+    """
+    Register plans of every brand in one register map file, hot-reloaded.
+
+    Plans are replaced wholesale on reload, so a worker holding a plan keeps
+    a consistent view; comparing ``plan is not cached`` detects the change.
+    If the file becomes unreadable the previous plans stay in use.
+    """
+
+    def __init__(self, path: str, check_interval_s: float = REGISTER_MAP_CHECK_INTERVAL_S) -> None:
+        self.path = path
+        self.check_interval_s = check_interval_s
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self._plans: Dict[str, RegisterPlan] = {}
+        self._payload = b"{}"
+        self._etag = '"0"'
+        self.version = 0
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if self._signature is not None and now - self._checked_at < self.check_interval_s:
+            return
+        with self._lock:
+            if self._signature is not None and now - self._checked_at < self.check_interval_s:
+                return
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path)
+            except OSError as exc:
+                if self._signature is None:
+                    raise
+                print(f"⚠️ Register map {self.path} unavailable ({exc}); keeping version {self.version}")
+                return
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if signature == self._signature:
+                return
+            try:
+                with open(self.path, "r", encoding="utf-8") as handle:
+                    data = json.load(handle)
+                plans = {brand: compile_plan(brand, registers or []) for brand, registers in data.items()}
+            except Exception as exc:
+                if self._signature is None:
+                    raise
+                print(f"⚠️ Register map reload failed ({exc}); keeping version {self.version}")
+                self._signature = signature
+                return
+            payload = json.dumps(
+                {brand: [reg.to_dict() for reg in plan.registers] for brand, plan in plans.items()},
+                separators=(",", ":"),
+            ).encode("utf-8")
+            self._plans = plans
+            self._payload = payload
+            self._etag = f'"{hashlib.sha1(payload).hexdigest()[:20]}"'
+            is_reload = self._signature is not None
+            self._signature = signature
+            self.version += 1
+            if is_reload:
+                print(f"🔄 Register map reloaded (version {self.version}, {len(plans)} brands)")
+
+    def plan(self, brand: str) -> RegisterPlan:
+        self._refresh()
+        plan = self._plans.get(brand)
+        if plan is None or not plan.registers:
+            raise ValueError(f"Brand '{brand}' not found in register map")
+        return plan
+
+    def get(self, brand: str) -> Optional[RegisterPlan]:
+        self._refresh()
+        return self._plans.get(brand)
+
+    def brands(self) -> List[str]:
+        self._refresh()
+        return sorted(self._plans)
+
+    def payload(self) -> Tuple[bytes, str]:
+        """Compact JSON of all compiled plans (original file shape plus ``field``) and its ETag."""
+        self._refresh()
+        return self._payload, self._etag
+
+
+_caches: Dict[str, RegisterPlanCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_register_plans(path: str) -> RegisterPlanCache:
+    """Process-wide cache for a register map path."""
+    path = os.path.abspath(path)
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = RegisterPlanCache(path)
+        return cache
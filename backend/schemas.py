@@ -1,7 +1,9 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, field_validator
+from typing import Dict, Optional, List
 from datetime import datetime
 
+from custom_data import to_text
+
 class DeviceBase(BaseModel):
     device_name: str
     ip_address: str
@@ -86,7 +88,12 @@ class SensorReadingBase(BaseModel):
     light: Optional[str] = None
     motion: Optional[str] = None
     distance: Optional[str] = None  # Ultrasonic distance in cm
-    custom_data: Optional[str] = None
+    custom_data: Optional[str] = None  # JSON text; stored as JSONB
+
+    @field_validator("custom_data", mode="before")
+    @classmethod
+    def custom_data_as_text(cls, value):
+        return to_text(value)
 
 
 class SensorReadingCreate(SensorReadingBase):
@@ -112,7 +119,12 @@ class VFDReadingBase(BaseModel):
     torque: Optional[str] = None        # Nm
     status: Optional[int] = None        # 0=Stop, 1=Run, 2=Fault, 3=Ready
     fault_code: Optional[int] = None    # Fault code number
-    custom_data: Optional[str] = None   # JSON string for additional data
+    custom_data: Optional[str] = None   # JSON text; stored as JSONB
+
+    @field_validator("custom_data", mode="before")
+    @classmethod
+    def custom_data_as_text(cls, value):
+        return to_text(value)
 
 
 class VFDReadingCreate(VFDReadingBase):
@@ -126,3 +138,153 @@ class VFDReading(VFDReadingBase):
     class Config:
         from_attributes = True
 
+
+
+# Modbus topology Schemas (file- or DB-defined buses and slaves)
+class ModbusSlaveConfig(BaseModel):
+    slave_id: int
+    brand: str
+    device_id: Optional[int] = None
+    poll_interval_ms: int = 1000
+    register_rates_ms: Dict[str, int] = {}   # Register name -> poll interval in ms
+
+
+class ModbusBusConfig(BaseModel):
+    port: str
+    baudrate: int = 9600
+    max_gap: Optional[int] = None            # Defaults to MODBUS_MAX_BLOCK_GAP
+    response_timeout_ms: Optional[int] = None  # Defaults to MODBUS_RESPONSE_TIMEOUT_MS
+    slaves: List[ModbusSlaveConfig] = []
+
+
+class ModbusTopology(BaseModel):
+    buses: List[ModbusBusConfig] = []
+
+
+# Metric time-series Schemas (narrow metric_samples table)
+class Metric(BaseModel):
+    id: int
+    name: str
+    unit: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class MetricPoint(BaseModel):
+    ts: datetime
+    value: float
+
+
+class MetricSeries(BaseModel):
+    device_id: int
+    metric: str
+    unit: Optional[str] = None
+    bucket_seconds: Optional[int] = None
+    aggregate: Optional[str] = None
+    points: List[MetricPoint] = []
+
+
+# Device analytics Schemas
+class AnalyticsSummary(BaseModel):
+    samples: int
+    kwh: float
+    run_hours: float
+    starts: int
+    faults: int
+    mean_power_kw: Optional[float] = None    # Time-weighted while running
+    mean_current_a: Optional[float] = None   # Time-weighted while running
+
+
+class AnalyticsBucket(AnalyticsSummary):
+    start: datetime
+
+
+class AnalyticsTotals(AnalyticsSummary):
+    starts_per_day: Optional[float] = None
+
+
+class DeviceAnalytics(BaseModel):
+    device_id: int
+    start: datetime
+    end: datetime
+    bucket_seconds: int
+    energy_source: str                       # "counter" (Energy register) or "power_integral"
+    totals: AnalyticsTotals
+    buckets: List[AnalyticsBucket] = []
+
+
+class AnomalyEvent(BaseModel):
+    id: int
+    device_id: int
+    field: str                               # current | frequency | power
+    kind: str                                # "zscore" (off baseline) or "rate" (too fast a change)
+    value: float
+    expected: Optional[float] = None         # baseline mean, or the previous value for "rate"
+    score: float                             # z-score, or rate of change per second
+    threshold: float
+    timestamp: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class AlertRuleCreate(BaseModel):
+    name: str
+    device_id: Optional[int] = None          # None = every device
+    field: Optional[str] = None              # Sample field, e.g. current, status, temperature, rssi
+    op: str                                  # gt | ge | lt | le | eq | ne | no_data
+    threshold: Optional[float] = None
+    clear_threshold: Optional[float] = None  # Hysteresis: resolve only once the value is back past this
+    duration_s: float = 0                    # Condition must hold this long; silence length for no_data
+    severity: str = "warning"
+    enabled: bool = True
+
+
+class AlertRule(AlertRuleCreate):
+    id: int
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class Alert(BaseModel):
+    id: int
+    rule_id: int
+    device_id: int
+    severity: str
+    value: Optional[float] = None
+    resolved_value: Optional[float] = None
+    fired_at: datetime
+    resolved_at: Optional[datetime] = None   # None while the alert is active
+
+    class Config:
+        from_attributes = True
+
+
+class VFDEvent(BaseModel):
+    id: int
+    device_id: int
+    state: str                               # stopped | running | fault | ready | offline
+    status: Optional[int] = None
+    fault_code: Optional[int] = None
+    started_at: datetime
+    ended_at: Optional[datetime] = None      # None for the current interval
+
+    class Config:
+        from_attributes = True
+
+
+class VFDTimeline(BaseModel):
+    device_id: int
+    start: datetime
+    end: datetime
+    intervals: List[VFDEvent] = []
+    seconds_by_state: Dict[str, float] = {}
+
+
+# Runtime logging settings (PUT /admin/logging); omitted entries are unchanged
+class LoggingConfig(BaseModel):
+    levels: Dict[str, str] = {}              # logger ("esp32", "ws", ...; "" = all) -> DEBUG..CRITICAL
+    sample_rates: Dict[str, float] = {}      # event ("esp32.heartbeat") -> records/s, 0 = unlimited
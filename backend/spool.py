@@ -0,0 +1,423 @@
+"""
+Local durable spool for ESP32 readings while PostgreSQL is unavailable.
+
+When a write fails with a connection-level error, the database is marked
+unavailable and ESP32 frames are appended to the spool instead (and still
+acked and broadcast live). A background task probes the database and, once it
+answers, replays the spool in bulk and returns ingest to the database.
+
+Layout: ``<dir>/<n:08d>.seg`` segment files, preallocated to the segment
+size and written through ``mmap``::
+
+    b"VFDSPL01"  reserved:u64
+    records: length:u32  crc32:u32  JSON payload
+
+A zero length marks the end of the written area; a record whose CRC does not
+match (torn write) is treated as the end as well. ``<dir>/cursor`` holds the
+replay position; fully replayed segments are deleted.
+
+Readings keep going to the spool until it is drained, not just until the
+database answers, so the spool stays the only writer of a device's seq
+cursor while it holds records for it. Batched frames are split against the
+spool's own per-device seq (recovered from the segments on restart), and each
+record keeps that ``floor``; replay skips only samples at or below it, never
+against an ``ingest_cursors`` value that may have moved on since. Replay is
+at-least-once for single frames: they may be stored twice if the process dies
+between the replay commit and the cursor write.
+
+``fsync``: ``always`` (msync every record), ``interval`` (at most every
+``fsync_interval_s``) or ``never`` (left to the OS page cache).
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DisconnectionError, InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+
+from ingest_seq import advance_cursor, lock_cursor, save_cursor
+from log_setup import get_logger
+from models import VFDReading as VFDReadingModel
+from vfd_events import record_vfd_transition
+
+_log = get_logger("spool")
+
+MAGIC = b"VFDSPL01"
+_HEADER = struct.Struct("<8sQ")
+_RECORD = struct.Struct("<II")
+FSYNC_MODES = ("always", "interval", "never")
+
+
+def is_db_outage(exc: BaseException) -> bool:
+    """True for errors meaning the database (or the connection to it) is gone, not a bad statement."""
+    if isinstance(exc, (OperationalError, InterfaceError, DisconnectionError, PoolTimeoutError)):
+        return True
+    return bool(getattr(exc, "connection_invalidated", False))
+
+
+def _walk(mm: mmap.mmap, start: int = _HEADER.size) -> Tuple[int, int]:
+    """End offset of the valid records from ``start`` and how many there are."""
+    offset, count, size = start, 0, len(mm)
+    while offset + _RECORD.size <= size:
+        length, crc = _RECORD.unpack_from(mm, offset)
+        end = offset + _RECORD.size + length
+        if length == 0 or end > size or zlib.crc32(mm[offset + _RECORD.size:end]) != crc:
+            break
+        offset = end
+        count += 1
+    return offset, count
+
+
+class ReadingSpool:
+    """Append-only segmented spool; thread-safe (the event loop appends, a worker thread replays)."""
+
+    def __init__(
+        self,
+        directory: str,
+        enabled: bool = True,
+        segment_bytes: int = 16 * 1024 * 1024,
+        fsync: str = "interval",
+        fsync_interval_s: float = 1.0,
+    ) -> None:
+        if fsync not in FSYNC_MODES:
+            raise ValueError(f"fsync must be one of {', '.join(FSYNC_MODES)}")
+        self.directory = directory
+        self.enabled = enabled
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.fsync_interval_s = fsync_interval_s
+        # Cleared by ``fallback`` on a connection-level error, set again by the replay task.
+        self.db_available = True
+        self.last_error: Optional[str] = None
+        self.outages = 0
+        self.appended = 0
+        self.replayed = 0
+        self._lock = threading.Lock()
+        # segment number -> end offset of its records, for sealed segments
+        self._sealed: Dict[int, int] = {}
+        # Read-only mapping of the sealed segment being replayed: (number, file, mmap)
+        self._reader: Optional[Tuple[int, Any, mmap.mmap]] = None
+        self._active: Optional[int] = None
+        self._file = None
+        self._mm: Optional[mmap.mmap] = None
+        self._write_offset = 0
+        self._cursor: Tuple[int, int] = (0, _HEADER.size)
+        self._backlog_records = 0
+        self._last_sync = 0.0
+        self._dirty = False
+        # Highest seq spooled per device, so replayed batch frames are not spooled twice.
+        self._device_seq: Dict[int, int] = {}
+        # Last cursor committed to the database per device (the starting point of a new outage).
+        self._db_seq: Dict[int, int] = {}
+
+    # ---- lifecycle ----
+
+    def _path(self, number: int) -> str:
+        return os.path.join(self.directory, f"{number:08d}.seg")
+
+    def open(self) -> None:
+        """Recover segments and the replay cursor left by a previous run."""
+        os.makedirs(self.directory, exist_ok=True)
+        numbers = sorted(
+            int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".seg") and name[:-4].isdigit()
+        )
+        cursor_path = os.path.join(self.directory, "cursor")
+        if os.path.exists(cursor_path):
+            with open(cursor_path) as f:
+                saved = json.load(f)
+            self._cursor = (saved["segment"], saved["offset"])
+        elif numbers:
+            self._cursor = (numbers[0], _HEADER.size)
+        with self._lock:
+            for number in numbers:
+                if number < self._cursor[0]:
+                    os.remove(self._path(number))
+                    continue
+                with open(self._path(number), "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if mm[:8] != MAGIC:
+                        _log.warning("bad_segment", "⚠️ Spool segment has no valid header; skipped", segment=number)
+                        continue
+                    end, _ = _walk(mm)
+                    start = self._cursor[1] if number == self._cursor[0] else _HEADER.size
+                    _, pending = _walk(mm, min(start, end))
+                    self._recover_device_seq(mm, min(start, end), end)
+                # Segments of a previous run are sealed; new records go to a new segment.
+                self._sealed[number] = end
+                self._backlog_records += pending
+            if self._backlog_records:
+                _log.info(
+                    "backlog", "📼 Spool holds unreplayed records",
+                    records=self._backlog_records, segments=len(self._sealed),
+                )
+
+    def _recover_device_seq(self, mm: mmap.mmap, offset: int, end: int) -> None:
+        while offset < end:
+            length, _ = _RECORD.unpack_from(mm, offset)
+            start = offset + _RECORD.size
+            self._note_spooled(json.loads(mm[start:start + length]))
+            offset = start + length
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_reader()
+            self._seal()
+
+    def _sync_dir(self) -> None:
+        if self.fsync == "never":
+            return
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _numbers(self) -> List[int]:
+        return sorted(list(self._sealed) + ([self._active] if self._active is not None else []))
+
+    def _start_segment(self, min_bytes: int) -> None:
+        number = max(self._numbers(), default=self._cursor[0]) + 1
+        size = max(self.segment_bytes, _HEADER.size + min_bytes)
+        self._file = open(self._path(number), "w+b")
+        self._file.truncate(size)
+        self._mm = mmap.mmap(self._file.fileno(), size)
+        _HEADER.pack_into(self._mm, 0, MAGIC, 0)
+        self._active = number
+        self._write_offset = _HEADER.size
+        if not self._sealed:
+            # Everything before this segment is replayed (or there was nothing).
+            self._cursor = (number, _HEADER.size)
+        self._sync_dir()
+
+    def _seal(self) -> None:
+        if self._active is None:
+            return
+        if self.fsync != "never":
+            self._mm.flush()
+        self._mm.close()
+        self._file.close()
+        self._sealed[self._active] = self._write_offset
+        self._active = None
+        self._mm = None
+        self._file = None
+
+    # ---- writing ----
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """Append one record (JSON-serializable; datetimes as ISO strings)."""
+        payload = json.dumps(record, separators=(",", ":"), default=str).encode("utf-8")
+        needed = _RECORD.size + len(payload)
+        with self._lock:
+            if self._mm is None or self._write_offset + needed > len(self._mm):
+                self._seal()
+                self._start_segment(needed)
+            start = self._write_offset + _RECORD.size
+            # Payload first, header last: a record is only visible once it is complete.
+            self._mm[start:start + len(payload)] = payload
+            _RECORD.pack_into(self._mm, self._write_offset, len(payload), zlib.crc32(payload))
+            self._write_offset += needed
+            self._backlog_records += 1
+            self.appended += 1
+            self._note_spooled(record)
+            self._dirty = True
+            if self.fsync == "always":
+                self._sync()
+            elif self.fsync == "interval" and time.monotonic() - self._last_sync >= self.fsync_interval_s:
+                self._sync()
+
+    def _sync(self) -> None:
+        if self._mm is not None and self._dirty:
+            self._mm.flush()
+        self._dirty = False
+        self._last_sync = time.monotonic()
+
+    def flush_if_due(self) -> None:
+        """Sync the active segment if the interval has passed (called by the replay task)."""
+        with self._lock:
+            if self.fsync == "interval" and self._dirty and time.monotonic() - self._last_sync >= self.fsync_interval_s:
+                self._sync()
+
+    def _note_spooled(self, record: Dict[str, Any]) -> None:
+        cursor = record.get("cursor")
+        if cursor:
+            device_id, seq = cursor
+            if record.get("reset") or device_id not in self._device_seq:
+                self._device_seq[device_id] = seq
+            else:
+                self._device_seq[device_id] = max(seq, self._device_seq[device_id])
+
+    def device_seq(self, device_id: int) -> Optional[int]:
+        """Cursor to split a spooled batch against: highest spooled seq, else the last committed one."""
+        seq = self._device_seq.get(device_id)
+        return self._db_seq.get(device_id) if seq is None else seq
+
+    def note_db_cursor(self, device_id: int, seq: int) -> None:
+        """Remember a cursor the database path committed (used when an outage starts)."""
+        self._db_seq[device_id] = seq
+
+    # ---- database availability ----
+
+    def db_down(self) -> bool:
+        """True while the database is known to be unavailable."""
+        return self.enabled and not self.db_available
+
+    def bypass_db(self) -> bool:
+        """True while readings should go to the spool: the database is down or the spool is not drained yet."""
+        return self.enabled and (not self.db_available or self._backlog_records > 0)
+
+    def fallback(self, exc: BaseException) -> bool:
+        """Mark the database unavailable if ``exc`` is an outage; True if the caller should spool."""
+        if not self.enabled or not is_db_outage(exc):
+            return False
+        if self.db_available:
+            self.db_available = False
+            self.outages += 1
+            _log.error("db_unavailable", "🛑 Database unavailable, spooling readings", directory=self.directory, error=str(exc))
+        self.last_error = str(exc)
+        return True
+
+    # ---- replay ----
+
+    def pending(self) -> int:
+        return self._backlog_records
+
+    def _close_reader(self) -> None:
+        if self._reader is not None:
+            self._reader[2].close()
+            self._reader[1].close()
+            self._reader = None
+
+    def _segment_view(self, number: int) -> Tuple[Optional[mmap.mmap], int]:
+        """Mapping and end offset of a segment (None if it no longer exists)."""
+        if number == self._active:
+            return self._mm, self._write_offset
+        if number not in self._sealed:
+            return None, 0
+        if self._reader is None or self._reader[0] != number:
+            self._close_reader()
+            f = open(self._path(number), "rb")
+            self._reader = (number, f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return self._reader[2], self._sealed[number]
+
+    def read_batch(self, max_records: int) -> Tuple[List[Dict[str, Any]], Tuple[int, int]]:
+        """Up to ``max_records`` records from the cursor, and the position after them."""
+        records: List[Dict[str, Any]] = []
+        with self._lock:
+            number, offset = self._cursor
+            while len(records) < max_records:
+                mm, end = self._segment_view(number)
+                if mm is None or offset >= end:
+                    later = [n for n in self._numbers() if n > number]
+                    if not later:
+                        break
+                    number, offset = later[0], _HEADER.size
+                    continue
+                length, _ = _RECORD.unpack_from(mm, offset)
+                start = offset + _RECORD.size
+                records.append(json.loads(mm[start:start + length]))
+                offset = start + length
+        return records, (number, offset)
+
+    def commit(self, position: Tuple[int, int], count: int) -> None:
+        """Move the replay cursor past ``count`` replayed records and delete finished segments."""
+        with self._lock:
+            self._cursor = position
+            self._backlog_records = max(self._backlog_records - count, 0)
+            self.replayed += count
+            cursor_path = os.path.join(self.directory, "cursor")
+            with open(cursor_path + ".tmp", "w") as f:
+                json.dump({"segment": position[0], "offset": position[1]}, f)
+                if self.fsync != "never":
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(cursor_path + ".tmp", cursor_path)
+            for number, end in list(self._sealed.items()):
+                if number < position[0] or (number == position[0] and position[1] >= end):
+                    if self._reader is not None and self._reader[0] == number:
+                        self._close_reader()
+                    os.remove(self._path(number))
+                    del self._sealed[number]
+            if not self._backlog_records:
+                self._device_seq.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            segments = len(self._sealed) + (1 if self._active is not None else 0)
+            backlog_bytes = 0
+            for number, end in self._sealed.items():
+                if number >= self._cursor[0]:
+                    backlog_bytes += end - (self._cursor[1] if number == self._cursor[0] else _HEADER.size)
+            if self._active is not None and self._active >= self._cursor[0]:
+                start = self._cursor[1] if self._active == self._cursor[0] else _HEADER.size
+                backlog_bytes += max(self._write_offset - start, 0)
+            return {
+                "enabled": self.enabled,
+                "directory": self.directory,
+                "db_available": self.db_available,
+                "draining": self.db_available and self._backlog_records > 0,
+                "fsync": self.fsync,
+                "segments": segments,
+                "backlog_records": self._backlog_records,
+                "backlog_bytes": backlog_bytes,
+                "appended": self.appended,
+                "replayed": self.replayed,
+                "outages": self.outages,
+                "last_error": self.last_error,
+            }
+
+
+def replay_records(db: Session, records: List[Dict[str, Any]]) -> int:
+    """
+    Write spooled records in the caller's transaction (caller commits).
+
+    Samples of a batched frame at or below the record's ``floor`` (the seq
+    it was split against when spooled) are dropped; the live ingest cursor
+    is only consulted for a device's first record without a known floor
+    (and for records spooled before floors were kept). Drive state
+    transitions are applied in order. Returns the number of rows inserted.
+    """
+    rows: List[Dict[str, Any]] = []
+    # device -> (seq, reset): the cursor after these records
+    cursors: Dict[int, Tuple[int, bool]] = {}
+    stored_seq: Dict[int, Optional[int]] = {}
+    transitions: List[Dict[str, Any]] = []
+    for record in records:
+        if record.get("kind") != "vfd":
+            continue
+        cursor = record.get("cursor")
+        floor = None
+        if cursor:
+            device_id, seq = cursor
+            if record.get("reset"):
+                cursors[device_id] = (seq, True)
+            else:
+                floor = record.get("floor")
+                if floor is None and device_id not in cursors:
+                    if device_id not in stored_seq:
+                        stored_seq[device_id] = lock_cursor(db, device_id)
+                    floor = stored_seq[device_id]
+                previous, reset = cursors.get(device_id, (seq, False))
+                cursors[device_id] = (max(seq, previous), reset)
+        for row in record.get("rows", []):
+            seq = (row.get("custom_data") or {}).get("seq")
+            if floor is not None and seq is not None and seq <= floor:
+                continue
+            rows.append({**row, "timestamp": datetime.fromisoformat(row["timestamp"])})
+        for transition in record.get("transitions", []):
+            transitions.append({**transition, "timestamp": datetime.fromisoformat(transition["timestamp"])})
+    if rows:
+        db.execute(insert(VFDReadingModel), rows)
+    for transition in transitions:
+        record_vfd_transition(db, transition)
+    for device_id, (seq, reset) in cursors.items():
+        if reset:
+            save_cursor(db, device_id, seq)
+        else:
+            advance_cursor(db, device_id, seq)
+    return len(rows)
@@ -0,0 +1,251 @@
+"""
+Deadband / change-detection filter for telemetry storage.
+
+A sample is persisted only when a field moved past its deadband relative to
+the last *stored* sample, a discrete field (status, fault code) changed, or
+``max_silence_s`` elapsed since the last stored row. Callers keep feeding
+every sample to their latest-value and WebSocket paths; only the DB insert is
+skipped.
+
+Configuration is layered: built-in defaults, then the ``default`` section of
+the JSON file in TELEMETRY_DEADBAND_CONFIG, then ``brands.<brand_key>``, then
+``devices.<device_id>``, merged field by field::
+
+    {
+      "default": {"max_silence_s": 60, "fields": {"current": {"abs": 0.05, "pct": 1}}},
+      "brands": {"teco": {"fields": {"frequency": {"abs": 0.2}}}},
+      "devices": {"7": {"max_silence_s": 10}}
+    }
+
+The file is validated when it is loaded: unknown keys and invalid values are
+reported and dropped, so those settings fall back to the layer below.
+"""
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+# Fields compared exactly: any change is stored.
+DISCRETE_FIELDS = ("status", "fault_code")
+
+DEFAULT_MAX_SILENCE_S = 60.0
+# Per-field deadbands: a change must exceed both ``abs`` and ``pct`` percent
+# of the last stored value, so ``abs`` is the floor for values near zero.
+DEFAULT_FIELD_DEADBANDS: Dict[str, Dict[str, float]] = {
+    "frequency": {"abs": 0.1, "pct": 0.5},
+    "speed": {"abs": 5.0, "pct": 0.5},
+    "current": {"abs": 0.05, "pct": 1.0},
+    "voltage": {"abs": 2.0, "pct": 0.5},
+    "power": {"abs": 0.05, "pct": 1.0},
+    "torque": {"abs": 0.2, "pct": 1.0},
+    "energy": {"abs": 0.1},
+}
+
+
+class DeadbandRule:
+    __slots__ = ("abs", "pct")
+
+    def __init__(self, abs: float = 0.0, pct: float = 0.0) -> None:
+        self.abs = float(abs or 0.0)
+        self.pct = float(pct or 0.0)
+
+    def exceeded(self, previous: float, current: float) -> bool:
+        delta = abs(current - previous)
+        return delta > self.abs and delta > abs(previous) * self.pct / 100.0
+
+
+class DeadbandProfile:
+    """Resolved deadbands and heartbeat interval for one brand/device."""
+
+    def __init__(self, max_silence_s: float, fields: Dict[str, Dict[str, float]]) -> None:
+        self.max_silence_s = float(max_silence_s)
+        self.rules = {name: DeadbandRule(**rule) for name, rule in fields.items()}
+
+    def changed(self, previous: Dict[str, Any], current: Dict[str, Any]) -> bool:
+        """True if ``current`` differs meaningfully from the last stored sample."""
+        if previous.keys() != current.keys():
+            return True
+        for name, value in current.items():
+            old = previous[name]
+            if value == old:
+                continue
+            if name in DISCRETE_FIELDS:
+                return True
+            try:
+                old_number, new_number = float(old), float(value)
+            except (TypeError, ValueError):
+                return True
+            rule = self.rules.get(name)
+            # Fields without a rule are stored on any change.
+            if rule is None or rule.exceeded(old_number, new_number):
+                return True
+        return False
+
+
+def _non_negative(value: Any) -> bool:
+    return (
+        isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value) and value >= 0
+    )
+
+
+def _validate_section(where: str, section: Any, warnings: List[str]) -> Dict:
+    """Valid part of one ``{"max_silence_s": ..., "fields": {...}}`` section."""
+    if not isinstance(section, dict):
+        warnings.append(f"{where}: expected an object, ignored")
+        return {}
+    clean: Dict[str, Any] = {}
+    for key, value in section.items():
+        if key == "max_silence_s":
+            if _non_negative(value):
+                clean[key] = value
+            else:
+                warnings.append(f"{where}.max_silence_s: expected a non-negative number, ignored")
+        elif key == "fields":
+            if not isinstance(value, dict):
+                warnings.append(f"{where}.fields: expected an object, ignored")
+                continue
+            fields: Dict[str, Dict[str, float]] = {}
+            for name, rule in value.items():
+                if not isinstance(rule, dict):
+                    warnings.append(f"{where}.fields.{name}: expected an object, ignored")
+                    continue
+                unknown = sorted(set(rule) - set(DeadbandRule.__slots__))
+                if unknown:
+                    warnings.append(f"{where}.fields.{name}: unknown key(s) {', '.join(unknown)} ignored")
+                invalid = [item for item in DeadbandRule.__slots__ if item in rule and not _non_negative(rule[item])]
+                if invalid:
+                    warnings.append(f"{where}.fields.{name}: {', '.join(invalid)} must be a non-negative number, rule ignored")
+                    continue
+                fields[name.strip().lower()] = {item: rule[item] for item in DeadbandRule.__slots__ if item in rule}
+            clean["fields"] = fields
+        else:
+            warnings.append(f"{where}: unknown key {key!r} ignored")
+    return clean
+
+
+def validate_config(config: Any) -> Tuple[Dict, List[str]]:
+    """Return the usable part of a deadband config and a warning per dropped setting."""
+    warnings: List[str] = []
+    if not isinstance(config, dict):
+        return {}, ["config must be a JSON object; using defaults"]
+    clean: Dict[str, Any] = {}
+    for key, value in config.items():
+        if key == "default":
+            clean[key] = _validate_section(key, value, warnings)
+        elif key in ("brands", "devices"):
+            if not isinstance(value, dict):
+                warnings.append(f"{key}: expected an object, ignored")
+                continue
+            clean[key] = {str(name): _validate_section(f"{key}.{name}", section, warnings) for name, section in value.items()}
+        else:
+            warnings.append(f"unknown key {key!r} ignored")
+    return clean, warnings
+
+
+def _merge(base: Dict, override: Optional[Dict]) -> Dict:
+    if not override:
+        return base
+    merged = {"max_silence_s": override.get("max_silence_s", base["max_silence_s"]), "fields": dict(base["fields"])}
+    for name, rule in (override.get("fields") or {}).items():
+        merged["fields"][name.strip().lower()] = dict(rule)
+    return merged
+
+
+class StorageFilter:
+    """
+    Decides per stream whether a telemetry sample should be written.
+
+    A stream is any hashable key (for example ``("modbus", port, slave_id)``
+    or ``("esp32", device_id)``) and remembers the last stored sample and its
+    time. Thread-safe: poller threads and the event loop share one instance.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._config: Dict[str, Any] = {}
+        self._profiles: Dict[Tuple[Optional[str], Optional[int]], DeadbandProfile] = {}
+        self._last: Dict[Hashable, Tuple[float, Dict[str, Any]]] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def load(self, path: str) -> List[str]:
+        """Load and validate a config file; returns warnings for the settings that were dropped."""
+        with open(path, "r", encoding="utf-8") as handle:
+            config, warnings = validate_config(json.load(handle))
+        with self._lock:
+            self._config = config
+            self._profiles.clear()
+        return warnings
+
+    def profile(self, brand: Optional[str] = None, device_id: Optional[int] = None) -> DeadbandProfile:
+        key = (brand, device_id)
+        profile = self._profiles.get(key)
+        if profile is None:
+            resolved = {"max_silence_s": DEFAULT_MAX_SILENCE_S, "fields": dict(DEFAULT_FIELD_DEADBANDS)}
+            resolved = _merge(resolved, self._config.get("default"))
+            if brand:
+                resolved = _merge(resolved, (self._config.get("brands") or {}).get(brand))
+            if device_id is not None:
+                resolved = _merge(resolved, (self._config.get("devices") or {}).get(str(device_id)))
+            profile = self._profiles[key] = DeadbandProfile(resolved["max_silence_s"], resolved["fields"])
+        return profile
+
+    def should_store(
+        self,
+        stream: Hashable,
+        sample: Dict[str, Any],
+        source: str,
+        brand: Optional[str] = None,
+        device_id: Optional[int] = None,
+        now: Optional[float] = None,
+    ) -> bool:
+        """Return True (and remember ``sample``) if it should be persisted."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            counts = self._counts.setdefault(source, {"stored": 0, "suppressed": 0})
+            if not self.enabled:
+                counts["stored"] += 1
+                return True
+            profile = self.profile(brand, device_id)
+            last = self._last.get(stream)
+            store = (
+                last is None
+                or now - last[0] >= profile.max_silence_s
+                or profile.changed(last[1], sample)
+            )
+            if store:
+                self._last[stream] = (now, dict(sample))
+                counts["stored"] += 1
+            else:
+                counts["suppressed"] += 1
+            return store
+
+    def forget(self, stream: Hashable) -> None:
+        with self._lock:
+            self._last.pop(stream, None)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            sources = {}
+            for source, counts in self._counts.items():
+                total = counts["stored"] + counts["suppressed"]
+                sources[source] = {
+                    **counts,
+                    "suppressed_ratio": round(counts["suppressed"] / total, 4) if total else None,
+                }
+            return {"enabled": self.enabled, "streams": len(self._last), "sources": sources}
+
+
+# Read here rather than in main.py so the poller child process is configured the same way.
+TELEMETRY_DEADBAND_ENABLED = os.getenv("TELEMETRY_DEADBAND", "1").lower() in {"1", "true", "yes", "on"}
+TELEMETRY_DEADBAND_CONFIG = os.getenv("TELEMETRY_DEADBAND_CONFIG", "").strip()
+
+storage_filter = StorageFilter(enabled=TELEMETRY_DEADBAND_ENABLED)
+if TELEMETRY_DEADBAND_CONFIG:
+    try:
+        for warning in storage_filter.load(TELEMETRY_DEADBAND_CONFIG):
+            print(f"⚠️ Telemetry deadband config ({TELEMETRY_DEADBAND_CONFIG}): {warning}")
+    except Exception as exc:
+        print(f"⚠️ Telemetry deadband config load failed ({TELEMETRY_DEADBAND_CONFIG}): {exc}; using defaults")
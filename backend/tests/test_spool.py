@@ -0,0 +1,169 @@
+"""
+Spool replay while live frames keep arriving.
+
+Frames go through the ESP32 handler's spool path (``main.spool_esp32_frame``)
+into a real spool in a temporary directory. The database is replaced by an
+in-memory ingest cursor and row list; seq splitting and replay are the real ones.
+"""
+import importlib
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import MetaData
+from sqlalchemy.exc import OperationalError
+
+import custom_data
+import modbus_scheduler
+import spool as spool_module
+from spool import ReadingSpool, replay_records
+
+DEVICE = 7
+OUTAGE = OperationalError("SELECT 1", {}, Exception("connection refused"))
+
+
+class FakeDB:
+    """Stands in for the Session: inserted rows, ingest cursors and vfd_events writes."""
+
+    def __init__(self):
+        self.cursors = {}
+        self.rows = []
+        self.transitions = []
+
+    def execute(self, statement, rows):
+        self.rows.extend(rows)
+
+
+@pytest.fixture(scope="module")
+def main():
+    """The app module, imported without touching a database."""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(MetaData, "create_all", lambda *args, **kwargs: None)
+        patch.setattr(custom_data, "migrate_custom_data_columns", lambda *args, **kwargs: [])
+        patch.setattr(modbus_scheduler, "migrate_modbus_slave_columns", lambda *args, **kwargs: [])
+        return importlib.import_module("main")
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDB()
+    monkeypatch.setattr(spool_module, "lock_cursor", lambda db, device_id: db.cursors.get(device_id))
+    monkeypatch.setattr(
+        spool_module, "advance_cursor",
+        lambda db, device_id, seq: db.cursors.__setitem__(device_id, max(seq, db.cursors.get(device_id, seq))),
+    )
+    monkeypatch.setattr(spool_module, "save_cursor", lambda db, device_id, seq: db.cursors.__setitem__(device_id, seq))
+    monkeypatch.setattr(spool_module, "record_vfd_transition", lambda db, transition: db.transitions.append(transition))
+    return fake
+
+
+@pytest.fixture
+def spooler(main, monkeypatch):
+    """Sends a batched frame through the handler's spool path into the given spool; returns the ack."""
+    # Every sample is kept: the deadband is not under test here.
+    monkeypatch.setattr(main.storage_filter, "enabled", False)
+    main.forget_esp32_state(DEVICE)
+    device = SimpleNamespace(id=DEVICE)
+
+    def send(spool, seqs, status=1, observe=True):
+        monkeypatch.setattr(main, "reading_spool", spool)
+        samples = [{"seq": seq, "data": {"frequency": 50.0, "status": status, "faultCode": 0}} for seq in seqs]
+        return main.spool_esp32_frame(device, {"type": "sensor_data", "samples": samples}, observe)["ack"]
+
+    yield send
+    main.forget_esp32_state(DEVICE)
+
+
+def replay(spool, db):
+    records, position = spool.read_batch(1000)
+    replay_records(db, records)
+    spool.commit(position, len(records))
+
+
+def stored_seqs(db):
+    return sorted(row["custom_data"]["seq"] for row in db.rows)
+
+
+def test_acked_samples_survive_live_frames_during_replay(tmp_path, db, spooler):
+    spool = ReadingSpool(str(tmp_path), fsync="never")
+    spool.open()
+    db.cursors[DEVICE] = 10
+    spool.note_db_cursor(DEVICE, 10)
+
+    assert spool.fallback(OUTAGE)
+    # Outage: the failed database attempt spools the frame; the device resent 9-10 (ack lost) and reports 11-14.
+    ack = spooler(spool, range(9, 15), observe=False)
+    assert (ack["ack_seq"], ack["accepted"], ack["duplicates"], ack["spooled"]) == (14, 4, 2, True)
+
+    # Database back, spool not drained yet: live frames still go to the spool.
+    spool.db_available = True
+    assert spool.bypass_db()
+    assert not spool.db_down()
+    assert spooler(spool, [15, 16])["ack_seq"] == 16
+
+    # Another worker moved the ingest cursor meanwhile; acked samples must not be dropped.
+    db.cursors[DEVICE] = 30
+    replay(spool, db)
+
+    assert stored_seqs(db) == [11, 12, 13, 14, 15, 16]
+    assert db.cursors[DEVICE] == 30
+    assert spool.pending() == 0
+    assert not spool.bypass_db()
+    spool.close()
+
+
+def test_restart_with_backlog_keeps_spooling_and_dedupes(tmp_path, db, spooler):
+    spool = ReadingSpool(str(tmp_path), fsync="never")
+    spool.open()
+    spool.fallback(OUTAGE)
+    spooler(spool, [1, 2, 3])
+    spool.close()
+
+    restarted = ReadingSpool(str(tmp_path), fsync="never")
+    restarted.open()
+    # db_available starts True, but the backlog has to be replayed first.
+    assert restarted.db_available and restarted.bypass_db()
+    assert restarted.device_seq(DEVICE) == 3
+    # The device resends 3 (its ack was lost in the restart) and reports 4.
+    ack = spooler(restarted, [3, 4])
+    assert (ack["ack_seq"], ack["duplicates"]) == (4, 1)
+
+    replay(restarted, db)
+    assert stored_seqs(db) == [1, 2, 3, 4]
+    assert db.cursors[DEVICE] == 4
+    restarted.close()
+
+
+def test_spooled_state_transitions_are_recorded_on_replay(tmp_path, db, spooler):
+    spool = ReadingSpool(str(tmp_path), fsync="never")
+    spool.open()
+    spool.fallback(OUTAGE)
+    spooler(spool, [1], status=1)
+    spooler(spool, [2], status=2)
+    spool.db_available = True
+
+    replay(spool, db)
+    assert [(t["state"], t["status"], t["initial"]) for t in db.transitions] == [
+        ("running", 1, True), ("fault", 2, False),
+    ]
+    assert all(isinstance(t["timestamp"], datetime) and t["timestamp"].tzinfo for t in db.transitions)
+    spool.close()
+
+
+def test_invalid_status_is_rejected_per_sample(tmp_path, db, spooler, main):
+    spool = ReadingSpool(str(tmp_path), fsync="never")
+    spool.open()
+    spool.fallback(OUTAGE)
+    assert spooler(spool, [1])["rejected"] == 0
+    samples = [
+        {"seq": 2, "data": {"frequency": 50.0, "status": "run"}},
+        {"seq": 3, "data": {"frequency": 50.0, "status": "1"}},
+    ]
+    ack = main.spool_esp32_frame(SimpleNamespace(id=DEVICE), {"samples": samples}, True)["ack"]
+    assert (ack["ack_seq"], ack["accepted"], ack["rejected"], ack["stored"]) == (3, 1, 1, 1)
+
+    spool.db_available = True
+    replay(spool, db)
+    assert stored_seqs(db) == [1, 3]
+    assert {row["status"] for row in db.rows} == {1}
+    spool.close()
@@ -0,0 +1,200 @@
+"""
+Bit-level codecs for compressed time-series buckets (Gorilla style).
+
+Integers (timestamps in microseconds, row ids) are delta-of-delta encoded:
+a regular 1 s cadence costs one bit per sample. Floats are XOR encoded
+against the previous value, so repeated values cost one bit and slowly
+changing ones only their meaningful middle bits. See Pelkonen et al.,
+"Gorilla: A Fast, Scalable, In-Memory Time Series Database" (VLDB 2015).
+"""
+import struct
+from typing import List, Sequence
+
+_MASK64 = (1 << 64) - 1
+
+# Delta-of-delta buckets: (prefix, prefix length, payload bits). Values that
+# do not fit any bucket fall through to the 64-bit escape.
+_DOD_BUCKETS = (
+    (0b10, 2, 7),
+    (0b110, 3, 9),
+    (0b1110, 4, 12),
+    (0b11110, 5, 32),
+)
+_DOD_ESCAPE = (0b11111, 5, 64)
+
+
+class BitWriter:
+    """Append-only MSB-first bit stream."""
+
+    __slots__ = ("_buffer", "_acc", "_bits")
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self._acc = 0
+        self._bits = 0
+
+    def write(self, value: int, bits: int) -> None:
+        self._acc = (self._acc << bits) | (value & ((1 << bits) - 1))
+        self._bits += bits
+        if self._bits >= 64:
+            # Keep the accumulator small: move whole bytes to the buffer.
+            spill = self._bits - self._bits % 8
+            self._bits -= spill
+            self._buffer += (self._acc >> self._bits).to_bytes(spill // 8, "big")
+            self._acc &= (1 << self._bits) - 1
+
+    def getvalue(self) -> bytes:
+        if not self._bits:
+            return bytes(self._buffer)
+        pad = -self._bits % 8
+        return bytes(self._buffer) + (self._acc << pad).to_bytes((self._bits + pad) // 8, "big")
+
+
+class BitReader:
+    """MSB-first reader over bytes produced by BitWriter."""
+
+    __slots__ = ("_data", "_position")
+
+    def __init__(self, data: bytes) -> None:
+        self._data = data
+        self._position = 0
+
+    def read(self, bits: int) -> int:
+        if bits == 0:
+            return 0
+        start = self._position >> 3
+        offset = self._position & 7
+        end = (self._position + bits + 7) >> 3
+        if end > len(self._data):
+            raise ValueError("Truncated bit stream")
+        chunk = int.from_bytes(self._data[start:end], "big")
+        self._position += bits
+        return (chunk >> ((end - start) * 8 - offset - bits)) & ((1 << bits) - 1)
+
+    def read_bit(self) -> int:
+        return self.read(1)
+
+
+def _signed(value: int, bits: int) -> int:
+    return value - (1 << bits) if value & (1 << (bits - 1)) else value
+
+
+def encode_integers(values: Sequence[int]) -> bytes:
+    """
+    Delta-of-delta encode a sequence of (typically increasing) integers.
+
+    Values and their delta-of-deltas must fit in a signed 64-bit integer,
+    which holds for microsecond timestamps and row ids.
+    """
+    writer = BitWriter()
+    previous = delta = 0
+    for index, value in enumerate(values):
+        if index == 0:
+            writer.write(value & _MASK64, 64)
+        else:
+            new_delta = value - previous
+            dod = new_delta - delta
+            delta = new_delta
+            if dod == 0:
+                writer.write(0, 1)
+            else:
+                for prefix, prefix_bits, bits in _DOD_BUCKETS:
+                    if -(1 << (bits - 1)) <= dod < (1 << (bits - 1)):
+                        writer.write(prefix, prefix_bits)
+                        writer.write(dod, bits)
+                        break
+                else:
+                    prefix, prefix_bits, bits = _DOD_ESCAPE
+                    writer.write(prefix, prefix_bits)
+                    writer.write(dod, bits)
+        previous = value
+    return writer.getvalue()
+
+
+def decode_integers(data: bytes, count: int) -> List[int]:
+    reader = BitReader(data)
+    values: List[int] = []
+    previous = delta = 0
+    for index in range(count):
+        if index == 0:
+            value = _signed(reader.read(64), 64)
+        else:
+            prefix_bits = 0
+            while prefix_bits < 5 and reader.read_bit():
+                prefix_bits += 1
+            if prefix_bits == 0:
+                dod = 0
+            else:
+                bits = (_DOD_BUCKETS + (_DOD_ESCAPE,))[prefix_bits - 1][2]
+                dod = _signed(reader.read(bits), bits)
+            delta += dod
+            value = previous + delta
+        values.append(value)
+        previous = value
+    return values
+
+
+def encode_floats(values: Sequence[float]) -> bytes:
+    """XOR encode float64 values (Gorilla value compression)."""
+    writer = BitWriter()
+    previous = 0
+    leading = trailing = -1
+    for index, value in enumerate(values):
+        bits = struct.unpack(">Q", struct.pack(">d", value))[0]
+        if index == 0:
+            writer.write(bits, 64)
+        else:
+            xor = bits ^ previous
+            if xor == 0:
+                writer.write(0, 1)
+            else:
+                new_leading = min(64 - xor.bit_length(), 31)
+                new_trailing = (xor & -xor).bit_length() - 1
+                if leading >= 0 and new_leading >= leading and new_trailing >= trailing:
+                    # Meaningful bits fit in the previous window.
+                    writer.write(0b10, 2)
+                    writer.write(xor >> trailing, 64 - leading - trailing)
+                else:
+                    leading, trailing = new_leading, new_trailing
+                    significant = 64 - leading - trailing
+                    writer.write(0b11, 2)
+                    writer.write(leading, 5)
+                    # 64 significant bits do not fit in 6 bits; 0 stands for 64.
+                    writer.write(significant & 63, 6)
+                    writer.write(xor >> trailing, significant)
+        previous = bits
+    return writer.getvalue()
+
+
+def decode_floats(data: bytes, count: int) -> List[float]:
+    reader = BitReader(data)
+    values: List[float] = []
+    previous = 0
+    leading = trailing = 0
+    for index in range(count):
+        if index == 0:
+            bits = reader.read(64)
+        elif not reader.read_bit():
+            bits = previous
+        else:
+            if reader.read_bit():
+                leading = reader.read(5)
+                significant = reader.read(6) or 64
+                trailing = 64 - leading - significant
+            bits = previous ^ (reader.read(64 - leading - trailing) << trailing)
+        values.append(struct.unpack(">d", struct.pack(">Q", bits))[0])
+        previous = bits
+    return values
+
+
+def encode_presence(flags: Sequence[bool]) -> bytes:
+    """One bit per row, set when the row has a value."""
+    writer = BitWriter()
+    for flag in flags:
+        writer.write(1 if flag else 0, 1)
+    return writer.getvalue()
+
+
+def decode_presence(data: bytes, count: int) -> List[bool]:
+    reader = BitReader(data)
+    return [bool(reader.read_bit()) for _ in range(count)]
@@ -0,0 +1,277 @@
+"""
+Compressed long-term storage for vfd_readings.
+
+Readings older than the hot window are packed per device into one
+``vfd_reading_buckets`` row per time bucket (e.g. one hour) and deleted from
+vfd_readings. A bucket payload holds its rows column by column: ids and
+timestamps delta-of-delta encoded, numeric fields XOR (Gorilla) encoded
+with a presence bitmap, and ``custom_data`` as zlib-compressed JSON
+(see ts_codec.py). The read endpoints decode buckets back into VFDReading
+objects, so clients cannot tell archived rows from hot ones.
+
+Payload layout (version 1), all lengths little-endian uint32::
+
+    version:u8  count:u32  [len ids] [len timestamps]
+    per field: [len presence] [len values]
+    [len zlib JSON {"custom_data": [...], "text": {row: {field: original}}}]
+"""
+import json
+import struct
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import VFDReading as VFDReadingModel, VFDReadingBucket as VFDReadingBucketModel
+from ts_codec import (
+    decode_floats,
+    decode_integers,
+    decode_presence,
+    encode_floats,
+    encode_integers,
+    encode_presence,
+)
+
+PAYLOAD_VERSION = 1
+
+# VFDReading columns stored as text and as integers.
+TEXT_FIELDS = ("frequency", "speed", "current", "voltage", "power", "torque")
+INT_FIELDS = ("status", "fault_code")
+ROW_FIELDS = TEXT_FIELDS + INT_FIELDS
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_HEADER = struct.Struct("<BI")
+_LENGTH = struct.Struct("<I")
+
+
+def to_micros(ts: datetime) -> int:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return (ts - _EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=value)
+
+
+def bucket_start_for(ts: datetime, bucket_seconds: int) -> datetime:
+    micros = to_micros(ts)
+    span = bucket_seconds * 1_000_000
+    return from_micros(micros - micros % span)
+
+
+def reading_row(reading: VFDReadingModel) -> Dict[str, Any]:
+    row = {name: getattr(reading, name) for name in ROW_FIELDS}
+    row.update(id=reading.id, timestamp=reading.timestamp, custom_data=reading.custom_data)
+    return row
+
+
+def encode_bucket(rows: List[Dict[str, Any]]) -> bytes:
+    """Pack rows (dicts with id, timestamp, the VFD fields and custom_data) sorted by time."""
+    rows = sorted(rows, key=lambda row: (row["timestamp"], row["id"]))
+    sections = [
+        encode_integers([row["id"] for row in rows]),
+        encode_integers([to_micros(row["timestamp"]) for row in rows]),
+    ]
+    # Text fields whose value does not survive a float round trip verbatim.
+    text: Dict[str, Dict[str, str]] = {}
+    for name in ROW_FIELDS:
+        present: List[bool] = []
+        values: List[float] = []
+        for index, row in enumerate(rows):
+            value = row.get(name)
+            number = None
+            if value is not None:
+                try:
+                    number = float(value)
+                except (TypeError, ValueError):
+                    number = None
+                if name in TEXT_FIELDS and (number is None or str(number) != value):
+                    text.setdefault(str(index), {})[name] = value
+                    number = None
+                elif name in INT_FIELDS and number is not None and int(number) != value:
+                    number = None
+            present.append(number is not None)
+            if number is not None:
+                values.append(number)
+        sections.append(encode_presence(present))
+        sections.append(encode_floats(values))
+    extras = {"custom_data": [row.get("custom_data") for row in rows], "text": text}
+    sections.append(zlib.compress(json.dumps(extras, separators=(",", ":")).encode("utf-8")))
+
+    parts = [_HEADER.pack(PAYLOAD_VERSION, len(rows))]
+    for section in sections:
+        parts.append(_LENGTH.pack(len(section)))
+        parts.append(section)
+    return b"".join(parts)
+
+
+def decode_bucket(payload: bytes) -> List[Dict[str, Any]]:
+    """Rows of a bucket payload, oldest first."""
+    version, count = _HEADER.unpack_from(payload, 0)
+    if version != PAYLOAD_VERSION:
+        raise ValueError(f"Unsupported VFD archive payload version {version}")
+    offset = _HEADER.size
+    sections: List[bytes] = []
+    while offset < len(payload):
+        (length,) = _LENGTH.unpack_from(payload, offset)
+        offset += _LENGTH.size
+        sections.append(payload[offset:offset + length])
+        offset += length
+
+    ids = decode_integers(sections[0], count)
+    timestamps = decode_integers(sections[1], count)
+    extras = json.loads(zlib.decompress(sections[-1]))
+    rows = [
+        {"id": ids[index], "timestamp": from_micros(timestamps[index]), "custom_data": extras["custom_data"][index]}
+        for index in range(count)
+    ]
+    for field_index, name in enumerate(ROW_FIELDS):
+        present = decode_presence(sections[2 + field_index * 2], count)
+        values = iter(decode_floats(sections[3 + field_index * 2], sum(present)))
+        for row, has_value in zip(rows, present):
+            if not has_value:
+                row[name] = None
+            elif name in INT_FIELDS:
+                row[name] = int(next(values))
+            else:
+                row[name] = str(next(values))
+    for index, fields in extras["text"].items():
+        rows[int(index)].update(fields)
+    return rows
+
+
+def compact_vfd_readings(db: Session, cutoff: datetime, bucket_seconds: int, batch_rows: int = 20000) -> Dict[str, int]:
+    """
+    Move up to ``batch_rows`` readings older than ``cutoff`` into bucket rows.
+
+    Rows landing in an existing bucket (late data, or a bucket split across
+    batches) are merged into it. Runs in one transaction; returns counts.
+    """
+    readings = (
+        db.query(VFDReadingModel)
+        .filter(VFDReadingModel.timestamp < cutoff)
+        .order_by(VFDReadingModel.device_id, VFDReadingModel.timestamp, VFDReadingModel.id)
+        .limit(batch_rows)
+        .all()
+    )
+    if not readings:
+        return {"rows": 0, "buckets": 0, "bytes": 0}
+
+    groups: Dict[Tuple[int, datetime], List[Dict[str, Any]]] = {}
+    for reading in readings:
+        key = (reading.device_id, bucket_start_for(reading.timestamp, bucket_seconds))
+        groups.setdefault(key, []).append(reading_row(reading))
+
+    payload_bytes = 0
+    for (device_id, bucket_start), rows in groups.items():
+        bucket = (
+            db.query(VFDReadingBucketModel)
+            .filter(VFDReadingBucketModel.device_id == device_id, VFDReadingBucketModel.bucket_start == bucket_start)
+            .with_for_update()
+            .first()
+        )
+        if bucket is not None:
+            merged = {row["id"]: row for row in decode_bucket(bucket.payload)}
+            merged.update((row["id"], row) for row in rows)
+            rows = list(merged.values())
+        else:
+            bucket = VFDReadingBucketModel(device_id=device_id, bucket_start=bucket_start, bucket_seconds=bucket_seconds)
+            db.add(bucket)
+        bucket.payload = encode_bucket(rows)
+        bucket.row_count = len(rows)
+        bucket.first_ts = min(row["timestamp"] for row in rows)
+        bucket.last_ts = max(row["timestamp"] for row in rows)
+        payload_bytes += len(bucket.payload)
+
+    db.query(VFDReadingModel).filter(
+        VFDReadingModel.id.in_([reading.id for reading in readings])
+    ).delete(synchronize_session=False)
+    db.commit()
+    return {"rows": len(readings), "buckets": len(groups), "bytes": payload_bytes}
+
+
+def archived_vfd_readings(
+    db: Session,
+    device_id: int,
+    limit: int,
+    newer_than: Optional[datetime] = None,
+    matches: Optional[Callable[[Any], bool]] = None,
+) -> List[VFDReadingModel]:
+    """
+    Archived readings of a device, newest first, as detached VFDReading objects.
+
+    ``newer_than`` keeps only rows after that time; ``matches`` filters on
+    the row's custom_data. Buckets are decoded lazily until ``limit`` rows.
+    """
+    query = db.query(VFDReadingBucketModel).filter(VFDReadingBucketModel.device_id == device_id)
+    if newer_than is not None:
+        query = query.filter(VFDReadingBucketModel.last_ts > newer_than)
+    readings: List[VFDReadingModel] = []
+    for bucket in query.order_by(VFDReadingBucketModel.bucket_start.desc()).yield_per(16):
+        for row in reversed(decode_bucket(bucket.payload)):
+            if newer_than is not None and row["timestamp"] <= newer_than:
+                continue
+            if matches is not None and not matches(row["custom_data"]):
+                continue
+            readings.append(VFDReadingModel(device_id=device_id, **row))
+            if len(readings) >= limit:
+                return readings
+    return readings
+
+
+def iter_archived_rows(
+    db: Session,
+    device_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Archived rows of a device in ``[start, end)``, oldest first."""
+    query = db.query(VFDReadingBucketModel).filter(VFDReadingBucketModel.device_id == device_id)
+    if start is not None:
+        query = query.filter(VFDReadingBucketModel.last_ts >= start)
+    if end is not None:
+        query = query.filter(VFDReadingBucketModel.first_ts < end)
+    for bucket in query.order_by(VFDReadingBucketModel.bucket_start.asc()).yield_per(16):
+        for row in decode_bucket(bucket.payload):
+            if (start is None or row["timestamp"] >= start) and (end is None or row["timestamp"] < end):
+                yield row
+
+
+def with_archived_readings(
+    db: Session,
+    device_id: int,
+    hot: List[VFDReadingModel],
+    limit: int,
+    matches: Optional[Callable[[Any], bool]] = None,
+) -> List[VFDReadingModel]:
+    """
+    Merge the newest ``limit`` hot rows with archived ones, newest first.
+
+    When the hot table already filled ``limit``, only archived rows newer than
+    the oldest hot row (late data compacted out of order) can still qualify.
+    """
+    if limit <= 0:
+        return hot
+    newer_than = hot[-1].timestamp if len(hot) >= limit else None
+    archived = archived_vfd_readings(db, device_id, limit, newer_than, matches)
+    if not archived:
+        return hot
+    merged = sorted(hot + archived, key=lambda reading: (reading.timestamp, reading.id), reverse=True)
+    return merged[:limit]
+
+
+def archive_summary(db: Session) -> Dict[str, Any]:
+    buckets, rows, stored_bytes = db.query(
+        func.count(VFDReadingBucketModel.id),
+        func.coalesce(func.sum(VFDReadingBucketModel.row_count), 0),
+        func.coalesce(func.sum(func.octet_length(VFDReadingBucketModel.payload)), 0),
+    ).one()
+    return {
+        "buckets": buckets,
+        "rows": int(rows),
+        "payload_bytes": int(stored_bytes),
+        "bytes_per_row": round(int(stored_bytes) / int(rows), 2) if rows else None,
+    }
@@ -0,0 +1,153 @@
+"""
+Drive state history as intervals (``vfd_events``) instead of per-reading scans.
+
+Every ingest path reports each sample's status/fault code to
+``VFDStateTracker.observe``, which keeps the current state per device in
+memory and only returns something when it changes. Such a transition closes
+the device's open interval and opens a new one, so the table grows by one
+row per run/stop/fault change rather than per reading. Devices that go
+offline get an ``offline`` interval.
+"""
+import math
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from database import SessionLocal
+from log_setup import get_logger
+from models import VFDEvent as VFDEventModel
+
+_log = get_logger("vfd_events")
+
+STATUS_STATES = {0: "stopped", 1: "running", 2: "fault", 3: "ready"}
+# Without a status register, a drive whose output frequency exceeds this is running.
+RUN_FREQUENCY_HZ = 0.5
+
+StateKey = Tuple[str, Optional[int], Optional[int]]  # (state, status, fault_code)
+
+
+def _integer(value: Any) -> Optional[int]:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if math.isfinite(number) else None
+
+
+def drive_state(sample: Dict[str, Any]) -> Optional[StateKey]:
+    """State of a sample, or None when it carries neither status, fault code nor frequency."""
+    status = _integer(sample.get("status"))
+    fault_code = _integer(sample.get("fault_code"))
+    if status == 2 or (fault_code or 0) > 0:
+        return ("fault", status, fault_code)
+    if status is not None:
+        return (STATUS_STATES.get(status, f"status_{status}"), status, fault_code)
+    try:
+        frequency = float(sample.get("frequency"))
+    except (TypeError, ValueError):
+        return None if fault_code is None else ("stopped", None, fault_code)
+    return ("running" if frequency > RUN_FREQUENCY_HZ else "stopped", None, fault_code)
+
+
+class VFDStateTracker:
+    """Current state per device; thread-safe (event loop and poller threads)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._current: Dict[int, StateKey] = {}
+        self.transitions = 0
+
+    def _transition(self, device_id: int, key: StateKey, now: Optional[float]) -> Optional[Dict]:
+        with self._lock:
+            previous = self._current.get(device_id)
+            if previous == key:
+                return None
+            self._current[device_id] = key
+            self.transitions += 1
+        state, status, fault_code = key
+        return {
+            "device_id": device_id,
+            "state": state,
+            "status": status,
+            "fault_code": fault_code,
+            "timestamp": datetime.fromtimestamp(time.time() if now is None else now, tz=timezone.utc),
+            # First sample since startup: the stored open interval may already be this state.
+            "initial": previous is None,
+        }
+
+    def observe(self, device_id: int, sample: Dict[str, Any], now: Optional[float] = None) -> Optional[Dict]:
+        """Feed one sample; returns a transition when the device's state changed."""
+        key = drive_state(sample)
+        return None if key is None else self._transition(device_id, key, now)
+
+    def offline(self, device_id: int, now: Optional[float] = None) -> Optional[Dict]:
+        """Transition of a tracked device to ``offline`` (heartbeat timeout)."""
+        with self._lock:
+            if device_id not in self._current:
+                return None
+        return self._transition(device_id, ("offline", None, None), now)
+
+    def forget(self, device_id: int) -> None:
+        with self._lock:
+            self._current.pop(device_id, None)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            states: Dict[str, int] = {}
+            for state, _, _ in self._current.values():
+                states[state] = states.get(state, 0) + 1
+            return {"devices": len(self._current), "states": states, "transitions": self.transitions}
+
+
+def record_vfd_transition(db, transition: Optional[Dict]) -> None:
+    """Close the device's open interval and open the new one in the caller's session (caller commits)."""
+    if transition is None:
+        return
+    device_id = transition["device_id"]
+    open_events = db.query(VFDEventModel).filter(VFDEventModel.device_id == device_id, VFDEventModel.ended_at.is_(None))
+    if transition["initial"]:
+        current = open_events.order_by(VFDEventModel.started_at.desc()).first()
+        if current is not None and (current.state, current.status, current.fault_code) == (
+            transition["state"], transition["status"], transition["fault_code"]
+        ):
+            return
+    open_events.update({"ended_at": transition["timestamp"]}, synchronize_session=False)
+    db.add(VFDEventModel(
+        device_id=device_id,
+        state=transition["state"],
+        status=transition["status"],
+        fault_code=transition["fault_code"],
+        started_at=transition["timestamp"],
+    ))
+
+
+def publish_vfd_transition(transition: Optional[Dict]) -> None:
+    """Record a transition in its own transaction (poller threads)."""
+    if transition is None:
+        return
+    db = SessionLocal()
+    try:
+        record_vfd_transition(db, transition)
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        _log.error("write_failed", "⚠️ VFD event write failed", device_id=transition["device_id"], state=transition["state"], error=str(exc))
+    finally:
+        db.close()
+
+
+def interval_summary(events, start: datetime, end: datetime, now: datetime) -> Dict[str, float]:
+    """Seconds spent in each state within ``[start, end)``, from intervals overlapping it."""
+    seconds: Dict[str, float] = {}
+    for event in events:
+        begin = max(event.started_at, start)
+        finish = min(event.ended_at or now, end)
+        if finish > begin:
+            seconds[event.state] = seconds.get(event.state, 0.0) + (finish - begin).total_seconds()
+    return {state: round(value, 3) for state, value in seconds.items()}
+
+
+vfd_state_tracker = VFDStateTracker()